@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Live database size and the checkout, list and report timings before and
+after archiving all but the last few months, plus the cost of reading a
+date range back out of the archive files.
+
+    python benchmarks/bench_archive.py --sales 500000 --keep-months 3
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_suite import timed  # noqa: E402
+from datagen import generate  # noqa: E402
+from jetstar_pos_db import Database  # noqa: E402
+
+
+def cases(db):
+    today = date.today()
+    month_ago = (today - timedelta(days=30)).isoformat()
+    year_ago = (today - timedelta(days=365)).isoformat()
+    products = [dict(row) for row in db.reader().execute(
+        "SELECT id, name, selling_price AS price FROM stock "
+        "WHERE type = 'product' AND quantity >= 100 LIMIT 50")]
+
+    def cart(n):
+        return [dict(products[(n * 7 + i) % len(products)], qty=1) for i in range(3)]
+
+    return [
+        ('checkout 3 lines', 50, lambda n: db.checkout(None, today.isoformat(), cart(n))),
+        ('get_sales first page', 50, lambda n: db.get_sales(limit=50)),
+        ('get_summary all time', 50, lambda n: db.get_summary()),
+        ('get_summary last 30 days', 50, lambda n: db.get_summary(month_ago, today.isoformat())),
+        ('iter_records last 30 days', 3, lambda n: sum(1 for _ in db.iter_records('sales', month_ago))),
+        ('iter_records last year', 3, lambda n: sum(1 for _ in db.iter_records('sales', year_ago))),
+    ]
+
+
+def run(db, label):
+    size = db.db_path.stat().st_size / 2 ** 20
+    rows = db.reader().execute('SELECT COUNT(*) FROM sales').fetchone()[0]
+    print(f'\n{label}: {db.db_path.name} {size:.1f} MiB, {rows} sales in the live file')
+    for name, repeat, fn in cases(db):
+        result = timed(fn, repeat)
+        print(f'  {name:<28} {result["median_ms"]:>9.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sales', type=int, default=300000)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--keep-months', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(Path(tmp) / 'bench.db')
+        print(f'Generating {args.sales} sales over a year...')
+        generate(db, args.products, args.sales, args.sales // 10, 500, days=365)
+        run(db, 'before')
+
+        start = time.perf_counter()
+        moved = db.archive(args.keep_months)
+        archived = time.perf_counter() - start
+        start = time.perf_counter()
+        with db.write_lock:
+            db.conn.execute('VACUUM')
+        print(f'\narchived {sum(sales for sales, _ in moved.values())} sales in {len(moved)} '
+              f'monthly files in {archived:.1f} s, vacuumed in {time.perf_counter() - start:.1f} s')
+        run(db, 'after')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Checkouts per second through Database.checkout at realistic cart sizes,
+with references from the allocator, also from several threads at once.
+
+    python benchmarks/bench_checkout.py --checkouts 500
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jetstar_pos_db import Database  # noqa: E402
+
+CART_SIZES = (1, 5, 20, 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--checkouts', type=int, default=300,
+                        help='checkouts timed per cart size')
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(Path(tmp) / 'bench.db')
+        with db.conn:
+            db.conn.executemany(
+                'INSERT INTO stock (name, sku, quantity, selling_price) VALUES (?, ?, ?, ?)',
+                ((f'Product {i}', f'SKU{i:06d}', 10 ** 6, round(rng.uniform(1, 50), 2))
+                 for i in range(args.products)))
+        db.stock_changed()
+        products = db.get_stock()
+
+        print(f'{"lines":>6} {"checkouts/s":>12} {"ms/checkout":>12}')
+        for size in CART_SIZES:
+            carts = [[{'id': p['id'], 'name': p['name'], 'price': p['selling_price'],
+                       'qty': rng.randint(1, 3)} for p in rng.sample(products, size)]
+                     for _ in range(args.checkouts)]
+            start = time.perf_counter()
+            for cart in carts:
+                db.checkout(None, '2025-06-01', cart)
+            elapsed = time.perf_counter() - start
+            print(f'{size:>6} {args.checkouts / elapsed:>12.1f} {elapsed / args.checkouts * 1000:>12.3f}')
+
+        count = 100000
+        start = time.perf_counter()
+        for _ in range(count):
+            db.references.next()
+        elapsed = time.perf_counter() - start
+        print(f'\nreferences: {count / elapsed:,.0f}/s from the allocator alone')
+
+        # Checkouts from several tills sharing the database in the same
+        # second; every sale must keep its own reference
+        before = db.conn.execute('SELECT COUNT(*) FROM sales').fetchone()[0]
+        cart = [{'id': products[0]['id'], 'name': products[0]['name'],
+                 'price': products[0]['selling_price'], 'qty': 1}]
+
+        def till():
+            for _ in range(args.checkouts):
+                db.checkout(None, '2025-06-01', cart)
+            db.release_reader()
+
+        tills = [threading.Thread(target=till) for _ in range(args.threads)]
+        start = time.perf_counter()
+        for thread in tills:
+            thread.start()
+        for thread in tills:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        recorded = db.conn.execute('SELECT COUNT(*) FROM sales').fetchone()[0] - before
+        print(f'{args.threads} threads: {recorded} of {args.threads * args.checkouts} checkouts '
+              f'recorded, {recorded / elapsed:.1f}/s')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Export time, file size and peak Python memory for the sales table: loading
+it through get_sales() first versus streaming it with export_table.
+
+    python benchmarks/bench_export.py --sales 1000000 --memory
+"""
+
+import argparse
+import csv
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jetstar_pos_db import Database  # noqa: E402
+from jetstar_pos_io import export_table  # noqa: E402
+
+
+def fill(db, sales):
+    rng = random.Random(9)
+    with db.conn:
+        db.conn.executemany(
+            'INSERT INTO sales (reference, date, amount, payment_method, notes) VALUES (?, ?, ?, ?, ?)',
+            ((f'SALE-{i:08d}', f'20{20 + i * 5 // sales}-{1 + i % 12:02d}-{1 + i % 28:02d}',
+              round(rng.uniform(1, 200), 2), rng.choice(['Cash', 'Card']), 'counter')
+             for i in range(sales)))
+
+
+def load_then_write(db, path):
+    # What exporting looked like with the existing getters
+    rows = db.get_sales()
+    with open(path, 'w', newline='') as fp:
+        writer = csv.DictWriter(fp, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return len(rows)
+
+
+def measure(label, fn, path, memory):
+    start = time.perf_counter()
+    rows = fn(path)
+    elapsed = time.perf_counter() - start
+    peak = 'n/a'
+    if memory:
+        # Separate run: tracemalloc slows the export down several-fold
+        tracemalloc.start()
+        fn(path)
+        peak = f'{tracemalloc.get_traced_memory()[1] / 2 ** 20:.2f}'
+        tracemalloc.stop()
+    size = path.stat().st_size
+    print(f'{label:<22} {rows:>9} {elapsed:>8.2f} s {rows / elapsed:>10.0f} '
+          f'{size / 2 ** 20:>8.1f} {peak:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sales', type=int, default=1000000)
+    parser.add_argument('--skip-baseline', action='store_true',
+                        help='leave out the get_sales() run, which holds every row in memory')
+    parser.add_argument('--memory', action='store_true',
+                        help='also report peak traced Python memory (runs each export twice)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        db = Database(tmp / 'bench.db')
+        fill(db, args.sales)
+        print(f'{"method":<22} {"rows":>9} {"time":>10} {"rows/s":>10} {"MiB":>8} {"peak MiB":>9}')
+        if not args.skip_baseline:
+            measure('get_sales + csv', lambda path: load_then_write(db, path),
+                    tmp / 'baseline.csv', args.memory)
+        for name in ('sales.csv', 'sales.jsonl', 'sales.csv.gz', 'sales.jsonl.gz'):
+            measure(f'export_table {name[6:]}',
+                    lambda path: export_table(db, 'sales', path), tmp / name, args.memory)
+        measure('export_table 1 year',
+                lambda path: export_table(db, 'sales', path, '2022-01-01', '2022-12-31'),
+                tmp / 'year.csv', args.memory)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
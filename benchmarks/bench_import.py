@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Stock import throughput and peak Python memory for growing supplier files,
+first load and re-import (all updates).
+
+    python benchmarks/bench_import.py --rows 20000 100000
+"""
+
+import argparse
+import csv
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jetstar_pos_db import Database  # noqa: E402
+from jetstar_pos_io import import_stock  # noqa: E402
+
+
+def write_catalog(path, rows, bad_every):
+    rng = random.Random(11)
+    with open(path, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(['Product Name', 'SKU', 'Category', 'Qty', 'Cost', 'Price'])
+        for i in range(rows):
+            price = 'n/a' if bad_every and i % bad_every == 0 else f'{rng.uniform(1, 90):.2f}'
+            writer.writerow([f'Product {i} {rng.choice(["Red", "Blue", "Large"])}', f'SKU{i:08d}',
+                             rng.choice(['Drinks', 'Snacks', 'Household']), rng.randrange(500),
+                             f'{rng.uniform(0.5, 40):.2f}', price])
+
+
+def timed_import(db, path, batch_size):
+    tracemalloc.start()
+    start = time.perf_counter()
+    report = import_stock(db, path, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return report, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[20000, 100000])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--bad-every', type=int, default=500,
+                        help='make every Nth row invalid (0 = none)')
+    args = parser.parse_args()
+
+    print(f'{"rows":>8} {"pass":<8} {"rows/s":>10} {"peak MiB":>9} {"new":>8} {"updated":>8} {"rejected":>8}')
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'catalog.csv'
+            write_catalog(path, rows, args.bad_every)
+            db = Database(Path(tmp) / 'bench.db')
+            for label in ('load', 'reimport'):
+                report, elapsed, peak = timed_import(db, path, args.batch_size)
+                print(f'{rows:>8} {label:<8} {rows / elapsed:>10.0f} {peak / 2 ** 20:>9.2f} '
+                      f'{report.inserted:>8} {report.updated:>8} {report.rejected:>8}')
+            db.close()
+
+
+if __name__ == '__main__':
+    main()
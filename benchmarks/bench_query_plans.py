@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Query plans and timings for the list screens, before and after migrating
+an unindexed (version 0) database.
+
+    python benchmarks/bench_query_plans.py --sales 200000
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jetstar_pos_db import Database  # noqa: E402
+
+QUERIES = [
+    ('sales by created_at', 'SELECT * FROM sales ORDER BY created_at DESC LIMIT 50', ()),
+    ('expenses by date', 'SELECT * FROM expenses ORDER BY date DESC LIMIT 50', ()),
+    ('stock by type/name', "SELECT * FROM stock WHERE type = ? ORDER BY name LIMIT 50", ('product',)),
+    ('sales total for a month', "SELECT SUM(amount), COUNT(*) FROM sales WHERE date BETWEEN ? AND ?",
+     ('2025-03-01', '2025-03-31')),
+]
+
+
+def fill(db, sales, expenses, products):
+    rng = random.Random(42)
+    with db.conn:
+        db.conn.executemany(
+            'INSERT INTO stock (name, sku, category, quantity, unit_cost, selling_price, type) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            ((f'Product {rng.randrange(10 ** 6):06d}', f'SKU{i:07d}', 'General',
+              rng.randrange(100), 1.0, 2.5, 'product' if i % 10 else 'service')
+             for i in range(products)))
+        db.conn.executemany(
+            'INSERT INTO sales (reference, date, amount, payment_method, created_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            ((f'SALE-{i:08d}', f'2025-{1 + i % 12:02d}-{1 + i % 28:02d}',
+              round(rng.uniform(1, 200), 2), 'Cash',
+              f'2025-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00')
+             for i in range(sales)))
+        db.conn.executemany(
+            'INSERT INTO expenses (date, category, description, amount) VALUES (?, ?, ?, ?)',
+            ((f'2025-{1 + i % 12:02d}-{1 + i % 28:02d}', 'Rent', f'Expense {i}',
+              round(rng.uniform(1, 500), 2)) for i in range(expenses)))
+
+
+def report(db, repeat):
+    for label, sql, params in QUERIES:
+        plan = [row[3] for row in db.conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            db.conn.execute(sql, params).fetchall()
+        elapsed = (time.perf_counter() - start) / repeat * 1000
+        print(f'  {label:<26} {elapsed:9.3f} ms  {" / ".join(plan)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sales', type=int, default=100000)
+    parser.add_argument('--expenses', type=int, default=20000)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(Path(tmp) / 'bench.db', migrate=False)
+        fill(db, args.sales, args.expenses, args.products)
+
+        print(f'schema v{db.schema_version} (no indexes)')
+        report(db, args.repeat)
+
+        start = time.perf_counter()
+        db.migrate()
+        print(f'\nmigrated to v{db.schema_version} in {time.perf_counter() - start:.2f} s')
+        db.conn.execute('ANALYZE')
+        report(db, args.repeat)
+        db.conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Time and peak memory of loading 100k sales: one dict per row as the getters
+used to build, the __slots__ records they return now, and iter_records()
+streaming them.
+
+    python benchmarks/bench_records.py --sales 100000
+
+Each way adds up the amounts, as a report would, so none of them skips
+reading the rows.
+"""
+
+import argparse
+import gc
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from datagen import generate  # noqa: E402
+from jetstar_pos_db import Database  # noqa: E402
+
+
+def dict_rows(db):
+    # _fetch_page before records: the whole result fetched, then a dict per row
+    cursor = db.reader().cursor()
+    cursor.execute('SELECT * FROM sales ORDER BY created_at DESC, id DESC')
+    rows = [dict(row) for row in cursor.fetchall()]
+    return sum(float(row['amount'] or 0) for row in rows)
+
+
+def record_list(db):
+    return sum(sale.amount or 0 for sale in db.get_sales())
+
+
+def record_stream(db):
+    return sum(sale.amount or 0 for sale in db.iter_records('sales'))
+
+
+def measure(fn, db, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn(db)
+        times.append((time.perf_counter() - start) * 1000)
+    gc.collect()
+    tracemalloc.start()
+    fn(db)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sales', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(Path(tmp) / 'bench.db')
+        generate(db, products_count=2000, sales=args.sales, expenses=0, customers=200)
+        print(f'{args.sales} sales, median of {args.repeat} runs; peak memory traced separately')
+        print(f'{"":<30} {"time":>10} {"peak":>11}')
+        for label, fn in (('dict per row (before)', dict_rows),
+                          ('records, get_sales()', record_list),
+                          ('records, iter_records()', record_stream)):
+            elapsed, peak = measure(fn, db, args.repeat)
+            print(f'{label:<30} {elapsed:>7.0f} ms {peak / 2 ** 20:>7.1f} MiB')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Shared-mode throughput and latency with N simulated registers checking out
+and browsing against one jetstar_pos_server.py, with and without batched
+commits.
+
+    python benchmarks/bench_registers.py --registers 1 2 4 6 --seconds 5
+
+The server runs as its own process, as it would in a shop; each register
+is a thread with its own RemoteDatabase connection.
+"""
+
+import argparse
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from jetstar_pos_db import Database  # noqa: E402
+from jetstar_pos_server import RemoteDatabase  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(path, port, write_batch):
+    server = subprocess.Popen([sys.executable, str(ROOT / 'jetstar_pos_server.py'), '--db', str(path),
+                               '--host', '127.0.0.1', '--port', str(port),
+                               '--write-batch', str(write_batch)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError('server did not start')
+
+
+def register(port, seconds, seed, latencies):
+    # A cashier's loop: ring up a sale, glance at recent sales, and now and
+    # then the totals
+    db = RemoteDatabase('127.0.0.1', port)
+    rng = random.Random(seed)
+    products = db.get_stock()
+    deadline = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < deadline:
+        cart = [{'id': p['id'], 'name': p['name'], 'price': p['selling_price'], 'qty': 1}
+                for p in rng.sample(products, 3)]
+        for kind, call in (('checkout', lambda: db.checkout(None, '2025-06-01', cart)),
+                           ('get_sales', lambda: db.get_sales(limit=50)),
+                           ('get_summary', lambda: db.get_summary() if n % 5 == 0 else None)):
+            start = time.perf_counter()
+            call()
+            latencies[kind].append((time.perf_counter() - start) * 1000)
+        n += 1
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--registers', type=int, nargs='+', default=[1, 2, 4, 6])
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 64],
+                        help='server --write-batch values to compare')
+    args = parser.parse_args()
+
+    print(f'{"registers":>9} {"batch":>6} {"sales/s":>9} {"checkout p50":>13} {"p95":>9} '
+          f'{"read p50":>9} {"p95":>9}')
+    for batch in args.batch:
+        for registers in args.registers:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp) / 'store.db'
+                db = Database(path)
+                db.upsert_stock({'name': f'Product {i}', 'sku': f'SKU{i:06d}', 'quantity': 10 ** 6,
+                                 'selling_price': 1.0 + i % 50} for i in range(args.products))
+                db.close()
+                port = free_port()
+                server = start_server(path, port, batch)
+                try:
+                    latencies = [{'checkout': [], 'get_sales': [], 'get_summary': []}
+                                 for _ in range(registers)]
+                    threads = [threading.Thread(target=register,
+                                                args=(port, args.seconds, n, latencies[n]))
+                               for n in range(registers)]
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                finally:
+                    server.terminate()
+                    server.wait()
+            checkouts = [t for per in latencies for t in per['checkout']]
+            reads = [t for per in latencies for t in per['get_sales']]
+            print(f'{registers:>9} {batch:>6} {len(checkouts) / args.seconds:>9.0f} '
+                  f'{statistics.median(checkouts):>10.2f} ms {percentile(checkouts, 95):>6.2f} ms '
+                  f'{statistics.median(reads):>6.2f} ms {percentile(reads, 95):>6.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Build time and memory per 1,000 report rows: the old hand-assembled
+BoxLayout + RoundedRectangle + bound lambdas, the KV SaleRow class, and
+SaleRows refilled from a WidgetPool; then the same for stat cards, old and
+StatCard.
+
+    python benchmarks/bench_rows.py --rows 1000 --refreshes 5
+
+Needs Kivy. Without a display, run with KIVY_GL_BACKEND=mock.
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from kivy.graphics import Color, RoundedRectangle  # noqa: E402
+from kivy.uix.boxlayout import BoxLayout  # noqa: E402
+from kivy.uix.gridlayout import GridLayout  # noqa: E402
+from kivy.uix.label import Label  # noqa: E402
+
+from jetstar_pos_mobile import SaleRow, StatCard, WidgetPool  # noqa: E402
+
+
+def legacy_row(sale):
+    # ReportsScreen.sale_row as it was before the KV row classes
+    item = BoxLayout(size_hint_y=None, height=60, padding=12, spacing=10)
+    with item.canvas.before:
+        Color(0.97, 0.97, 0.97, 1)
+        item.rect = RoundedRectangle(pos=item.pos, size=item.size, radius=[8])
+    item.bind(pos=lambda *args, i=item: setattr(i.rect, 'pos', i.pos))
+    item.bind(size=lambda *args, i=item: setattr(i.rect, 'size', i.size))
+    info = Label(text=f"[b]{sale['reference']}[/b]\n{sale['date']}", markup=True,
+                 color=(0.2, 0.2, 0.2, 1), font_size='13sp', halign='left', valign='middle')
+    info.bind(size=info.setter('text_size'))
+    item.add_widget(info)
+    item.add_widget(Label(text=f"[b]${sale['amount']:.2f}[/b]", markup=True,
+                          color=(0.3, 0.69, 0.31, 1), size_hint_x=0.3, font_size='16sp'))
+    return item
+
+
+def legacy_card(n):
+    # DashboardScreen.create_stat_card as it was before StatCard
+    card = BoxLayout(orientation='vertical', padding=20, spacing=8)
+    with card.canvas.before:
+        Color(1, 1, 1, 1)
+        card.rect = RoundedRectangle(pos=card.pos, size=card.size, radius=[12])
+    card.bind(pos=lambda *args: setattr(card.rect, 'pos', card.pos))
+    card.bind(size=lambda *args: setattr(card.rect, 'size', card.size))
+    card.add_widget(Label(text='Sales', color=(0.5, 0.5, 0.5, 1), font_size='16sp', size_hint_y=0.3))
+    card.value_label = Label(text=f'${n}.00', font_size='38sp', bold=True,
+                             color=(0.3, 0.69, 0.31, 1), size_hint_y=0.7)
+    card.add_widget(card.value_label)
+    return card
+
+
+def stat_card(n):
+    return StatCard(title='Sales', value=f'${n}.00', value_color=(0.3, 0.69, 0.31, 1),
+                    padding=20, spacing=8, title_font_size='16sp', value_font_size='38sp',
+                    title_size_hint=0.3)
+
+
+def kv_row(sale):
+    return SaleRow(title=f"[b]{sale['reference']}[/b]\n{sale['date']}",
+                   detail=f"[b]${sale['amount']:.2f}[/b]")
+
+
+def measure(fill, refreshes):
+    """Mean time of ``refreshes`` refills of one container, then the memory
+    one more refill allocates at its peak and leaves behind."""
+    container = GridLayout(cols=1, size_hint_y=None)
+    fill(container)
+    gc.collect()
+    start = time.perf_counter()
+    for _ in range(refreshes):
+        fill(container)
+    elapsed = (time.perf_counter() - start) / refreshes
+    # Traced separately, as tracemalloc slows everything down
+    gc.collect()
+    tracemalloc.start()
+    fill(container)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, retained, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--refreshes', type=int, default=5,
+                        help='times the list is cleared and refilled')
+    args = parser.parse_args()
+
+    sales = [{'reference': f'8D7A61D2-{n:08d}', 'date': '2025-06-01', 'amount': n % 97 + 0.5}
+             for n in range(args.rows)]
+
+    def rebuild(make_row, items=sales):
+        def fill(container):
+            container.clear_widgets()
+            for item in items:
+                container.add_widget(make_row(item))
+        return fill
+
+    pool = WidgetPool(SaleRow, limit=args.rows)
+
+    def refill_from_pool(container):
+        for child in list(container.children):
+            pool.release(child)
+        for sale in sales:
+            container.add_widget(pool.acquire(title=f"[b]{sale['reference']}[/b]\n{sale['date']}",
+                                              detail=f"[b]${sale['amount']:.2f}[/b]"))
+
+    print(f'{args.rows} rows, mean of {args.refreshes} refreshes after a first fill')
+    print(f'{"":<24} {"ms/refresh":>11} {"retained":>10} {"peak":>10}')
+    for label, fill in (('hand-built (before)', rebuild(legacy_row)),
+                        ('KV SaleRow', rebuild(kv_row)),
+                        ('KV SaleRow + pool', refill_from_pool),
+                        ('hand-built card (before)', rebuild(legacy_card, range(args.rows))),
+                        ('StatCard', rebuild(stat_card, range(args.rows)))):
+        elapsed, retained, peak = measure(fill, args.refreshes)
+        print(f'{label:<24} {elapsed * 1000:>11.1f} {retained / 2 ** 20:>7.2f} MiB '
+              f'{peak / 2 ** 20:>6.2f} MiB')
+
+
+if __name__ == '__main__':
+    main()
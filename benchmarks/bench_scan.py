@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Barcode scan to cart latency on the Sell screen for growing catalogs,
+with scans typed into the search box the way a keyboard-wedge scanner
+sends them.
+
+    python benchmarks/bench_scan.py --products 1000 20000 100000
+
+Needs Kivy. Without a display, run with KIVY_GL_BACKEND=mock.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from kivy.config import Config  # noqa: E402
+
+# Don't let Clock.tick() sleep to cap the frame rate; time only the work
+Config.set('graphics', 'maxfps', '0')
+
+from kivy.clock import Clock  # noqa: E402
+
+from jetstar_pos_db import AsyncDatabase, Database  # noqa: E402
+from jetstar_pos_mobile import FRAME_TIME, SellScreen, on_ui_thread  # noqa: E402
+
+
+def settle(frames=5):
+    for _ in range(frames):
+        time.sleep(0.005)
+        Clock.tick()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench(products, scans):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(Path(tmp) / 'bench.db')
+        db.upsert_stock({'name': f'Product {i}', 'sku': f'{6001234000000 + i}',
+                         'quantity': 100, 'selling_price': 1.0} for i in range(products))
+        db.stock_changed()
+        async_db = AsyncDatabase(db, dispatch=on_ui_thread)
+        screen = SellScreen(async_db, name='sell')
+        # The app has the catalog loaded by the time the Sell screen shows
+        while screen.products_view.rows is None:
+            settle()
+        screen.on_scan_mode(None, 'down')
+        field = screen.search_input
+
+        rng = random.Random(products)
+        frames = []
+        for _ in range(scans):
+            for char in f'{6001234000000 + rng.randrange(products)}':
+                field.insert_text(char)
+            field.dispatch('on_text_validate')
+            # The frame that redraws the cart row
+            start = time.perf_counter()
+            Clock.tick()
+            frames.append(time.perf_counter() - start)
+
+        latencies = list(screen.scan_latencies)
+        print(f'{products:>8} {len(latencies):>6} '
+              f'{statistics.median(latencies) * 1000:>9.3f} {percentile(latencies, 99) * 1000:>9.3f} '
+              f'{statistics.median(frames) * 1000:>10.3f} '
+              f'{sum(1 for t in latencies if t > FRAME_TIME):>10}')
+        async_db.stop()
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, nargs='+', default=[1000, 20000, 100000])
+    parser.add_argument('--scans', type=int, default=200,
+                        help='scans per catalog size (the latency history keeps the last 200)')
+    args = parser.parse_args()
+    print(f'{"products":>8} {"scans":>6} {"p50 ms":>9} {"p99 ms":>9} {"frame ms":>10} {"over frame":>10}')
+    for products in args.products:
+        bench(products, args.scans)
+
+
+if __name__ == '__main__':
+    main()
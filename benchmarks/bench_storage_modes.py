@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Commit latency, fsync count and checkout latency under a concurrent report
+query for the 'legacy' and 'wal' storage modes.
+
+    python benchmarks/bench_storage_modes.py --commits 500
+
+fsync/fdatasync calls are counted with a tiny LD_PRELOAD shim that is
+compiled on the fly; without a C compiler (or off Linux) they show as n/a.
+"""
+
+import argparse
+import ctypes
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jetstar_pos_db import STORAGE_MODES, Database  # noqa: E402
+
+SHIM_SOURCE = r'''
+#define _GNU_SOURCE
+#include <dlfcn.h>
+static long calls;
+int fsync(int fd) {
+    static int (*real)(int);
+    if (!real) real = dlsym(RTLD_NEXT, "fsync");
+    __sync_fetch_and_add(&calls, 1);
+    return real(fd);
+}
+int fdatasync(int fd) {
+    static int (*real)(int);
+    if (!real) real = dlsym(RTLD_NEXT, "fdatasync");
+    __sync_fetch_and_add(&calls, 1);
+    return real(fd);
+}
+long bench_sync_calls(void) { return calls; }
+'''
+
+REPORT_SQL = '''SELECT payment_method, COUNT(*), SUM(amount), AVG(LENGTH(notes || reference))
+                FROM sales GROUP BY payment_method'''
+
+
+def reexec_with_shim():
+    # Restart this script with the counting shim preloaded (once)
+    if os.environ.get('BENCH_SHIM_LOADED') or not sys.platform.startswith('linux'):
+        return
+    compiler = shutil.which('cc') or shutil.which('gcc')
+    if not compiler:
+        return
+    shim_dir = tempfile.mkdtemp(prefix='bench-shim-')
+    source = Path(shim_dir) / 'syncshim.c'
+    library = Path(shim_dir) / 'syncshim.so'
+    source.write_text(SHIM_SOURCE)
+    result = subprocess.run([compiler, '-shared', '-fPIC', '-O2', '-o', str(library),
+                             str(source), '-ldl'], capture_output=True)
+    if result.returncode != 0:
+        return
+    env = dict(os.environ, BENCH_SHIM_LOADED='1',
+               LD_PRELOAD=f"{library} {os.environ.get('LD_PRELOAD', '')}".strip())
+    os.execve(sys.executable, [sys.executable] + sys.argv, env)
+
+
+def sync_calls():
+    try:
+        return ctypes.CDLL(None).bench_sync_calls()
+    except (AttributeError, OSError):
+        return None
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def seed(db, sales, products):
+    rng = random.Random(3)
+    with db.conn:
+        db.conn.executemany(
+            'INSERT INTO stock (name, sku, quantity, selling_price) VALUES (?, ?, ?, ?)',
+            ((f'Product {i}', f'SKU{i:06d}', 10 ** 6, 2.5) for i in range(products)))
+        db.conn.executemany(
+            'INSERT INTO sales (reference, date, amount, payment_method, notes) VALUES (?, ?, ?, ?, ?)',
+            ((f'SEED-{i}', '2025-01-01', rng.uniform(1, 100), rng.choice(['Cash', 'Card']), 'seed')
+             for i in range(sales)))
+    db.stock_changed()
+
+
+def bench_mode(mode, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(Path(tmp) / 'bench.db', mode=mode)
+        seed(db, args.sales, 500)
+        products = db.get_stock()
+        cart = [{'id': p['id'], 'name': p['name'], 'price': 2.5, 'qty': 1} for p in products[:5]]
+
+        # 1. One commit per sale, as the app does it
+        before = sync_calls()
+        latencies = []
+        for n in range(args.commits):
+            start = time.perf_counter()
+            db.add_sale(f'COMMIT-{n}', '2025-06-01', None, 10.0, 'Cash')
+            latencies.append((time.perf_counter() - start) * 1000)
+        after = sync_calls()
+        syncs = 'n/a' if before is None else f'{(after - before) / args.commits:.2f}'
+        print(f'{mode:<7} add_sale   p50 {statistics.median(latencies):7.3f} ms  '
+              f'p99 {percentile(latencies, 99):7.3f} ms  fsync/commit {syncs}')
+
+        # 2. Checkouts while another thread keeps running a full-table report
+        stop = threading.Event()
+        reports = [0]
+
+        def report_loop():
+            conn = db.reader()
+            while not stop.is_set():
+                conn.execute(REPORT_SQL).fetchall()
+                reports[0] += 1
+
+        worker = threading.Thread(target=report_loop, daemon=True)
+        worker.start()
+        time.sleep(0.05)
+        latencies = []
+        for n in range(args.checkouts):
+            start = time.perf_counter()
+            db.checkout(f'CONCURRENT-{n}', '2025-06-01', cart)
+            latencies.append((time.perf_counter() - start) * 1000)
+        stop.set()
+        worker.join()
+        print(f'{mode:<7} checkout   p50 {statistics.median(latencies):7.3f} ms  '
+              f'p99 {percentile(latencies, 99):7.3f} ms  max {max(latencies):7.3f} ms  '
+              f'(reports run alongside: {reports[0]})')
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sales', type=int, default=200000,
+                        help='rows the concurrent report scans')
+    parser.add_argument('--commits', type=int, default=300)
+    parser.add_argument('--checkouts', type=int, default=100)
+    args = parser.parse_args()
+    reexec_with_shim()
+    for mode in STORAGE_MODES[::-1]:
+        bench_mode(mode, args)
+
+
+if __name__ == '__main__':
+    main()
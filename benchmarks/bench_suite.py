@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Times every Database read and write, and the Sell and Reports screen builds,
+on a generated database; writes the results as JSON for comparing releases.
+
+    python benchmarks/bench_suite.py --sales 1000000 --output before.json
+    python benchmarks/bench_suite.py --db /tmp/pos-1m.db --compare before.json
+
+--db reuses a database written by datagen.py (it is copied first, so the
+write timings don't change it). --screens needs Kivy; without a display,
+run with KIVY_GL_BACKEND=mock.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from datagen import generate  # noqa: E402
+from jetstar_pos_db import PAGE_KEYS, Database  # noqa: E402
+
+# Rows per page, as the app's lists request them
+PAGE = 50
+
+# Relative slowdown in --compare that is flagged as a regression
+REGRESSION = 0.10
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def timed(fn, repeat):
+    samples = []
+    for n in range(repeat):
+        start = time.perf_counter()
+        fn(n)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'runs': repeat, 'min_ms': min(samples), 'median_ms': statistics.median(samples),
+            'p95_ms': percentile(samples, 95), 'mean_ms': statistics.fmean(samples)}
+
+
+def middle_key(db, table, descending):
+    # Sort key of a row half way down the list, for timing a deep page
+    conn = db.reader()
+    count = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    order = ', '.join(f'{col} DESC' if descending else col for col in PAGE_KEYS[table])
+    row = conn.execute(f'SELECT * FROM {table} ORDER BY {order} LIMIT 1 OFFSET ?',
+                       (count // 2,)).fetchone()
+    return db.page_key(table, row) if row else None
+
+
+def database_cases(db):
+    today = date.today()
+    month_start = (today - timedelta(days=30)).isoformat()
+    conn = db.reader()
+    products = [dict(row) for row in conn.execute(
+        "SELECT id, name, selling_price AS price, sku FROM stock "
+        "WHERE type = 'product' AND quantity >= 100 LIMIT 200")]
+    skus = [product['sku'] for product in products] or ['none']
+    words = [row[0].split()[0] for row in conn.execute('SELECT name FROM stock LIMIT 20')] or ['x']
+    sale_ids = [row[0] for row in conn.execute('SELECT id FROM sales ORDER BY id DESC LIMIT 200')] or [0]
+    deep = {table: middle_key(db, table, table in ('sales', 'expenses'))
+            for table in ('sales', 'expenses', 'stock', 'customers')}
+    stamp = datetime.now().strftime('%Y%m%d%H%M%S')
+
+    def cart(n):
+        return [dict(products[(n * 7 + i) % len(products)], qty=1) for i in range(3)]
+
+    reads = [
+        ('get_sales first page', lambda n: db.get_sales(limit=PAGE)),
+        ('get_sales deep page', lambda n: db.get_sales(limit=PAGE, after=deep['sales'])),
+        ('get_stock first page', lambda n: db.get_stock(limit=PAGE)),
+        ('get_stock deep page', lambda n: db.get_stock(limit=PAGE, after=deep['stock'])),
+        ('get_stock all', lambda n: db.get_stock()),
+        ('get_stock page, catalog reload', lambda n: (db.catalog.invalidate(),
+                                                       db.get_stock(limit=PAGE))),
+        ('get_expenses first page', lambda n: db.get_expenses(limit=PAGE)),
+        ('get_expenses deep page', lambda n: db.get_expenses(limit=PAGE, after=deep['expenses'])),
+        ('get_customers first page', lambda n: db.get_customers(limit=PAGE)),
+        ('get_customers deep page', lambda n: db.get_customers(limit=PAGE, after=deep['customers'])),
+        ('get_sale_items', lambda n: db.get_sale_items(sale_ids[n % len(sale_ids)])),
+        ('get_product_by_sku', lambda n: db.get_product_by_sku(skus[n % len(skus)])),
+        ('search_stock', lambda n: db.search_stock(words[n % len(words)])),
+        ('count_stock', lambda n: db.count_stock()),
+        ('get_summary all time', lambda n: db.get_summary()),
+        ('get_summary last 30 days', lambda n: db.get_summary(month_start, today.isoformat())),
+        ('get_sales_breakdown by hour', lambda n: db.get_sales_breakdown('hour', month_start)),
+    ]
+    writes = [
+        ('add_sale', lambda n: db.add_sale(f'BENCH-{stamp}-{n}', today.isoformat(), None,
+                                           12.5, 'Cash')),
+        ('add_expense', lambda n: db.add_expense(today.isoformat(), 'Supplies', f'Bench {n}', 3.2)),
+    ]
+    if products:
+        writes.append(('checkout 3 lines', lambda n: db.checkout(f'BENCH-{stamp}-C{n}',
+                                                                 today.isoformat(), cart(n))))
+    return reads, writes
+
+
+def bench_screens(db, repeat):
+    """Build times of the Sell and Reports screens, and how long until
+    their first query results are on screen."""
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    from kivy.config import Config
+    # Don't let Clock.tick() sleep to cap the frame rate; time only the work
+    Config.set('graphics', 'maxfps', '0')
+    from kivy.clock import Clock
+    from jetstar_pos_db import AsyncDatabase
+    from jetstar_pos_mobile import ReportsScreen, SellScreen, on_ui_thread
+
+    async_db = AsyncDatabase(db, dispatch=on_ui_thread)
+
+    def until(ready):
+        while not ready():
+            time.sleep(0.0005)
+            Clock.tick()
+
+    def build_sell(n):
+        screen = SellScreen(async_db, name=f'sell{n}')
+        return screen, lambda: screen.products_view.rows is not None
+
+    def build_reports(n):
+        screen = ReportsScreen(async_db, name=f'reports{n}')
+        return screen, lambda: screen.summary is not None and screen.recent_sales is not None
+
+    def reload_sell(n):
+        sell.load_products()
+        until(lambda: sell.products_view.rows is not None)
+
+    results = {}
+    try:
+        for label, build in (('SellScreen', build_sell), ('ReportsScreen', build_reports)):
+            built, loaded = [], []
+            for n in range(repeat):
+                start = time.perf_counter()
+                screen, ready = build(n)
+                built.append((time.perf_counter() - start) * 1000)
+                until(ready)
+                loaded.append((time.perf_counter() - start) * 1000)
+            for suffix, samples in (('build_ui', built), ('first data', loaded)):
+                results[f'{label} {suffix}'] = {
+                    'runs': repeat, 'min_ms': min(samples), 'median_ms': statistics.median(samples),
+                    'p95_ms': percentile(samples, 95), 'mean_ms': statistics.fmean(samples)}
+        sell, ready = build_sell('reload')
+        until(ready)
+        results['SellScreen.load_products'] = timed(reload_sell, repeat)
+    finally:
+        async_db.stop()
+    return results
+
+
+def environment(db, args):
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    conn = db.reader()
+    return {
+        'revision': revision,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'schema_version': db.schema_version,
+        'rows': {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                 for table in ('stock', 'sales', 'sale_items', 'expenses', 'customers')},
+        'repeat': args.repeat,
+    }
+
+
+def compare(results, baseline):
+    print(f'\n{"vs " + str(baseline["environment"].get("revision")):<34} '
+          f'{"before":>10} {"after":>10} {"change":>8}')
+    for name, now in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        change = now['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0.0
+        flag = '  slower' if change > REGRESSION else ''
+        print(f'{name:<34} {before["median_ms"]:>7.3f} ms {now["median_ms"]:>7.3f} ms '
+              f'{change:>+7.0%}{flag}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', help='database written by datagen.py, instead of generating one')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--sales', type=int, default=100000)
+    parser.add_argument('--expenses', type=int, default=10000)
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--screens', action='store_true',
+                        help='also time the Sell and Reports screens (needs Kivy)')
+    parser.add_argument('--output', help='JSON file for the results')
+    parser.add_argument('--compare', help='results JSON from an earlier run to compare against')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as fp:
+            baseline = json.load(fp)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'bench.db'
+        if args.db:
+            shutil.copyfile(args.db, path)
+            db = Database(path)
+        else:
+            db = Database(path)
+            print(f'Generating {args.sales} sales, {args.products} products...')
+            generate(db, args.products, args.sales, args.expenses, args.customers)
+
+        env = environment(db, args)
+        print(', '.join(f'{count} {table}' for table, count in env['rows'].items()))
+        reads, writes = database_cases(db)
+        results = {}
+        print(f'\n{"case":<34} {"median":>10} {"p95":>10}')
+        for name, fn in reads + writes:
+            results[name] = timed(fn, args.repeat)
+            print(f'{name:<34} {results[name]["median_ms"]:>7.3f} ms {results[name]["p95_ms"]:>7.3f} ms')
+        if args.screens:
+            for name, result in bench_screens(db, min(args.repeat, 10)).items():
+                results[name] = result
+                print(f'{name:<34} {result["median_ms"]:>7.3f} ms {result["p95_ms"]:>7.3f} ms')
+        db.close()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            json.dump({'environment': env, 'results': results}, fp, indent=2)
+        print(f'\nResults written to {args.output}')
+    if baseline is not None:
+        compare(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
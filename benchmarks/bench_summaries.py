@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Report summary timings from raw rows versus the rollup tables, and what the
+rollup triggers add to each sale insert.
+
+    python benchmarks/bench_summaries.py --sales 500000
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jetstar_pos_db import Database  # noqa: E402
+
+RANGES = [
+    ('all time', None, None),
+    ('one year', '2024-01-01', '2024-12-31'),
+    ('one month', '2024-03-01', '2024-03-31'),
+    ('one day', '2024-03-15', '2024-03-15'),
+]
+
+
+def fill(db, sales, days):
+    rng = random.Random(5)
+    first = date(2022, 1, 1)
+
+    def day(i, count):
+        return (first + timedelta(days=i * days // count)).isoformat()
+
+    with db.conn:
+        db.conn.executemany(
+            'INSERT INTO sales (reference, date, amount, payment_method, created_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            ((f'SALE-{i:08d}', day(i, sales), round(rng.uniform(1, 200), 2),
+              rng.choice(['Cash', 'Card', 'Mobile']), f'{day(i, sales)} {i % 24:02d}:00:00')
+             for i in range(sales)))
+        db.conn.executemany(
+            'INSERT INTO expenses (date, category, description, amount) VALUES (?, ?, ?, ?)',
+            ((day(i, sales // 10), 'Rent', f'Expense {i}', round(rng.uniform(1, 500), 2))
+             for i in range(sales // 10)))
+
+
+def time_summary(db, start, end, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        db.get_summary(start, end)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def time_inserts(db, count, prefix):
+    started = time.perf_counter()
+    for n in range(count):
+        db.add_sale(f'{prefix}-{n}', '2024-06-01', None, 10.0, 'Cash')
+    return (time.perf_counter() - started) / count * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sales', type=int, default=200000)
+    parser.add_argument('--days', type=int, default=3 * 365,
+                        help='days the sales are spread over')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--inserts', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(Path(tmp) / 'bench.db')
+        fill(db, args.sales, args.days)
+        days = db.conn.execute('SELECT COUNT(*) FROM sales_daily').fetchone()[0]
+        print(f'{args.sales} sales over {days} days')
+
+        print(f'{"range":<10} {"raw rows":>12} {"rollups":>12}')
+        for label, start, end in RANGES:
+            db._has_rollups = False
+            raw = time_summary(db, start, end, args.repeat)
+            db._has_rollups = True
+            rolled = time_summary(db, start, end, args.repeat)
+            print(f'{label:<10} {raw:>9.3f} ms {rolled:>9.3f} ms')
+
+        with_triggers = time_inserts(db, args.inserts, 'TRIG')
+        with db.conn:
+            triggers = db.conn.execute("SELECT name FROM sqlite_master "
+                                       "WHERE type = 'trigger' AND tbl_name = 'sales'").fetchall()
+            for name, in triggers:
+                db.conn.execute(f'DROP TRIGGER {name}')
+        without_triggers = time_inserts(db, args.inserts, 'BARE')
+        print(f'\nadd_sale {with_triggers:.3f} ms with rollup triggers, '
+              f'{without_triggers:.3f} ms without')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Generates a realistic JETSTAR POS database for benchmarking.
+
+    python benchmarks/datagen.py /tmp/pos-1m.db --products 10000 --sales 1000000
+
+Product popularity is skewed (a few items sell most), carts hold 1-8 lines,
+sales follow shop hours over the last --days days, and the payment mix is
+mostly cash. The same --seed always produces the same database.
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jetstar_pos_db import Database  # noqa: E402
+
+CATEGORIES = ['Drinks', 'Snacks', 'Bakery', 'Dairy', 'Household', 'Personal Care',
+              'Stationery', 'Airtime', 'Fresh Produce', 'Frozen']
+WORDS = ['Classic', 'Premium', 'Family', 'Mini', 'Extra', 'Original', 'Light', 'Spicy',
+         'Sweet', 'Fresh', 'Value', 'Jumbo', 'Organic', 'Lemon', 'Mango', 'Vanilla']
+PAYMENTS = (['Cash'] * 6) + (['Mobile Money'] * 3) + ['Card']
+EXPENSE_CATEGORIES = ['Rent', 'Utilities', 'Transport', 'Wages', 'Supplies', 'Repairs']
+# Relative sales per hour from 07:00 to 21:00, busiest at lunch and after work
+HOURS = [(7, 2), (8, 4), (9, 5), (10, 6), (11, 8), (12, 10), (13, 9), (14, 6), (15, 5),
+         (16, 6), (17, 9), (18, 10), (19, 7), (20, 4)]
+
+BATCH = 20000
+
+
+def products(count, rng):
+    for i in range(count):
+        category = rng.choice(CATEGORIES)
+        name = f'{rng.choice(WORDS)} {category.split()[0]} {rng.choice(WORDS)} {i}'
+        cost = round(rng.lognormvariate(1.2, 0.8), 2)
+        yield (name, f'{6001234000000 + i}', category, rng.randrange(0, 400), cost,
+               round(cost * rng.uniform(1.15, 1.6), 2), 'service' if i % 50 == 0 else 'product')
+
+
+def generate(db, products_count=10000, sales=1000000, expenses=100000, customers=2000,
+             days=365, seed=1, progress=None):
+    rng = random.Random(seed)
+    conn = db.conn
+    with db.write_lock, conn:
+        conn.executemany('INSERT INTO stock (name, sku, category, quantity, unit_cost, selling_price, '
+                         'type) VALUES (?, ?, ?, ?, ?, ?, ?)', products(products_count, rng))
+        conn.executemany('INSERT INTO customers (name, phone, credit_limit, balance) VALUES (?, ?, ?, ?)',
+                         ((f'Customer {i:05d}', f'07{rng.randrange(10 ** 8):08d}',
+                           rng.choice([0, 0, 500, 1000]), 0) for i in range(customers)))
+    catalog = conn.execute("SELECT id, name, selling_price FROM stock WHERE type = 'product'").fetchall()
+    # Zipf-like popularity: weight 1/rank
+    weights = [1 / (rank + 1) for rank in range(len(catalog))]
+    hours, hour_weights = zip(*HOURS)
+    first_day = date.today() - timedelta(days=days)
+
+    sale_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM sales').fetchone()[0]
+    done = 0
+    while done < sales:
+        batch = min(BATCH, sales - done)
+        sale_rows, item_rows = [], []
+        for n in range(done, done + batch):
+            sale_id += 1
+            day = first_day + timedelta(days=n * days // sales)
+            stamp = f'{day} {rng.choices(hours, hour_weights)[0]:02d}:{rng.randrange(60):02d}:00'
+            lines = rng.choices(catalog, weights, k=min(8, 1 + int(rng.expovariate(0.6))))
+            amount = 0.0
+            for product in lines:
+                qty = 1 if rng.random() < 0.8 else rng.randint(2, 5)
+                total = round(product['selling_price'] * qty, 2)
+                amount += total
+                item_rows.append((sale_id, product['id'], product['name'], qty,
+                                  product['selling_price'], total))
+            customer = rng.randrange(1, customers + 1) if customers and rng.random() < 0.1 else None
+            sale_rows.append((sale_id, f'GEN-{sale_id:09d}', day.isoformat(), customer,
+                              round(amount, 2), rng.choice(PAYMENTS), stamp))
+        with db.write_lock, conn:
+            conn.executemany('INSERT INTO sales (id, reference, date, customer_id, amount, payment_method, '
+                             'created_at) VALUES (?, ?, ?, ?, ?, ?, ?)', sale_rows)
+            conn.executemany('INSERT INTO sale_items (sale_id, stock_id, name, quantity, unit_price, '
+                             'line_total) VALUES (?, ?, ?, ?, ?, ?)', item_rows)
+        done += batch
+        if progress is not None:
+            progress(done, sales)
+
+    with db.write_lock, conn:
+        conn.executemany('INSERT INTO expenses (date, category, description, vendor, amount, reference) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (((first_day + timedelta(days=n * days // max(expenses, 1))).isoformat(),
+                           category, f'{category} payment {n}', f'Vendor {rng.randrange(200)}',
+                           round(rng.lognormvariate(3.5, 1.0), 2), f'EXP-{n:07d}')
+                          for n, category in ((n, rng.choice(EXPENSE_CATEGORIES))
+                                              for n in range(expenses))))
+        # Generated history counts as already synced
+        if db.has_outbox:
+            conn.execute('DELETE FROM outbox')
+    conn.execute('ANALYZE')
+    db.stock_changed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help='database file to create (must not exist)')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--sales', type=int, default=1000000)
+    parser.add_argument('--expenses', type=int, default=100000)
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    path = Path(args.path)
+    if path.exists():
+        parser.error(f'{path} already exists')
+    start = time.perf_counter()
+    db = Database(path)
+    generate(db, args.products, args.sales, args.expenses, args.customers, args.days, args.seed,
+             progress=lambda done, total: print(f'\r{done}/{total} sales', end='', flush=True))
+    db.close()
+    print(f'\n{path} written in {time.perf_counter() - start:.1f} s '
+          f'({path.stat().st_size / 2 ** 20:.0f} MiB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ package.domain = com.jetstar
 source.dir = .
 source.include_exts = py
 source.main = jetstar_pos_mobile.py
+source.exclude_dirs = benchmarks, tests, android-github-upload
 
 version = 1.0
 requirements = python3,kivy
@@ -0,0 +1,1592 @@
+#!/usr/bin/env python3
+"""
+JETSTAR POS - SQLite data layer
+Kept free of Kivy imports so benchmarks and headless tools can use it
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import uuid
+import queue
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict, deque, namedtuple
+from collections.abc import Mapping
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import make_dataclass
+from datetime import date
+from functools import lru_cache, partial
+from pathlib import Path
+
+logger = logging.getLogger('jetstar_pos.db')
+
+
+def add_column(cursor, table, column, decl):
+    # ALTER TABLE has no IF NOT EXISTS, so check the schema first
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+
+def create_stock_fts(cursor):
+    # Builds without FTS5 exist (older Android system SQLite); search then
+    # falls back to the in-memory TrigramIndex
+    try:
+        cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS stock_fts USING fts5(
+                              name, sku, category,
+                              content='stock', content_rowid='id',
+                              tokenize="unicode61 remove_diacritics 2")''')
+    except sqlite3.OperationalError as e:
+        if 'fts5' not in str(e):
+            raise
+        return
+    # One execute() per trigger: executescript() would commit the
+    # migration's transaction part way through
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS stock_fts_ai AFTER INSERT ON stock BEGIN
+                          INSERT INTO stock_fts (rowid, name, sku, category)
+                          VALUES (new.id, new.name, new.sku, new.category);
+                      END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS stock_fts_ad AFTER DELETE ON stock BEGIN
+                          INSERT INTO stock_fts (stock_fts, rowid, name, sku, category)
+                          VALUES ('delete', old.id, old.name, old.sku, old.category);
+                      END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS stock_fts_au
+                      AFTER UPDATE OF name, sku, category ON stock BEGIN
+                          INSERT INTO stock_fts (stock_fts, rowid, name, sku, category)
+                          VALUES ('delete', old.id, old.name, old.sku, old.category);
+                          INSERT INTO stock_fts (rowid, name, sku, category)
+                          VALUES (new.id, new.name, new.sku, new.category);
+                      END''')
+    cursor.execute("INSERT INTO stock_fts (stock_fts) VALUES ('rebuild')")
+
+
+# Pre-aggregated totals per day, hour and payment method so reports read
+# O(days) rows instead of O(sales). Each rollup maps its key columns to SQL
+# over the source row ({r} is NEW or OLD); triggers keep them current.
+ROLLUPS = {
+    'sales_daily': ('sales', {
+        'date': "COALESCE({r}.date, '')",
+    }),
+    'sales_hourly': ('sales', {
+        'date': "COALESCE({r}.date, '')",
+        # created_at is CURRENT_TIMESTAMP, i.e. UTC, while date is the
+        # device's local date, so the hour is converted to match it
+        'hour': "COALESCE(CAST(strftime('%H', {r}.created_at, 'localtime') AS INTEGER), 0)",
+    }),
+    'sales_by_payment': ('sales', {
+        'date': "COALESCE({r}.date, '')",
+        'payment_method': "COALESCE({r}.payment_method, '')",
+    }),
+    'expenses_daily': ('expenses', {
+        'date': "COALESCE({r}.date, '')",
+    }),
+}
+
+# Source columns whose change moves a row between rollup buckets
+ROLLUP_COLUMNS = {
+    'sales': 'date, amount, payment_method, created_at',
+    'expenses': 'date, amount',
+}
+
+
+def _rollup_add(rollup, keys, ref, sign):
+    # INSERT OR IGNORE + UPDATE rather than UPSERT, which needs SQLite 3.24
+    values = [expr.format(r=ref) for expr in keys.values()]
+    match = ' AND '.join(f'{col} = {value}' for col, value in zip(keys, values))
+    statements = [
+        f"INSERT OR IGNORE INTO {rollup} ({', '.join(keys)}, total, count) "
+        f"VALUES ({', '.join(values)}, 0, 0);",
+        f'UPDATE {rollup} SET total = total {sign} COALESCE({ref}.amount, 0), '
+        f'count = count {sign} 1 WHERE {match};',
+    ]
+    if sign == '-':
+        statements.append(f'DELETE FROM {rollup} WHERE {match} AND count = 0;')
+    return '\n'.join(statements)
+
+
+def create_rollups(cursor):
+    for rollup, (source, keys) in ROLLUPS.items():
+        key_cols = ', '.join(f'{col} NOT NULL' for col in keys)
+        cursor.execute(f'''CREATE TABLE IF NOT EXISTS {rollup} (
+                              {key_cols},
+                              total REAL NOT NULL DEFAULT 0,
+                              count INTEGER NOT NULL DEFAULT 0,
+                              PRIMARY KEY ({', '.join(keys)})
+                          ) WITHOUT ROWID''')
+        add = _rollup_add(rollup, keys, 'new', '+')
+        remove = _rollup_add(rollup, keys, 'old', '-')
+        # One execute() per trigger: executescript() would commit the
+        # migration's transaction part way through
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS {rollup}_ai AFTER INSERT ON {source}
+                          BEGIN {add} END''')
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS {rollup}_ad AFTER DELETE ON {source}
+                          BEGIN {remove} END''')
+        cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS {rollup}_au
+                          AFTER UPDATE OF {ROLLUP_COLUMNS[source]} ON {source}
+                          BEGIN {remove} {add} END''')
+    rebuild_rollups(cursor)
+
+
+def rebuild_rollups(cursor):
+    """Recomputes every rollup table from the raw rows."""
+    for rollup, (source, keys) in ROLLUPS.items():
+        exprs = [expr.format(r=source) for expr in keys.values()]
+        cursor.execute(f'DELETE FROM {rollup}')
+        cursor.execute(f'''INSERT INTO {rollup} ({', '.join(keys)}, total, count)
+                          SELECT {', '.join(exprs)}, COALESCE(SUM(amount), 0), COUNT(*)
+                          FROM {source} GROUP BY {', '.join(exprs)}''')
+
+
+def rollup_totals(cursor, schema='main', where='', params=()):
+    """What the rows of ``schema``'s sales and expenses matching ``where``
+    add to each rollup, as {rollup: [(*keys, total, count), ...]}.
+    ``where`` may refer to the table being read as {source}."""
+    totals = {}
+    for rollup, (source, keys) in ROLLUPS.items():
+        exprs = [expr.format(r=source) for expr in keys.values()]
+        cursor.execute(f'''SELECT {', '.join(exprs)}, COALESCE(SUM(amount), 0), COUNT(*)
+                          FROM {schema}.{source}{where.format(source=source)}
+                          GROUP BY {', '.join(exprs)}''', params)
+        totals[rollup] = [tuple(row) for row in cursor.fetchall()]
+    return totals
+
+
+def add_to_rollups(cursor, totals):
+    # INSERT OR IGNORE + UPDATE rather than UPSERT, as in the triggers
+    for rollup, rows in totals.items():
+        keys = list(ROLLUPS[rollup][1])
+        cursor.executemany(f"INSERT OR IGNORE INTO main.{rollup} ({', '.join(keys)}, total, count) "
+                           f"VALUES ({', '.join('?' * len(keys))}, 0, 0)",
+                           [row[:len(keys)] for row in rows])
+        match = ' AND '.join(f'{col} = ?' for col in keys)
+        cursor.executemany(f'UPDATE main.{rollup} SET total = total + ?, count = count + ? WHERE {match}',
+                           [row[len(keys):] + row[:len(keys)] for row in rows])
+
+
+OUTBOX_INSERT = 'INSERT INTO outbox (kind, key, payload) VALUES (?, ?, ?)'
+
+SALE_ITEM_COLUMNS = ('stock_id', 'name', 'quantity', 'unit_price', 'line_total')
+
+
+def outbox_payload(row, **extra):
+    return json.dumps(dict(row, **extra), separators=(',', ':'))
+
+
+def sale_key(sale):
+    # The idempotency key head office deduplicates sales on
+    return sale['reference'] or f"id:{sale['id']}"
+
+
+# Rows per transaction when queueing pre-sync history, so the till's own
+# writes get the lock in between
+BACKFILL_ROWS = 2000
+
+
+def plan_outbox_backfill(cursor):
+    # Everything recorded before sync existed still has to be uploaded.
+    # Queueing it here would stall the first start after the upgrade, so
+    # only note the id range; SyncClient queues it in chunks off the UI
+    # thread. Later rows are queued by the write paths themselves.
+    plan = {table: [0, cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]]
+            for table in ('sales', 'expenses')}
+    cursor.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('outbox_backfill', ?)",
+                   (json.dumps(plan),))
+
+
+def json_columns(cursor, table, alias):
+    # json_object() arguments for every column, matching outbox_payload(row)
+    cursor.execute(f'PRAGMA table_info({table})')
+    return ', '.join(f"'{row[1]}', {alias}.{row[1]}" for row in cursor.fetchall())
+
+
+# Each entry upgrades the schema by one PRAGMA user_version step. Steps are
+# SQL strings or callables taking a cursor. Never edit a shipped entry -
+# append a new one instead so databases already in the field pick it up.
+MIGRATIONS = [
+    # 1: indexes for the list screens and the date-range summaries
+    [
+        'CREATE INDEX IF NOT EXISTS idx_sales_created_at ON sales (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_sales_date ON sales (date, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (date, id)',
+        'CREATE INDEX IF NOT EXISTS idx_stock_type_name ON stock (type, name, id)',
+        'CREATE INDEX IF NOT EXISTS idx_customers_name ON customers (name, id)',
+    ],
+    # 2: full-text product search over name, SKU and category
+    [create_stock_fts],
+    # 3: line items for each sale
+    [
+        '''CREATE TABLE IF NOT EXISTS sale_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sale_id INTEGER NOT NULL REFERENCES sales (id) ON DELETE CASCADE,
+            stock_id INTEGER REFERENCES stock (id),
+            name TEXT,
+            quantity INTEGER NOT NULL,
+            unit_price REAL NOT NULL,
+            line_total REAL NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_sale_items_sale ON sale_items (sale_id)',
+        'CREATE INDEX IF NOT EXISTS idx_sale_items_stock ON sale_items (stock_id)',
+    ],
+    # 4: daily/hourly/payment-method rollups for the summaries, backfilled
+    [create_rollups],
+    # 5: outbox of local writes for the sync client, plus key/value settings
+    [
+        '''CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        ) WITHOUT ROWID''',
+        plan_outbox_backfill,
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Sort key of each paginated getter; the trailing id breaks ties so a page
+# boundary never skips or repeats rows that share a name or timestamp
+PAGE_KEYS = {
+    'sales': ('created_at', 'id'),
+    'expenses': ('date', 'id'),
+    'stock': ('name', 'id'),
+    'customers': ('name', 'id'),
+}
+
+# Columns a stock import or upsert_stock may set; sku is the upsert key
+STOCK_FIELDS = ('name', 'sku', 'category', 'quantity', 'unit_cost', 'selling_price', 'type')
+
+# Tables that can be exported, with the column a date range filters on
+EXPORT_TABLES = {
+    'sales': 'date',
+    'sale_items': None,
+    'expenses': 'date',
+    'stock': None,
+    'customers': None,
+}
+
+# Tables whose closed months Database.archive() moves out to
+# archive/<db name>-YYYY-MM.db beside the database; sale_items follow
+# their sale's date
+ARCHIVE_TABLES = ('sales', 'sale_items', 'expenses')
+ARCHIVE_DIR = 'archive'
+
+# Whole months, besides the current one, that stay in the live database
+ARCHIVE_KEEP_MONTHS = 12
+
+
+def month_start(day, months_back=0):
+    """First day of the month ``months_back`` months before ``day``'s, as
+    'YYYY-MM-DD'."""
+    index = day.year * 12 + day.month - 1 - months_back
+    return f'{index // 12:04d}-{index % 12 + 1:02d}-01'
+
+
+def next_month(month):
+    year, number = map(int, month.split('-'))
+    return f'{year + number // 12:04d}-{number % 12 + 1:02d}-01'
+
+
+# bm25() column weights for stock_fts: name, sku, category
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def search_tokens(query):
+    return re.findall(r'\w+', query.lower())
+
+
+# Rows fetched from SQLite at a time when iterating records
+FETCH_ROWS = 1000
+
+
+class Record(Mapping):
+    """Base of the rows the getters return. Each column list gets its own
+    __slots__ class, so a row is a small fixed-size object rather than a
+    dict, holding the values as SQLite typed them. Columns read as
+    attributes (sale.amount) or as keys (sale['amount'], sale.get('notes')),
+    so code written for dict rows keeps working, and dict(row) gives a
+    plain dict."""
+
+    __slots__ = ()
+    _fields = ()
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def _asdict(self):
+        return {name: getattr(self, name) for name in self._fields}
+
+
+@lru_cache(maxsize=None)
+def record_type(name, fields):
+    """The Record class for one table (or query) and column tuple."""
+    return make_dataclass(name, fields, bases=(Record,), namespace={'_fields': fields},
+                          eq=False, slots=True)
+
+
+def records(cursor, name='row'):
+    """Yields an executed cursor's rows as records, FETCH_ROWS at a time.
+    The cursor's row_factory must be None, so SQLite hands back tuples."""
+    make = record_type(name, tuple(column[0] for column in cursor.description))
+    while True:
+        rows = cursor.fetchmany(FETCH_ROWS)
+        if not rows:
+            return
+        yield from (make(*row) for row in rows)
+
+
+# Published by Database after every committed write. kind is 'insert',
+# 'update' or 'reload'; row is the affected row as a record, or None for
+# 'reload', which means the whole table changed and should be re-read.
+ChangeEvent = namedtuple('ChangeEvent', ('kind', 'table', 'row'))
+
+
+def apply_to_summary(summary, event):
+    """Folds one ChangeEvent into a dict returned by Database.get_summary.
+
+    Returns False when the event can't be applied as a delta and the
+    summary has to be queried again.
+    """
+    if event.kind == 'reload':
+        return False
+    if event.kind != 'insert':
+        return True
+    row = event.row
+    if event.table == 'sales':
+        summary['total_sales'] += float(row['amount'] or 0)
+        summary['sale_count'] += 1
+        summary['avg_sale'] = summary['total_sales'] / summary['sale_count']
+    elif event.table == 'expenses':
+        summary['total_expenses'] += float(row['amount'] or 0)
+        summary['expense_count'] += 1
+    elif event.table == 'stock' and row.get('type') == 'product':
+        summary['stock_count'] += 1
+    summary['net_profit'] = summary['total_sales'] - summary['total_expenses']
+    return True
+
+
+class TrigramIndex:
+    """In-memory fallback for product search when FTS5 is not compiled in.
+
+    Every query token must be a word prefix in name, SKU or category;
+    matches are ranked by which fields they hit, weighted like SEARCH_WEIGHTS.
+    """
+
+    def __init__(self, rows):
+        self.rows = {}
+        self.fields = {}
+        self.postings = defaultdict(set)
+        for row in rows:
+            # Normalise to space-separated tokens so ' ' + token marks a word prefix
+            fields = tuple(' ' + ' '.join(search_tokens(str(row.get(col) or '')))
+                           for col in ('name', 'sku', 'category'))
+            self.rows[row['id']] = row
+            self.fields[row['id']] = fields
+            for text in fields:
+                for gram in self.trigrams(text):
+                    self.postings[gram].add(row['id'])
+
+    @staticmethod
+    def trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def search(self, query, stock_type='product', limit=50):
+        tokens = [' ' + token for token in search_tokens(query)]
+        if not tokens:
+            return []
+        grams = set()
+        for token in tokens:
+            grams |= self.trigrams(token)
+        if grams:
+            # Start from the rarest trigram to keep the candidate set small
+            rarest = min(grams, key=lambda g: len(self.postings.get(g, ())))
+            candidates = self.postings.get(rarest, ())
+        else:
+            # Single-character queries have no trigram; scan everything
+            candidates = self.rows
+        scored = []
+        for row_id in candidates:
+            row = self.rows[row_id]
+            if row.get('type') != stock_type:
+                continue
+            fields = self.fields[row_id]
+            score = 0
+            for token in tokens:
+                hits = [weight for weight, text in zip(SEARCH_WEIGHTS, fields) if token in text]
+                if not hits:
+                    break
+                score += max(hits)
+            else:
+                scored.append((-score, fields[0], row_id))
+        scored.sort()
+        return [self.rows[row_id] for _, _, row_id in scored[:limit]]
+
+
+class CatalogCache:
+    """Shared in-memory copy of the stock table.
+
+    Holds an id -> product map, a SKU index and, per stock type, the rows
+    sorted by (name, id) so keyset pages are a bisect away. ``version`` is a
+    callable returning a change stamp; the rows are reloaded only when the
+    stamp differs from the one they were loaded under. Cached rows are
+    shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, load_rows, version):
+        self.load_rows = load_rows
+        self.version = version
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._stamp = None
+        self.by_id = {}
+        self.by_sku = {}
+        self._sorted = {}
+        self._keys = {}
+
+    def _ensure(self):
+        stamp = self.version()
+        if stamp == self._stamp and self.generation:
+            self.hits += 1
+            return
+        self.misses += 1
+        by_id, by_sku, by_type = {}, {}, defaultdict(list)
+        for row in self.load_rows():
+            by_id[row['id']] = row
+            if row.get('sku'):
+                by_sku[row['sku']] = row
+            by_type[row.get('type')].append(row)
+        for rows in by_type.values():
+            rows.sort(key=lambda row: (row['name'], row['id']))
+        self.by_id, self.by_sku = by_id, by_sku
+        self._sorted = dict(by_type)
+        self._keys = {t: [(row['name'], row['id']) for row in rows] for t, rows in by_type.items()}
+        self._stamp = stamp
+        self.generation += 1
+
+    def adjust_quantities(self, deltas):
+        # Write hook for checkout: patch cached rows in place rather than
+        # reloading the whole catalog for a quantity change
+        for product_id, delta in deltas.items():
+            row = self.by_id.get(product_id)
+            if row is not None:
+                row['quantity'] = (row.get('quantity') or 0) + delta
+
+    def invalidate(self):
+        self._stamp = None
+
+    def get(self, product_id):
+        self._ensure()
+        return self.by_id.get(product_id)
+
+    def get_by_sku(self, sku):
+        self._ensure()
+        return self.by_sku.get(sku)
+
+    def products(self, stock_type='product'):
+        self._ensure()
+        return self._sorted.get(stock_type, [])
+
+    def count(self, stock_type='product'):
+        return len(self.products(stock_type))
+
+    def page(self, stock_type='product', limit=None, after=None):
+        rows = self.products(stock_type)
+        start = bisect_right(self._keys.get(stock_type, []), tuple(after)) if after else 0
+        end = None if limit is None else start + int(limit)
+        return rows[start:end]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'generation': self.generation,
+            'products': len(self.by_id),
+        }
+
+
+# 'wal': write-ahead log, tuned pragmas, one writer plus a reader connection
+# per thread. 'legacy': the original single rollback-journal connection.
+STORAGE_MODES = ('wal', 'legacy')
+
+# Sale references reserved per write to the meta table
+REFERENCE_BLOCK = 1000
+REFERENCE_DIGITS = 8
+
+
+class ReferenceAllocator:
+    """Hands out sale references like ``3F9A1C2B-00012345``: a prefix for
+    this device and a sequence number that only goes up.
+
+    The high-water mark in the meta table moves a block at a time, so only
+    one reference in ``block`` costs a write. Numbers left in a block when
+    the app stops are skipped rather than reused, so a reference head office
+    has already seen never comes back for another sale. The prefix is the
+    start of the device id unless head office sets ``reference_prefix``.
+    """
+
+    def __init__(self, db, block=REFERENCE_BLOCK):
+        self.db = db
+        self.block = block
+        self.prefix = None
+        self._next = self._limit = 0
+
+    def next(self):
+        # The write lock rather than one of our own, so a reservation made
+        # inside a write (or a batch) can't deadlock against it
+        with self.db.write_lock:
+            if self._next >= self._limit:
+                self._reserve()
+            number = self._next
+            self._next += 1
+        return f'{self.prefix}-{number:0{REFERENCE_DIGITS}d}'
+
+    def _reserve(self):
+        db = self.db
+        with db.write_lock:
+            if self.prefix is None:
+                self.prefix = db.get_meta('reference_prefix') or db.device_id()[:8].upper()
+            start = int(db.get_meta('reference_next', 1))
+            # Never behind a reference already in use, e.g. if the meta row
+            # came from an older backup than the sales
+            last = db.conn.execute('SELECT MAX(reference) FROM sales WHERE reference >= ? AND reference < ?',
+                                   (f'{self.prefix}-', f'{self.prefix}.')).fetchone()[0]
+            if last is not None:
+                start = max(start, int(last.rsplit('-', 1)[1]) + 1)
+            db.set_meta('reference_next', start + self.block)
+        self._next, self._limit = start, start + self.block
+
+
+WAL_PRAGMAS = (
+    # In WAL mode NORMAL only syncs at checkpoints, not on every commit; a
+    # power cut can lose the last commits but never corrupts the database
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -8192',  # KiB, per connection
+    'PRAGMA mmap_size = 33554432',  # kept small for 32-bit Android address space
+    'PRAGMA temp_store = MEMORY',
+)
+
+
+class Database:
+    def __init__(self, db_path=None, migrate=True, mode='wal'):
+        if mode not in STORAGE_MODES:
+            raise ValueError(f'Unknown storage mode {mode!r}, expected one of {STORAGE_MODES}')
+        if db_path is None:
+            db_dir = Path.home() / '.jetstarpos'
+            db_dir.mkdir(exist_ok=True)
+            db_path = db_dir / 'mobile.db'
+        self.db_path = Path(db_path)
+        self.mode = mode
+        # Serialises transactions on the shared writer connection
+        self.write_lock = threading.RLock()
+        self._local = threading.local()
+        self._readers = []
+        self._subscribers = []
+        self.conn = self._connect()
+        # journal_mode is stored in the file, so legacy mode has to switch it back
+        self.conn.execute(f"PRAGMA journal_mode = {'WAL' if mode == 'wal' else 'DELETE'}")
+        self._stock_gen = 0
+        self.catalog = CatalogCache(self._load_stock, self.catalog_version)
+        self.references = ReferenceAllocator(self)
+        # Unique ATTACH names, as a reader may have several archives open
+        self._attach_ids = itertools.count(1)
+        self.init_tables()
+        if migrate:
+            self.migrate()
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=5, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        if self.mode == 'wal':
+            for pragma in WAL_PRAGMAS:
+                conn.execute(pragma)
+        return conn
+
+    def reader(self):
+        """Connection for read-only queries on the calling thread.
+
+        In WAL mode every thread gets its own connection, so a long report
+        query reads a snapshot and never holds up a checkout on the writer.
+        """
+        if self.mode != 'wal':
+            return self.conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute('PRAGMA query_only = ON')
+            self._local.conn = conn
+            self._readers.append(conn)
+        return conn
+
+    def release_reader(self):
+        # For short-lived threads (exports): close this thread's reader now
+        # instead of keeping it open until close()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            self._readers.remove(conn)
+            conn.close()
+
+    def close(self):
+        for conn in self._readers:
+            conn.close()
+        self._readers.clear()
+        self._local = threading.local()
+        self.conn.close()
+
+    def subscribe(self, callback, tables=None):
+        """Calls ``callback(event)`` with a ChangeEvent after each committed
+        write, or only after writes to ``tables`` if given. Callbacks run
+        on the writing thread. Returns a function that unsubscribes."""
+        entry = (callback, frozenset(tables) if tables else None)
+        self._subscribers.append(entry)
+        return partial(self._unsubscribe, entry)
+
+    def _unsubscribe(self, entry):
+        if entry in self._subscribers:
+            self._subscribers.remove(entry)
+
+    def _publish(self, kind, table, row=None):
+        batch = getattr(self._local, 'batch', None)
+        if batch is not None:
+            # Held back until the batch commits; see batch()
+            batch.append((kind, table, row))
+            return
+        event = ChangeEvent(kind, table, row)
+        for callback, tables in list(self._subscribers):
+            if tables is None or table in tables:
+                # The write is already committed; a broken subscriber must not undo it
+                try:
+                    callback(event)
+                except Exception:
+                    logger.exception('Change subscriber %r failed on %s', callback, event)
+
+    @contextmanager
+    def _transaction(self):
+        """Writer cursor for one write: committed when the block ends, rolled
+        back if it raises. Inside batch() it is a savepoint instead, so the
+        write succeeds or fails on its own but commits with the batch."""
+        with self.write_lock:
+            cursor = self.conn.cursor()
+            if getattr(self._local, 'batch', None) is not None:
+                cursor.execute('SAVEPOINT write')
+                try:
+                    yield cursor
+                except BaseException:
+                    cursor.execute('ROLLBACK TO write')
+                    cursor.execute('RELEASE write')
+                    raise
+                cursor.execute('RELEASE write')
+                return
+            # IMMEDIATE takes the write lock up front so the transaction can't
+            # fail half way with SQLITE_BUSY
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield cursor
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    @contextmanager
+    def batch(self):
+        """Group commit: the writes made on this thread inside the block
+        share one transaction, so a burst of checkouts costs one commit.
+        Each write still succeeds or fails on its own, and change events
+        are published once the batch has committed."""
+        events = []
+        with self.write_lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            self._local.batch = events
+            try:
+                yield
+            except BaseException:
+                self.conn.rollback()
+                # Checkouts may already have patched cached quantities
+                self._stock_gen += 1
+                raise
+            else:
+                self.conn.commit()
+            finally:
+                self._local.batch = None
+        for event in events:
+            self._publish(*event)
+
+    def _fetch_row(self, cursor, table, row_id):
+        cursor.execute(f'SELECT * FROM {table} WHERE id = ?', (row_id,))
+        row = cursor.fetchone()
+        return record_type(table, tuple(row.keys()))(*row)
+
+    def _records(self, name, sql, params=()):
+        cursor = self.reader().cursor()
+        cursor.row_factory = None
+        cursor.execute(sql, params)
+        return records(cursor, name)
+
+    def _queue_sync(self, cursor, kind, key, payload):
+        # Same transaction as the write, so a committed change is always queued
+        if self.has_outbox:
+            cursor.execute(OUTBOX_INSERT, (kind, key, payload))
+
+    @property
+    def has_outbox(self):
+        if not hasattr(self, '_has_outbox'):
+            row = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'outbox'").fetchone()
+            self._has_outbox = row is not None
+        return self._has_outbox
+
+    def outbox_batch(self, after_id=0, limit=500):
+        return list(self._records('outbox', 'SELECT id, kind, key, payload FROM outbox '
+                                            'WHERE id > ? ORDER BY id LIMIT ?', (after_id, int(limit))))
+
+    def outbox_size(self):
+        return self.reader().execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def ack_outbox(self, ids):
+        """Drops outbox entries the server has confirmed."""
+        with self._transaction() as cursor:
+            cursor.executemany('DELETE FROM outbox WHERE id = ?', [(i,) for i in ids])
+
+    def backfill_outbox(self, limit=BACKFILL_ROWS):
+        """Queues the next ``limit`` ids of the sales or expenses recorded
+        before sync existed, oldest first, each chunk in its own short
+        transaction. Returns False once all of it is queued."""
+        with self._transaction() as cursor:
+            row = cursor.execute("SELECT value FROM meta WHERE key = 'outbox_backfill'").fetchone()
+            if row is None:
+                return False
+            plan = json.loads(row[0])
+            pending = [table for table, (done, last) in plan.items() if done < last]
+            if not pending:
+                cursor.execute("DELETE FROM meta WHERE key = 'outbox_backfill'")
+                return False
+            table = pending[0]
+            done, last = plan[table]
+            upto = min(done + limit, last)
+            if table == 'sales':
+                items = ', '.join(f"'{col}', {col}" for col in SALE_ITEM_COLUMNS)
+                cursor.execute(f'''INSERT INTO outbox (kind, key, payload)
+                                  SELECT 'sale', COALESCE(NULLIF(s.reference, ''), 'id:' || s.id),
+                                         json_object({json_columns(cursor, 'sales', 's')}, 'items', json((
+                                             SELECT json_group_array(json_object({items}))
+                                             FROM (SELECT * FROM sale_items
+                                                   WHERE sale_id = s.id ORDER BY id))))
+                                  FROM sales s WHERE s.id > ? AND s.id <= ? ORDER BY s.id''',
+                               (done, upto))
+            else:
+                cursor.execute(f'''INSERT INTO outbox (kind, key, payload)
+                                  SELECT 'expense', CAST(e.id AS TEXT),
+                                         json_object({json_columns(cursor, 'expenses', 'e')})
+                                  FROM expenses e WHERE e.id > ? AND e.id <= ? ORDER BY e.id''',
+                               (done, upto))
+            plan[table][0] = upto
+            cursor.execute("UPDATE meta SET value = ? WHERE key = 'outbox_backfill'",
+                           (json.dumps(plan),))
+        return True
+
+    def get_meta(self, key, default=None):
+        row = self.reader().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def set_meta(self, key, value):
+        with self._transaction() as cursor:
+            cursor.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                           (key, None if value is None else str(value)))
+
+    def device_id(self):
+        """Random id naming this install to head office, created on first use."""
+        with self.write_lock:
+            device = self.get_meta('device_id')
+            if device is None:
+                device = uuid.uuid4().hex
+                self.set_meta('device_id', device)
+        return device
+
+    def init_tables(self):
+        cursor = self.conn.cursor()
+        tables = [
+            '''CREATE TABLE IF NOT EXISTS sales (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                reference TEXT UNIQUE,
+                date DATE,
+                customer_id INTEGER,
+                amount REAL,
+                payment_method TEXT,
+                status TEXT DEFAULT 'completed',
+                notes TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )''',
+            '''CREATE TABLE IF NOT EXISTS stock (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                sku TEXT UNIQUE,
+                category TEXT,
+                quantity INTEGER DEFAULT 0,
+                unit_cost REAL,
+                selling_price REAL,
+                type TEXT DEFAULT 'product',
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )''',
+            '''CREATE TABLE IF NOT EXISTS customers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                phone TEXT,
+                email TEXT,
+                address TEXT,
+                credit_limit REAL DEFAULT 0,
+                balance REAL DEFAULT 0
+            )''',
+            '''CREATE TABLE IF NOT EXISTS suppliers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                contact_person TEXT,
+                phone TEXT,
+                email TEXT,
+                address TEXT,
+                balance REAL DEFAULT 0
+            )''',
+            '''CREATE TABLE IF NOT EXISTS expenses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date DATE,
+                category TEXT,
+                description TEXT,
+                vendor TEXT,
+                amount REAL,
+                reference TEXT
+            )'''
+        ]
+        for table_sql in tables:
+            cursor.execute(table_sql)
+        self.conn.commit()
+
+    @property
+    def schema_version(self):
+        return int(self.conn.execute('PRAGMA user_version').fetchone()[0])
+
+    def migrate(self, target=SCHEMA_VERSION):
+        current = self.schema_version
+        for version in range(current + 1, target + 1):
+            with self.write_lock:
+                cursor = self.conn.cursor()
+                # One transaction per step: a failed upgrade leaves the previous
+                # version intact and is retried on the next start
+                cursor.execute('BEGIN')
+                try:
+                    for step in MIGRATIONS[version - 1]:
+                        if callable(step):
+                            step(cursor)
+                        else:
+                            cursor.execute(step)
+                    cursor.execute(f'PRAGMA user_version = {version}')
+                except Exception:
+                    self.conn.rollback()
+                    raise
+                self.conn.commit()
+        # Feature checks cached against the old schema
+        self.__dict__.pop('_has_fts', None)
+        self.__dict__.pop('_has_rollups', None)
+        self.__dict__.pop('_has_outbox', None)
+        return self.schema_version
+
+    def _fetch_page(self, table, order_cols, descending=False, where=None, params=(),
+                    limit=None, after=None):
+        # Keyset pagination: continue strictly after the last row's sort key
+        # instead of using OFFSET, so every page costs the same index seek
+        clauses = [where] if where else []
+        params = list(params)
+        if after is not None:
+            cols = ', '.join(order_cols)
+            marks = ', '.join('?' * len(order_cols))
+            clauses.append(f"({cols}) {'<' if descending else '>'} ({marks})")
+            params.extend(after)
+        sql = f'SELECT * FROM {table}'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        direction = ' DESC' if descending else ''
+        sql += ' ORDER BY ' + ', '.join(col + direction for col in order_cols)
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        return list(self._records(table, sql, params))
+
+    @staticmethod
+    def page_key(table, row):
+        """Cursor for the page that follows ``row`` when passed as ``after``."""
+        return tuple(row[col] for col in PAGE_KEYS[table])
+
+    def get_sales(self, limit=None, after=None):
+        return self._fetch_page('sales', PAGE_KEYS['sales'], descending=True,
+                                limit=limit, after=after)
+
+    def add_sale(self, reference, date, customer_id, amount, payment_method, notes=''):
+        if reference is None:
+            reference = self.references.next()
+        with self._transaction() as cursor:
+            cursor.execute('''INSERT INTO sales (reference, date, customer_id, amount, payment_method, notes)
+                             VALUES (?, ?, ?, ?, ?, ?)''',
+                          (reference, date, customer_id, amount, payment_method, notes))
+            sale = self._fetch_row(cursor, 'sales', cursor.lastrowid)
+            self._queue_sync(cursor, 'sale', sale_key(sale), outbox_payload(sale, items=[]))
+        self._publish('insert', 'sales', sale)
+        return sale['id']
+
+    def add_expense(self, date, category, description, amount, vendor='', reference=''):
+        with self._transaction() as cursor:
+            cursor.execute('''INSERT INTO expenses (date, category, description, vendor, amount, reference)
+                             VALUES (?, ?, ?, ?, ?, ?)''',
+                          (date, category, description, vendor, amount, reference))
+            expense = self._fetch_row(cursor, 'expenses', cursor.lastrowid)
+            self._queue_sync(cursor, 'expense', str(expense['id']), outbox_payload(expense))
+        self._publish('insert', 'expenses', expense)
+        return expense['id']
+
+    def _load_stock(self):
+        # Dicts rather than records: the catalog patches quantities in place
+        cursor = self.reader().cursor()
+        cursor.execute('SELECT * FROM stock')
+        return (dict(row) for row in cursor)
+
+    def catalog_version(self):
+        # data_version moves when another connection or process commits;
+        # writes made through this Database bump _stock_gen via stock_changed()
+        return (self.conn.execute('PRAGMA data_version').fetchone()[0], self._stock_gen)
+
+    def upsert_stock(self, products):
+        """Inserts or updates products by SKU in one transaction and returns
+        (inserted, updated). Each product is a dict with name and sku plus
+        any of category, quantity, unit_cost, selling_price and type; fields
+        that are missing or None keep their current value on update. Call
+        stock_changed() once the whole load is done."""
+        params = [{field: product.get(field) for field in STOCK_FIELDS} for product in products]
+        if not params:
+            return 0, 0
+        with self._transaction() as cursor:
+            # UPDATE first, then INSERT OR IGNORE, so each row is written
+            # once and existing ids (referenced by sale_items) are kept
+            cursor.executemany('''UPDATE stock SET name = :name,
+                                     category = COALESCE(:category, category),
+                                     quantity = COALESCE(:quantity, quantity),
+                                     unit_cost = COALESCE(:unit_cost, unit_cost),
+                                     selling_price = COALESCE(:selling_price, selling_price),
+                                     type = COALESCE(:type, type)
+                                 WHERE sku = :sku''', params)
+            # rowcount sums executemany's direct changes; trigger writes aren't counted
+            updated = cursor.rowcount
+            cursor.executemany('''INSERT OR IGNORE INTO stock
+                                     (name, sku, category, quantity, unit_cost, selling_price, type)
+                                 VALUES (:name, :sku, :category, COALESCE(:quantity, 0),
+                                         COALESCE(:unit_cost, 0), COALESCE(:selling_price, 0),
+                                         COALESCE(:type, 'product'))''', params)
+            inserted = cursor.rowcount
+        return inserted, updated
+
+    def stock_changed(self):
+        """Call after writing to the stock table behind this Database's back
+        (bulk loads, imports); reloads the catalog and tells subscribers."""
+        self._stock_gen += 1
+        self._publish('reload', 'stock')
+
+    def checkout(self, reference, date, items, customer_id=None, payment_method='Cash', notes=''):
+        """Records a sale, its line items and the stock it used in one
+        transaction. ``items`` are cart lines with id, name, price and qty.
+        A ``reference`` of None takes the next one from ``references``.
+        Raises ValueError, writing nothing, if a product line asks for more
+        than is in stock; nothing is written if any statement fails."""
+        if reference is None:
+            reference = self.references.next()
+        lines = [(int(item['id']), str(item['name']), int(item['qty']), float(item['price']),
+                  round(float(item['price']) * int(item['qty']), 2)) for item in items]
+        amount = round(sum(line[4] for line in lines), 2)
+        with self._transaction() as cursor:
+            cursor.execute('''INSERT INTO sales (reference, date, customer_id, amount, payment_method, notes)
+                             VALUES (?, ?, ?, ?, ?, ?)''',
+                           (reference, date, customer_id, amount, payment_method, notes))
+            sale_id = cursor.lastrowid
+            cursor.executemany('''INSERT INTO sale_items (sale_id, stock_id, name, quantity, unit_price, line_total)
+                                 VALUES (?, ?, ?, ?, ?, ?)''',
+                               [(sale_id,) + line for line in lines])
+            cursor.execute('''UPDATE stock SET quantity = quantity - (
+                                 SELECT SUM(quantity) FROM sale_items
+                                 WHERE sale_id = :sale_id AND stock_id = stock.id)
+                             WHERE id IN (SELECT stock_id FROM sale_items WHERE sale_id = :sale_id)''',
+                           {'sale_id': sale_id})
+            # Services have no stock to run out of
+            short = [row[0] for row in cursor.execute(
+                '''SELECT name FROM stock WHERE type = 'product' AND quantity < 0
+                   AND id IN (SELECT stock_id FROM sale_items WHERE sale_id = ?)''', (sale_id,))]
+            if short:
+                raise ValueError(f"Not enough stock for {', '.join(short)}")
+            sale = self._fetch_row(cursor, 'sales', sale_id)
+            items = [dict(zip(SALE_ITEM_COLUMNS, line)) for line in lines]
+            self._queue_sync(cursor, 'sale', sale_key(sale), outbox_payload(sale, items=items))
+        deltas = defaultdict(int)
+        for stock_id, _, qty, _, _ in lines:
+            deltas[stock_id] -= qty
+        self.catalog.adjust_quantities(deltas)
+        self._publish('insert', 'sales', sale)
+        for stock_id in deltas:
+            product = self.catalog.by_id.get(stock_id)
+            if product is not None:
+                self._publish('update', 'stock', product)
+        return sale_id
+
+    def export_cursor(self, table, start_date=None, end_date=None, row_factory=sqlite3.Row):
+        """Executed cursor over ``table`` in id order, limited to the date
+        range where the table has a date. Read it with fetchmany() so the
+        rows never have to be in memory together."""
+        if table not in EXPORT_TABLES:
+            raise ValueError(f'Cannot export {table!r}, expected one of {sorted(EXPORT_TABLES)}')
+        where, params = ('', [])
+        if EXPORT_TABLES[table]:
+            where, params = self._date_filter(start_date, end_date, EXPORT_TABLES[table])
+        cursor = self.reader().cursor()
+        cursor.row_factory = row_factory
+        cursor.execute(f'SELECT * FROM {table}{where} ORDER BY id', params)
+        return cursor
+
+    def export_cursors(self, table, start_date=None, end_date=None, row_factory=sqlite3.Row):
+        """export_cursor(), preceded by a cursor over each archive file the
+        date range reaches into, oldest month first. Each archive is
+        attached to this thread's reader only while its cursor is read, and
+        detached when the next cursor is asked for. All the cursors have
+        the live table's columns."""
+        if table in ARCHIVE_TABLES:
+            dated = EXPORT_TABLES[table] is not None
+            for path in self.archive_files(*((start_date, end_date) if dated else ())):
+                yield from self._archive_cursor(path, table, start_date, end_date, row_factory)
+        yield self.export_cursor(table, start_date, end_date, row_factory)
+
+    def _archive_cursor(self, path, table, start_date, end_date, row_factory):
+        conn = self.reader()
+        alias = f'archive{next(self._attach_ids)}'
+        conn.execute(f'ATTACH DATABASE ? AS {alias}', (str(path),))
+        try:
+            # Files written before a column was added to the live table lack it
+            have = {row[1] for row in conn.execute(f'PRAGMA {alias}.table_info({table})')}
+            columns = [row[1] for row in conn.execute(f'PRAGMA main.table_info({table})')]
+            select = ', '.join(col if col in have else f'NULL AS {col}' for col in columns)
+            where, params = ('', [])
+            if EXPORT_TABLES[table]:
+                where, params = self._date_filter(start_date, end_date, EXPORT_TABLES[table])
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory
+            try:
+                cursor.execute(f'SELECT {select} FROM {alias}.{table}{where} ORDER BY id', params)
+                yield cursor
+            finally:
+                # DETACH fails while a statement on the file is unfinished
+                cursor.close()
+        finally:
+            conn.execute(f'DETACH DATABASE {alias}')
+
+    def iter_records(self, table, start_date=None, end_date=None):
+        """Yields the rows export_cursors() select as records, for walking
+        a whole table or year without holding it in memory. Iterate it on
+        the thread that called it; the cursors are closed when it finishes
+        or is discarded."""
+        for cursor in self.export_cursors(table, start_date, end_date, row_factory=None):
+            try:
+                yield from records(cursor, table)
+            finally:
+                cursor.close()
+
+    def get_sale_items(self, sale_id):
+        return list(self._records('sale_items', 'SELECT * FROM sale_items WHERE sale_id = ? '
+                                                'ORDER BY id', (sale_id,)))
+
+    def get_stock(self, stock_type='product', limit=None, after=None):
+        # Served from the catalog cache; same ordering and paging as the SQL getters
+        return self.catalog.page(stock_type, limit=limit, after=after)
+
+    def get_product_by_sku(self, sku):
+        return self.catalog.get_by_sku(str(sku).strip())
+
+    def get_customers(self, limit=None, after=None):
+        return self._fetch_page('customers', PAGE_KEYS['customers'],
+                                limit=limit, after=after)
+
+    def get_expenses(self, limit=None, after=None):
+        return self._fetch_page('expenses', PAGE_KEYS['expenses'], descending=True,
+                                limit=limit, after=after)
+
+    @property
+    def has_fts(self):
+        if not hasattr(self, '_has_fts'):
+            row = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stock_fts'").fetchone()
+            self._has_fts = row is not None
+        return self._has_fts
+
+    def search_stock(self, query, stock_type='product', limit=50):
+        tokens = search_tokens(query)
+        if not tokens:
+            return []
+        if not self.has_fts:
+            self.catalog.products(stock_type)
+            if getattr(self, '_trigram_generation', None) != self.catalog.generation:
+                self._trigram_index = TrigramIndex(self.catalog.by_id.values())
+                self._trigram_generation = self.catalog.generation
+            return self._trigram_index.search(query, stock_type, limit)
+        # Every token is a prefix query and all of them must match
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        weights = ', '.join(str(w) for w in SEARCH_WEIGHTS)
+        cursor = self.reader().cursor()
+        cursor.execute(f'''SELECT stock.id FROM stock_fts
+                          JOIN stock ON stock.id = stock_fts.rowid
+                          WHERE stock_fts MATCH ? AND stock.type = ?
+                          ORDER BY bm25(stock_fts, {weights}), stock.name
+                          LIMIT ?''', (match, stock_type, int(limit)))
+        ids = [row[0] for row in cursor.fetchall()]
+        self.catalog.products(stock_type)
+        return [row for row in map(self.catalog.by_id.get, ids) if row is not None]
+
+    @property
+    def has_rollups(self):
+        if not hasattr(self, '_has_rollups'):
+            row = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sales_daily'").fetchone()
+            self._has_rollups = row is not None
+        return self._has_rollups
+
+    def rebuild_rollups(self):
+        """Recomputes the rollup tables from the raw sales and expenses,
+        archived ones included."""
+        archived = []
+        for path in self.archive_files():
+            with self._attached(path) as alias:
+                archived.append(rollup_totals(self.conn.cursor(), alias))
+        with self._transaction() as cursor:
+            rebuild_rollups(cursor)
+            for totals in archived:
+                add_to_rollups(cursor, totals)
+
+    def archive_files(self, start_date=None, end_date=None):
+        """Archive files, oldest first, for the months that overlap
+        start_date..end_date (either may be None for open-ended)."""
+        stem = self.db_path.stem
+        first = str(start_date)[:7] if start_date else ''
+        last = str(end_date)[:7] if end_date else '9999-99'
+        return [path for path in sorted((self.db_path.parent / ARCHIVE_DIR).glob(f'{stem}-????-??.db'))
+                if first <= path.stem[len(stem) + 1:] <= last]
+
+    @contextmanager
+    def _attached(self, path):
+        # On the writer; ATTACH and DETACH can't run inside a transaction
+        alias = f'archive{next(self._attach_ids)}'
+        with self.write_lock:
+            self.conn.execute(f'ATTACH DATABASE ? AS {alias}', (str(path),))
+            try:
+                yield alias
+            finally:
+                self.conn.execute(f'DETACH DATABASE {alias}')
+
+    def archive(self, keep_months=ARCHIVE_KEEP_MONTHS, today=None, progress=None):
+        """Moves sales (with their items) and expenses dated before the
+        last ``keep_months`` whole months into one SQLite file per month
+        under archive/ beside the database, and returns {month: (sales,
+        expenses)} moved. Each month is copied and committed to its file
+        first, then deleted from the live database in a second transaction,
+        so the till keeps working in between and a run killed at any point
+        loses no rows; ``progress(month, sales, expenses)`` is called after
+        each.
+
+        The rollups keep the archived totals, so summaries and breakdowns
+        read no archive; export_cursors() and iter_records() attach the
+        files a date range reaches into. Running it again moves only what
+        has been dated into those months since, and finishes a month an
+        interrupted run left in both files without duplicating rows.
+        """
+        if not self.has_rollups:
+            raise ValueError('Archiving needs the rollup tables; migrate the database first')
+        # History not yet queued for sync must be queued before it moves out
+        while self.backfill_outbox():
+            pass
+        cutoff = month_start(today or date.today(), keep_months)
+        conn = self.reader()
+        months = sorted({row[0][:7] for table in ('sales', 'expenses') for row in conn.execute(
+            f'SELECT DISTINCT substr(date, 1, 7) FROM {table} WHERE date < ?', (cutoff,))
+            if re.fullmatch(r'\d{4}-\d{2}', row[0] or '')})
+        moved = {}
+        for month in months:
+            moved[month] = self._archive_month(month)
+            if progress is not None:
+                progress(month, *moved[month])
+        if moved:
+            for table in ('sales', 'expenses'):
+                self._publish('reload', table)
+        return moved
+
+    def _archive_month(self, month):
+        path = self.db_path.parent / ARCHIVE_DIR / f'{self.db_path.stem}-{month}.db'
+        path.parent.mkdir(exist_ok=True)
+        where, params = ' WHERE date >= ? AND date < ?', (f'{month}-01', next_month(month))
+        in_month = f'SELECT id FROM main.sales{where}'
+        with self._attached(path) as alias:
+            self._prepare_archive(alias)
+            # A transaction over two files is only atomic per file in WAL
+            # mode, so the copy is committed before anything is deleted.
+            # A run killed in between leaves the rows in both files, and
+            # the next run's OR IGNORE copy and delete finish the month.
+            with self._transaction() as cursor:
+                for table, source in (('sales', f'SELECT * FROM main.sales{where}'),
+                                      ('sale_items', f'SELECT * FROM main.sale_items '
+                                                     f'WHERE sale_id IN ({in_month})'),
+                                      ('expenses', f'SELECT * FROM main.expenses{where}')):
+                    columns = ', '.join(row[1] for row in cursor.execute(f'PRAGMA main.table_info({table})'))
+                    cursor.execute(f'INSERT OR IGNORE INTO {alias}.{table} ({columns}) '
+                                   f'SELECT {columns} FROM ({source})', params)
+            # Only rows the archive holds, in case the month got a new row
+            # since the copy
+            copied = where + f' AND id IN (SELECT id FROM {alias}.{{source}})'
+            with self._transaction() as cursor:
+                moved = rollup_totals(cursor, 'main', copied, params)
+                in_copy = f"SELECT id FROM main.sales{copied.format(source='sales')}"
+                cursor.execute(f'DELETE FROM main.sale_items WHERE sale_id IN ({in_copy})', params)
+                sales = cursor.execute(f"DELETE FROM main.sales{copied.format(source='sales')}",
+                                       params).rowcount
+                expenses = cursor.execute(f"DELETE FROM main.expenses{copied.format(source='expenses')}",
+                                          params).rowcount
+                # The deletes took the rows out of the rollups; reports still need them
+                add_to_rollups(cursor, moved)
+        return sales, expenses
+
+    def _prepare_archive(self, alias):
+        # The live tables and their indexes, plus any column added to the
+        # live tables since the file was written
+        conn = self.conn
+        names = ', '.join('?' * len(ARCHIVE_TABLES))
+        for (sql,) in conn.execute(f"""SELECT sql FROM main.sqlite_master
+                                      WHERE tbl_name IN ({names}) AND type IN ('table', 'index')
+                                      AND sql IS NOT NULL""", ARCHIVE_TABLES).fetchall():
+            conn.execute(re.sub(r'^CREATE (UNIQUE )?(TABLE|INDEX) ',
+                                rf'CREATE \1\2 IF NOT EXISTS {alias}.', sql, count=1))
+        for table in ARCHIVE_TABLES:
+            have = {row[1] for row in conn.execute(f'PRAGMA {alias}.table_info({table})')}
+            for row in conn.execute(f'PRAGMA main.table_info({table})').fetchall():
+                if row[1] not in have:
+                    conn.execute(f'ALTER TABLE {alias}.{table} ADD COLUMN {row[1]} {row[2]}')
+        conn.commit()
+
+    def _date_filter(self, start_date=None, end_date=None, column='date'):
+        # Dates are stored as 'YYYY-MM-DD' strings, so plain comparisons work
+        clauses, params = [], []
+        if start_date:
+            clauses.append(f'{column} >= ?')
+            params.append(str(start_date))
+        if end_date:
+            clauses.append(f'{column} <= ?')
+            params.append(str(end_date))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+        return where, params
+
+    def _totals(self, table, start_date=None, end_date=None):
+        # One row per day from the rollup when it exists, else every raw row
+        where, params = self._date_filter(start_date, end_date)
+        cursor = self.reader().cursor()
+        if self.has_rollups:
+            cursor.execute(f'''SELECT COALESCE(SUM(total), 0), COALESCE(SUM(count), 0)
+                              FROM {table}_daily{where}''', params)
+        else:
+            cursor.execute(f'''SELECT COALESCE(SUM(amount), 0), COUNT(*)
+                              FROM {table}{where}''', params)
+        total, count = cursor.fetchone()
+        return float(total), int(count)
+
+    def get_sales_summary(self, start_date=None, end_date=None):
+        total, count = self._totals('sales', start_date, end_date)
+        return {'total': total, 'count': count, 'average': total / count if count else 0.0}
+
+    def get_expenses_summary(self, start_date=None, end_date=None):
+        total, count = self._totals('expenses', start_date, end_date)
+        return {'total': total, 'count': count}
+
+    def get_sales_breakdown(self, by='date', start_date=None, end_date=None):
+        """Sales totals grouped by 'date', 'hour' (local time) or
+        'payment_method', read from the rollup tables."""
+        rollup = {'date': 'sales_daily', 'hour': 'sales_hourly',
+                  'payment_method': 'sales_by_payment'}[by]
+        where, params = self._date_filter(start_date, end_date)
+        return list(self._records(rollup, f'''SELECT {by}, SUM(total) AS total, SUM(count) AS count
+                                             FROM {rollup}{where} GROUP BY {by} ORDER BY {by}''',
+                                  params))
+
+    def count_stock(self, stock_type='product'):
+        return self.catalog.count(stock_type)
+
+    def get_summary(self, start_date=None, end_date=None):
+        sales = self.get_sales_summary(start_date, end_date)
+        expenses = self.get_expenses_summary(start_date, end_date)
+        return {
+            'total_sales': sales['total'],
+            'sale_count': sales['count'],
+            'avg_sale': sales['average'],
+            'total_expenses': expenses['total'],
+            'expense_count': expenses['count'],
+            'net_profit': sales['total'] - expenses['total'],
+            'stock_count': self.count_stock()
+        }
+
+
+class AsyncDatabase:
+    """Runs Database calls on a background worker thread.
+
+    Any Database method can be called on this facade with the same
+    arguments plus optional ``callback``/``errback`` keywords; it returns a
+    ``concurrent.futures.Future`` straight away. Callbacks are handed to
+    ``dispatch`` so a UI can run them on its own thread (the Kivy app
+    passes a Clock.schedule_once wrapper). Calls run one at a time in
+    submission order, so a write queued before a read is visible to it.
+    """
+
+    def __init__(self, db, dispatch=None):
+        self.sync = db
+        self.dispatch = dispatch or (lambda fn: fn())
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='db-worker', daemon=True)
+        self._thread.start()
+
+    page_key = staticmethod(Database.page_key)
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+        return partial(self.submit, attr)
+
+    def subscribe(self, callback, tables=None):
+        # Events are raised on the worker thread; run the callback via dispatch
+        return self.sync.subscribe(lambda event: self.dispatch(partial(callback, event)), tables)
+
+    def submit(self, fn, *args, callback=None, errback=None, **kwargs):
+        future = Future()
+        if callback is not None or errback is not None:
+            future.add_done_callback(partial(self._deliver, callback, errback))
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def _deliver(self, callback, errback, future):
+        error = future.exception()
+        if error is None:
+            if callback is not None:
+                self.dispatch(partial(callback, future.result()))
+        elif errback is not None:
+            self.dispatch(partial(errback, error))
+        else:
+            logger.error('Background database call failed', exc_info=error)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            future, fn, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def stop(self, timeout=None):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+# Latencies kept per name for the percentiles in LatencyStats.snapshot()
+TRACE_SAMPLES = 500
+
+
+class LatencyStats:
+    """Call counts, latencies and row counts by name. Safe to record into
+    from any thread."""
+
+    def __init__(self, samples=TRACE_SAMPLES):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def record(self, name, seconds, rows=None):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = self._entries[name] = {'count': 0, 'total': 0.0, 'max': 0.0, 'rows': None,
+                                               'recent': deque(maxlen=self.samples)}
+            entry['count'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['recent'].append(seconds)
+            if rows is not None:
+                entry['rows'] = (entry['rows'] or 0) + rows
+
+    def snapshot(self):
+        """{name: totals in ms}, the most total time first. p95 is over the
+        last ``samples`` calls; the rest are since start."""
+        with self._lock:
+            entries = [(name, dict(entry, recent=sorted(entry['recent'])))
+                       for name, entry in self._entries.items()]
+        entries.sort(key=lambda item: item[1]['total'], reverse=True)
+        snapshot = {}
+        for name, entry in entries:
+            recent = entry['recent']
+            snapshot[name] = {
+                'count': entry['count'],
+                'total_ms': round(entry['total'] * 1000, 3),
+                'mean_ms': round(entry['total'] / entry['count'] * 1000, 3),
+                'p95_ms': round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 3),
+                'max_ms': round(entry['max'] * 1000, 3),
+                'rows': entry['rows'],
+            }
+        return snapshot
+
+
+class TracingDatabase:
+    """Wraps a Database and records the latency and row count of each
+    public method call in ``stats``. Everything else passes straight
+    through, so it can stand in for the Database, e.g. behind AsyncDatabase."""
+
+    UNTRACED = frozenset({'subscribe', 'reader', 'release_reader', 'close', 'page_key'})
+
+    def __init__(self, db, stats=None):
+        self.db = db
+        self.stats = stats if stats is not None else LatencyStats()
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if name.startswith('_') or name in self.UNTRACED or not callable(attr):
+            return attr
+        return partial(self._call, name, attr)
+
+    def _call(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.stats.record(name, time.perf_counter() - start,
+                          len(result) if isinstance(result, list) else None)
+        return result
+
+
+def rebuild_rollups_command(db, args):
+    start = time.perf_counter()
+    db.rebuild_rollups()
+    for rollup in ROLLUPS:
+        count = db.conn.execute(f'SELECT COUNT(*) FROM {rollup}').fetchone()[0]
+        print(f'{rollup:<18} {count:>8} rows')
+    print(f'rebuilt in {time.perf_counter() - start:.2f} s')
+
+
+def import_stock_command(db, args):
+    # Imported lazily: the importer is only needed by this command
+    from jetstar_pos_io import import_stock
+
+    def show_progress(report):
+        print(f'\r{report.read} read, {report.inserted} new, {report.updated} updated, '
+              f'{report.rejected} rejected', end='', flush=True)
+
+    start = time.perf_counter()
+    report = import_stock(db, args.file, batch_size=args.batch_size, progress=show_progress)
+    show_progress(report)
+    print(f'\nimported in {time.perf_counter() - start:.2f} s')
+    for line, reason in report.errors:
+        print(f'  line {line}: {reason}')
+    if report.rejected > len(report.errors):
+        print(f'  ... and {report.rejected - len(report.errors)} more rejected rows')
+
+
+def export_command(db, args):
+    from jetstar_pos_io import export_table
+
+    start = time.perf_counter()
+    rows = export_table(db, args.table, args.file, start_date=args.start, end_date=args.end,
+                        progress=lambda rows: print(f'\r{rows} rows', end='', flush=True))
+    print(f'\r{rows} rows written to {args.file} in {time.perf_counter() - start:.2f} s')
+
+
+def archive_command(db, args):
+    start = time.perf_counter()
+    moved = db.archive(args.keep_months, progress=lambda month, sales, expenses: print(
+        f'{month}  {sales:>9} sales {expenses:>9} expenses'))
+    if not moved:
+        print(f'nothing dated before the last {args.keep_months} months')
+    if args.vacuum:
+        # Hands the freed pages back to the filesystem; needs the app closed
+        with db.write_lock:
+            db.conn.execute('VACUUM')
+    print(f'archived in {time.perf_counter() - start:.2f} s, {db.db_path.name} is now '
+          f'{db.db_path.stat().st_size / 2 ** 20:.1f} MiB')
+
+
+def sync_command(db, args):
+    from jetstar_pos_sync import SyncClient, SyncError
+
+    client = SyncClient(db, args.server, max_bytes=args.max_bytes)
+    try:
+        print(client.sync())
+    except SyncError as e:
+        raise SystemExit(f'sync failed: {e}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='JETSTAR POS database maintenance')
+    parser.add_argument('--db', help='database file (default: ~/.jetstarpos/mobile.db)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('rebuild-rollups',
+                                  help='recompute the report rollup tables from the raw rows')
+    command.set_defaults(run=rebuild_rollups_command)
+    command = commands.add_parser('import-stock',
+                                  help='add or update products from a .csv, .jsonl or .json file')
+    command.add_argument('file')
+    command.add_argument('--batch-size', type=int, default=1000,
+                         help='products written per transaction')
+    command.set_defaults(run=import_stock_command)
+    command = commands.add_parser('export', help='write a table to .csv or .jsonl, optionally .gz')
+    command.add_argument('table', choices=sorted(EXPORT_TABLES))
+    command.add_argument('file')
+    command.add_argument('--from', dest='start', metavar='YYYY-MM-DD',
+                         help='first date to include (sales and expenses)')
+    command.add_argument('--to', dest='end', metavar='YYYY-MM-DD', help='last date to include')
+    command.set_defaults(run=export_command)
+    command = commands.add_parser('archive', help='move old sales and expenses to per-month files')
+    command.add_argument('--keep-months', type=int, default=ARCHIVE_KEEP_MONTHS,
+                         help='whole months, besides the current one, to keep in the live database')
+    command.add_argument('--vacuum', action='store_true',
+                         help='shrink the live database file afterwards')
+    command.set_defaults(run=archive_command)
+    command = commands.add_parser('sync', help='push queued sales/expenses and pull stock changes')
+    command.add_argument('server', help='head-office URL, e.g. http://127.0.0.1:8765')
+    command.add_argument('--max-bytes', type=int, default=512 * 1024,
+                         help='compressed bytes sent plus received in this sync')
+    command.set_defaults(run=sync_command)
+    args = parser.parse_args(argv)
+
+    # Opening the database also migrates it, which backfills new rollups
+    db = Database(args.db)
+    try:
+        args.run(db, args)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
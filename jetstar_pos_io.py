@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+JETSTAR POS - bulk stock import and data export
+Both directions stream in fixed-size batches, so memory use does not grow
+with the file or the table
+"""
+
+import csv
+import gzip
+import json
+import os
+import re
+from functools import partial
+from pathlib import Path
+
+# Rows per upsert transaction
+IMPORT_BATCH = 1000
+
+# Rejected rows described in an ImportReport; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+# Header spellings seen in supplier files, mapped onto stock columns
+FIELD_ALIASES = {
+    'product': 'name',
+    'product_name': 'name',
+    'description': 'name',
+    'code': 'sku',
+    'barcode': 'sku',
+    'qty': 'quantity',
+    'stock': 'quantity',
+    'cost': 'unit_cost',
+    'price': 'selling_price',
+    'retail_price': 'selling_price',
+}
+
+STOCK_TYPES = ('product', 'service')
+
+JSON_CHUNK = 64 * 1024
+
+# Rows per fetchmany() call when exporting
+EXPORT_BATCH = 2000
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+class ImportReport:
+    """Running totals for an import; handed to the progress callback after
+    every batch and returned at the end."""
+
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, reason))
+
+    def as_dict(self):
+        return {'read': self.read, 'inserted': self.inserted, 'updated': self.updated,
+                'rejected': self.rejected, 'errors': list(self.errors)}
+
+
+def normalise_field(name):
+    key = str(name or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return FIELD_ALIASES.get(key, key)
+
+
+def _number(value, field, convert):
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        number = convert(str(value).strip())
+    except ValueError:
+        raise ValueError(f'{field} is not a number: {value!r}') from None
+    if number < 0:
+        raise ValueError(f'{field} is negative: {value!r}')
+    return number
+
+
+def _whole(text):
+    number = float(text)
+    if not number.is_integer():
+        raise ValueError(text)
+    return int(number)
+
+
+def validate_stock_row(raw):
+    """Maps one raw record onto STOCK_FIELDS. Raises ValueError naming the
+    problem when the record can't be imported."""
+    record = {normalise_field(key): value for key, value in raw.items()}
+    name = str(record.get('name') or '').strip()
+    sku = str(record.get('sku') or '').strip()
+    if not name:
+        raise ValueError('missing name')
+    if not sku:
+        raise ValueError('missing sku')
+    stock_type = str(record.get('type') or '').strip().lower() or None
+    if stock_type is not None and stock_type not in STOCK_TYPES:
+        raise ValueError(f'unknown type {stock_type!r}')
+    category = str(record.get('category') or '').strip() or None
+    return {
+        'name': name,
+        'sku': sku,
+        'category': category,
+        'quantity': _number(record.get('quantity'), 'quantity', _whole),
+        'unit_cost': _number(record.get('unit_cost'), 'unit_cost', float),
+        'selling_price': _number(record.get('selling_price'), 'selling_price', float),
+        'type': stock_type,
+    }
+
+
+def iter_csv(fp):
+    reader = csv.DictReader(fp)
+    for raw in reader:
+        yield reader.line_num, raw
+
+
+def iter_json_lines(fp):
+    for line, text in enumerate(fp, 1):
+        if text.strip():
+            yield line, json.loads(text)
+
+
+def iter_json_array(fp, chunk_size=JSON_CHUNK):
+    # Decodes a top-level array one element at a time from fixed-size
+    # chunks instead of json.load()ing the whole file
+    decoder = json.JSONDecoder()
+    buffer = fp.read(chunk_size)
+    pos = JSON_SEPARATORS.match(buffer).end()
+    if not buffer.startswith('[', pos):
+        raise ValueError('expected a JSON array of objects')
+    pos += 1
+    index = 0
+    while True:
+        pos = JSON_SEPARATORS.match(buffer, pos).end()
+        # Drop consumed text once per chunk rather than slicing per element
+        if pos > chunk_size:
+            buffer, pos = buffer[pos:], 0
+        if buffer.startswith(']', pos):
+            return
+        try:
+            value, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The element runs past the end of the buffer
+            more = fp.read(chunk_size)
+            if not more:
+                raise
+            buffer += more
+            continue
+        index += 1
+        yield index, value
+
+
+def read_stock_file(path):
+    """Yields (line or record number, raw dict) from a .csv, .jsonl or
+    .json file without reading it all into memory."""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    with open(path, encoding='utf-8-sig', newline='') as fp:
+        if suffix == '.csv':
+            yield from iter_csv(fp)
+        elif suffix in ('.jsonl', '.ndjson'):
+            yield from iter_json_lines(fp)
+        elif suffix == '.json':
+            yield from iter_json_array(fp)
+        else:
+            raise ValueError(f'Unsupported stock file type {suffix!r}; use .csv, .jsonl or .json')
+
+
+def import_stock(db, path, batch_size=IMPORT_BATCH, progress=None):
+    """Validates and upserts every product in ``path`` on ``db``.
+
+    Each batch is its own transaction, so checkouts can run between them
+    and a failure keeps the batches already written. ``progress(report)``
+    is called after each batch. Rows repeating a SKU replace the earlier
+    one. Returns the ImportReport.
+    """
+    report = ImportReport()
+    batch = {}
+
+    def flush():
+        inserted, updated = db.upsert_stock(batch.values())
+        report.inserted += inserted
+        report.updated += updated
+        batch.clear()
+        if progress is not None:
+            progress(report)
+
+    try:
+        for line, raw in read_stock_file(path):
+            report.read += 1
+            if not isinstance(raw, dict):
+                report.reject(line, 'not an object')
+                continue
+            try:
+                product = validate_stock_row(raw)
+            except ValueError as e:
+                report.reject(line, str(e))
+                continue
+            # Within a batch the last row for a SKU wins, as it does across batches
+            batch[product['sku']] = product
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        if report.inserted or report.updated:
+            db.stock_changed()
+    return report
+
+
+def export_format(path):
+    """('csv' or 'jsonl', gzipped) from a file name like sales.csv.gz."""
+    suffixes = [suffix.lower() for suffix in Path(path).suffixes]
+    compressed = bool(suffixes) and suffixes[-1] == '.gz'
+    if compressed:
+        suffixes.pop()
+    fmt = suffixes[-1].lstrip('.') if suffixes else ''
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Cannot tell the export format of {Path(path).name!r}; '
+                         'use .csv, .jsonl, .csv.gz or .jsonl.gz')
+    return fmt, compressed
+
+
+def export_table(db, table, path, start_date=None, end_date=None,
+                 batch_size=EXPORT_BATCH, progress=None):
+    """Writes ``table`` (optionally one date range of it) to ``path`` as
+    CSV or JSON Lines, gzipped if the name ends in .gz, and returns the
+    number of rows written.
+
+    Rows are read with fetchmany() on the calling thread's reader
+    connection, which in WAL mode sees one consistent snapshot while sales
+    continue. Archived months the date range reaches into come first (see
+    Database.archive). The file is written under a temporary name and
+    renamed at the end, so a failed export never leaves a truncated file
+    behind. ``progress(rows)`` is called after each batch.
+    """
+    fmt, compressed = export_format(path)
+    path = Path(path)
+    partial_path = path.with_name(path.name + '.part')
+    cursors = db.export_cursors(table, start_date, end_date)
+    cursor = next(cursors)
+    columns = [column[0] for column in cursor.description]
+    rows = 0
+    opener = partial(gzip.open, compresslevel=6) if compressed else open
+    try:
+        with opener(partial_path, 'wt', encoding='utf-8', newline='') as fp:
+            if fmt == 'csv':
+                writer = csv.writer(fp)
+                writer.writerow(columns)
+                write_batch = writer.writerows
+            else:
+                encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+                def write_batch(batch):
+                    fp.writelines(encode(dict(zip(columns, row))) + '\n' for row in batch)
+
+            while cursor is not None:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    cursor.close()
+                    cursor = next(cursors, None)
+                    continue
+                write_batch(batch)
+                rows += len(batch)
+                if progress is not None:
+                    progress(rows)
+        os.replace(partial_path, path)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+    finally:
+        if cursor is not None:
+            cursor.close()
+        cursors.close()
+    return rows
@@ -4,6 +4,11 @@ JETSTAR POS - Android Mobile App (Kivy) - Simplified & Robust
 Can be built into Android APK using buildozer
 """
 
+import time
+
+# Baseline for the startup timing report; taken before Kivy is imported
+STARTUP_T0 = time.perf_counter()
+
 from kivy.app import App
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.uix.boxlayout import BoxLayout
@@ -12,116 +17,604 @@ from kivy.uix.scrollview import ScrollView
 from kivy.uix.button import Button
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
+from kivy.uix.togglebutton import ToggleButton
+from kivy.uix.popup import Popup
 from kivy.uix.tabbedpanel import TabbedPanel, TabbedPanelItem
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.core.window import Window
+from kivy.clock import Clock
 from kivy.graphics import Color, RoundedRectangle
-import sqlite3
+from kivy.logger import Logger
+from kivy.lang import Builder
+from kivy.properties import ColorProperty, ListProperty, ObjectProperty, StringProperty
+import json
+import logging
+import statistics
+import threading
+from bisect import bisect_right
+from collections import deque
 from datetime import datetime
+from functools import partial, wraps
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
+from jetstar_pos_db import AsyncDatabase, Database, LatencyStats, TracingDatabase, apply_to_summary
+
+IMPORT_DONE = time.perf_counter()
+
 Window.clearcolor = (0.96, 0.96, 0.96, 1)
 
-class Database:
-    def __init__(self):
-        db_dir = Path.home() / '.jetstarpos'
-        db_dir.mkdir(exist_ok=True)
-        self.db_path = db_dir / 'mobile.db'
-        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.init_tables()
-    
-    def init_tables(self):
-        cursor = self.conn.cursor()
-        tables = [
-            '''CREATE TABLE IF NOT EXISTS sales (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                reference TEXT UNIQUE,
-                date DATE,
-                customer_id INTEGER,
-                amount REAL,
-                payment_method TEXT,
-                status TEXT DEFAULT 'completed',
-                notes TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )''',
-            '''CREATE TABLE IF NOT EXISTS stock (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                sku TEXT UNIQUE,
-                category TEXT,
-                quantity INTEGER DEFAULT 0,
-                unit_cost REAL,
-                selling_price REAL,
-                type TEXT DEFAULT 'product',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )''',
-            '''CREATE TABLE IF NOT EXISTS customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                phone TEXT,
-                email TEXT,
-                address TEXT,
-                credit_limit REAL DEFAULT 0,
-                balance REAL DEFAULT 0
-            )''',
-            '''CREATE TABLE IF NOT EXISTS suppliers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                contact_person TEXT,
-                phone TEXT,
-                email TEXT,
-                address TEXT,
-                balance REAL DEFAULT 0
-            )''',
-            '''CREATE TABLE IF NOT EXISTS expenses (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date DATE,
-                category TEXT,
-                description TEXT,
-                vendor TEXT,
-                amount REAL,
-                reference TEXT
-            )'''
-        ]
-        for table_sql in tables:
-            cursor.execute(table_sql)
-        self.conn.commit()
-    
-    def get_sales(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM sales ORDER BY created_at DESC')
-        return [dict(row) for row in cursor.fetchall()]
-    
-    def add_sale(self, reference, date, customer_id, amount, payment_method, notes=''):
-        cursor = self.conn.cursor()
-        cursor.execute('''INSERT INTO sales (reference, date, customer_id, amount, payment_method, notes)
-                         VALUES (?, ?, ?, ?, ?, ?)''',
-                      (reference, date, customer_id, amount, payment_method, notes))
-        self.conn.commit()
-        return cursor.lastrowid
-    
-    def get_stock(self, stock_type='product'):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM stock WHERE type = ? ORDER BY name', (stock_type,))
-        return [dict(row) for row in cursor.fetchall()]
-    
-    def get_customers(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM customers ORDER BY name')
-        return [dict(row) for row in cursor.fetchall()]
-    
-    def get_expenses(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM expenses ORDER BY date DESC')
-        return [dict(row) for row in cursor.fetchall()]
+# Rows fetched per page by the list screens
+PAGE_SIZE = 50
+
+# Quiet period after the last keystroke before the product search runs
+SEARCH_DELAY = 0.25
+
+# A scan should reach the cart within one 60 Hz frame
+FRAME_TIME = 1 / 60
+
+# Most of each frame given to deferred work such as adding list rows or
+# pre-building screens, leaving the rest for input and drawing
+FRAME_BUDGET = 0.004
+
+# Loaded rows a list adds to its data per frame_budget step
+FILL_ROWS = 10
+
+# Scan-to-cart latencies kept for the stats logged on exit
+SCAN_HISTORY = 200
+
+# Cold-start timings kept in ~/.jetstarpos/startup.jsonl
+STARTUP_HISTORY = 100
+
+# Shown in place of values that are still loading in the background
+PLACEHOLDER = '…'
+
+# Upper bounds (ms) of the frame-time histogram buckets; the last is open
+FRAME_BUCKETS = (8, 17, 33, 50, 100, 250)
+
+# ~/.jetstarpos/perf.log rotates at this size, keeping PERF_LOG_BACKUPS old files
+PERF_LOG_BYTES = 1024 * 1024
+PERF_LOG_BACKUPS = 3
+
+# F12 toggles the debug overlay on desktop; on a device, triple-tap the title
+OVERLAY_KEY = 293
+
+# DebugStats of the running app when [debug] instrumentation is on, else None
+debug_stats = None
+
+
+def on_ui_thread(fn):
+    # Delivers AsyncDatabase callbacks on the next frame of the Kivy thread
+    Clock.schedule_once(lambda dt: fn())
+
+
+def instrumented(fn):
+    """Times each call into debug_stats.ui, under the method's qualified
+    name, while instrumentation is on."""
+    name = fn.__qualname__
+    
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if debug_stats is None:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            debug_stats.ui.record(name, time.perf_counter() - start)
+    return wrapper
+
+
+class FrameBudget:
+    """Runs deferred work a step at a time on the Clock, spending at most
+    ``budget`` seconds of each frame on it (though always at least one
+    step, so work keeps moving).
+    
+    Work is an iterator, usually a generator that yields after each small
+    piece (a few rows, one screen), queued under an owner so it can be cancelled when the owner's
+    screen is left or its contents replaced.
+    """
+    
+    def __init__(self, budget=FRAME_BUDGET):
+        self.budget = budget
+        self.tasks = deque()
+        self.event = None
+    
+    def schedule(self, owner, steps):
+        self.tasks.append((owner, iter(steps)))
+        if self.event is None:
+            self.event = Clock.schedule_interval(self.run, 0)
+    
+    def cancel(self, owner):
+        self.tasks = deque(task for task in self.tasks if task[0] is not owner)
+    
+    def pending(self, owner):
+        return any(task[0] is owner for task in self.tasks)
+    
+    def run(self, dt):
+        deadline = time.perf_counter() + self.budget
+        while self.tasks:
+            owner, steps = self.tasks[0]
+            try:
+                next(steps)
+            except StopIteration:
+                self.tasks.popleft()
+            except Exception:
+                Logger.exception('FrameBudget: work for %r failed', owner)
+                self.tasks.popleft()
+            if time.perf_counter() >= deadline:
+                break
+        if not self.tasks:
+            self.event = None
+            return False
+
+
+frame_budget = FrameBudget()
+
+
+def screenful(row_pitch):
+    # Rows a list can show at once. Measured against the window, because a
+    # page often lands before the list itself has been laid out
+    return int(Window.height // row_pitch) + 1
+
+
+class DebugStats:
+    """Opt-in timings for diagnosing a slow till: every database call
+    (through TracingDatabase), screen builds and refreshes, and a histogram
+    of frame times from the Clock. Snapshots go to a rotating log file."""
+    
+    def __init__(self, log_path=None):
+        self.queries = LatencyStats()
+        self.ui = LatencyStats()
+        self.frames = [0] * (len(FRAME_BUCKETS) + 1)
+        self.slowest_frame = 0.0
+        self.log = None
+        if log_path is not None:
+            self.log = logging.getLogger('jetstar_pos.perf')
+            self.log.propagate = False
+            self.log.setLevel(logging.INFO)
+            if not self.log.handlers:
+                handler = RotatingFileHandler(log_path, maxBytes=PERF_LOG_BYTES,
+                                              backupCount=PERF_LOG_BACKUPS, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                self.log.addHandler(handler)
+    
+    def start(self, log_interval):
+        global debug_stats
+        debug_stats = self
+        # An interval of 0 runs once per frame; dt is that frame's duration
+        Clock.schedule_interval(self.on_frame, 0)
+        if self.log is not None:
+            Clock.schedule_interval(self.write_log, log_interval)
+        return self
+    
+    def on_frame(self, dt):
+        self.frames[bisect_right(FRAME_BUCKETS, dt * 1000)] += 1
+        self.slowest_frame = max(self.slowest_frame, dt)
+    
+    def frame_histogram(self):
+        labels = [f'<{FRAME_BUCKETS[0]}']
+        labels += [f'{low}-{high}' for low, high in zip(FRAME_BUCKETS, FRAME_BUCKETS[1:])]
+        labels.append(f'{FRAME_BUCKETS[-1]}+')
+        return dict(zip(labels, self.frames))
+    
+    def snapshot(self):
+        return {'time': datetime.now().isoformat(timespec='seconds'),
+                'frames_ms': self.frame_histogram(),
+                'slowest_frame_ms': round(self.slowest_frame * 1000, 1),
+                'queries': self.queries.snapshot(), 'ui': self.ui.snapshot()}
+    
+    def write_log(self, *args):
+        self.log.info(json.dumps(self.snapshot()))
+    
+    def overlay_text(self, top=6):
+        total = sum(self.frames) or 1
+        lines = ['frames (ms)  ' + '  '.join(f'{label}:{count * 100 // total}%'
+                                            for label, count in self.frame_histogram().items())]
+        for title, stats in (('query', self.queries.snapshot()), ('ui', self.ui.snapshot())):
+            lines.append(f'{title:<28} {"n":>6} {"mean":>8} {"p95":>8} {"max":>8}')
+            for name, entry in list(stats.items())[:top]:
+                lines.append(f'  {name[:26]:<26} {entry["count"]:>6} {entry["mean_ms"]:>8.2f} '
+                             f'{entry["p95_ms"]:>8.2f} {entry["max_ms"]:>8.1f}')
+        return '\n'.join(lines)
+
+# Row views for the RecycleView lists. Each view is created once per visible
+# slot and re-filled from the data dicts as the list scrolls, so the widget
+# count stays the same however many rows there are.
+Builder.load_string('''
+#:import Window kivy.core.window.Window
+
+<CardRow>:
+    padding: 15
+    spacing: 10
+    canvas.before:
+        Color:
+            rgba: self.bg_color
+        RoundedRectangle:
+            pos: self.pos
+            size: self.size
+            radius: self.radius
+
+<EmptyRow>:
+    color: 0.6, 0.6, 0.6, 1
+    font_size: '16sp'
+
+<ProductRow>:
+    padding: 12
+    radius: [8]
+    BoxLayout:
+        orientation: 'vertical'
+        Label:
+            text: root.title
+            markup: True
+            color: 0.2, 0.2, 0.2, 1
+            font_size: '17sp'
+            halign: 'left'
+            valign: 'middle'
+            text_size: self.size
+        Label:
+            text: root.detail
+            color: 0.5, 0.5, 0.5, 1
+            font_size: '14sp'
+            halign: 'left'
+            valign: 'middle'
+            text_size: self.size
+    Button:
+        text: '+'
+        size_hint_x: 0.18
+        background_color: 0.3, 0.69, 0.31, 1
+        font_size: '24sp'
+        bold: True
+        on_press: root.action(root.item)
+
+<CartRow>:
+    padding: 8
+    spacing: 8
+    bg_color: 0.95, 0.95, 0.95, 1
+    radius: [6]
+    Label:
+        text: root.title
+        markup: True
+        color: 0.2, 0.2, 0.2, 1
+        font_size: '14sp'
+        halign: 'left'
+        valign: 'middle'
+        text_size: self.size
+    Label:
+        text: root.detail
+        markup: True
+        bold: True
+        color: root.detail_color
+        size_hint_x: 0.25
+        font_size: '16sp'
+    Button:
+        text: '×'
+        size_hint_x: 0.12
+        background_color: 0.96, 0.26, 0.21, 1
+        font_size: '22sp'
+        bold: True
+        on_press: root.action(root.item)
+
+<InfoRow>:
+    Label:
+        text: root.title
+        markup: True
+        color: 0.2, 0.2, 0.2, 1
+        font_size: '16sp'
+        halign: 'left'
+        valign: 'middle'
+        text_size: self.size
+    Label:
+        text: root.detail
+        markup: True
+        color: root.detail_color
+        size_hint_x: 0.3
+        font_size: root.detail_font_size
+
+<SaleRow>:
+    size_hint_y: None
+    height: 60
+    padding: 12
+    bg_color: 0.97, 0.97, 0.97, 1
+    radius: [8]
+    Label:
+        text: root.title
+        markup: True
+        color: 0.2, 0.2, 0.2, 1
+        font_size: '13sp'
+        halign: 'left'
+        valign: 'middle'
+        text_size: self.size
+    Label:
+        text: root.detail
+        markup: True
+        color: root.detail_color
+        size_hint_x: 0.3
+        font_size: '16sp'
+
+<DebugOverlay>:
+    size_hint: None, None
+    size: self.texture_size
+    padding: 8, 8
+    x: 0
+    y: Window.height - self.height
+    font_name: 'RobotoMono-Regular'
+    font_size: '11sp'
+    color: 1, 1, 1, 1
+    canvas.before:
+        Color:
+            rgba: 0, 0, 0, 0.75
+        Rectangle:
+            pos: self.pos
+            size: self.size
+''')
+
+
+class CardRow(BoxLayout):
+    bg_color = ColorProperty((1, 1, 1, 1))
+    radius = ListProperty([10])
+    title = StringProperty('')
+    detail = StringProperty('')
+    detail_color = ColorProperty((0.3, 0.69, 0.31, 1))
+    detail_font_size = StringProperty('15sp')
+    item = ObjectProperty(None, allownone=True)
+    action = ObjectProperty(None, allownone=True)
+
+
+class EmptyRow(Label):
+    pass
+
+
+class ProductRow(CardRow):
+    pass
+
+
+class CartRow(CardRow):
+    pass
+
+
+class InfoRow(CardRow):
+    pass
+
+
+class SaleRow(CardRow):
+    pass
+
+
+class StatCard(BoxLayout):
+    # Rounded card with a small title over a large value. Built in Python
+    # rather than KV: cards are made once per screen and never pooled, and
+    # applying a KV rule costs more than adding the widgets directly
+    value = StringProperty('')
+    
+    def __init__(self, title, value='', value_color=(0.2, 0.2, 0.2, 1), title_font_size='14sp',
+                 value_font_size='26sp', title_size_hint=0.5, **kwargs):
+        super().__init__(orientation='vertical', **kwargs)
+        with self.canvas.before:
+            Color(1, 1, 1, 1)
+            self.rect = RoundedRectangle(pos=self.pos, size=self.size, radius=[12])
+        self.bind(pos=self.update_rect, size=self.update_rect)
+        self.add_widget(Label(text=title, color=(0.5, 0.5, 0.5, 1), font_size=title_font_size,
+                              size_hint_y=title_size_hint))
+        self.value_label = Label(text=value, markup=True, bold=True, color=value_color,
+                                 font_size=value_font_size, size_hint_y=1 - title_size_hint)
+        self.add_widget(self.value_label)
+        self.value = value
+    
+    def update_rect(self, *args):
+        self.rect.pos = self.pos
+        self.rect.size = self.size
+    
+    def on_value(self, card, value):
+        self.value_label.text = value
+
+
+class WidgetPool:
+    """Detached widgets of one class kept for reuse, so a hand-managed
+    list re-fills the rows it already has on refresh instead of building
+    (and binding) new ones."""
+    
+    def __init__(self, cls, limit=50):
+        self.cls = cls
+        self.limit = limit
+        self.free = []
+    
+    def acquire(self, **properties):
+        widget = self.free.pop() if self.free else self.cls()
+        for name, value in properties.items():
+            setattr(widget, name, value)
+        return widget
+    
+    def release(self, widget):
+        if widget.parent is not None:
+            widget.parent.remove_widget(widget)
+        if len(self.free) < self.limit:
+            self.free.append(widget)
+
+
+class DebugOverlay(Label):
+    pass
+
+
+class ListView(RecycleView):
+    def __init__(self, viewclass, row_height, spacing=8, **kwargs):
+        super().__init__(**kwargs)
+        layout = RecycleBoxLayout(orientation='vertical', default_size=(None, row_height),
+                                  default_size_hint=(1, None), size_hint_y=None,
+                                  spacing=spacing, padding=5)
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+        self.viewclass = viewclass
+        self.row_pitch = row_height + spacing
+        # Lets a data dict swap in another view, e.g. the empty-list message
+        self.key_viewclass = 'viewclass'
+    
+    @staticmethod
+    def empty_item(text):
+        return {'viewclass': 'EmptyRow', 'text': text, 'height': 100}
+
+
+class PagedListView(ListView):
+    """ListView that pulls further keyset pages from the database as the
+    user scrolls to the bottom.
+    
+    ``fetch_page(after, callback)`` must start loading the page after
+    ``after`` and hand the rows to ``callback`` on the UI thread.
+    
+    A first page shows the rows that fit on screen straight away; the rest
+    of every page is added through frame_budget. That work is paused with
+    pause_fill() when the screen is left and picked up by resume_fill().
+    """
+    
+    def __init__(self, fetch_page, page_key, to_item, empty_text, **kwargs):
+        super().__init__(**kwargs)
+        self.fetch_page = fetch_page
+        self.page_key = page_key
+        self.to_item = to_item
+        self.empty_text = empty_text
+        # Rows behind the current data, in the same order; None until the
+        # first page arrives
+        self.rows = None
+        self.after = None
+        self.exhausted = True
+        self.loading = False
+        # Bumped on every reset so pages requested for older contents are dropped
+        self.generation = 0
+        # Loaded rows still to be added to data, in order
+        self.pending = []
+        self.bind(scroll_y=self.on_scroll)
+    
+    def reset(self):
+        self.drop_pending()
+        self.generation += 1
+        self.rows = None
+        self.after = None
+        self.exhausted = False
+        self.loading = False
+        self.scroll_y = 1
+        self.data = [self.empty_item('Loading…')]
+        self.load_more()
+    
+    def load_more(self):
+        if self.exhausted or self.loading or self.pending:
+            return
+        self.loading = True
+        first = self.after is None
+        self.fetch_page(self.after, partial(self.on_page, self.generation, first))
+    
+    @instrumented
+    def on_page(self, generation, first, rows):
+        if generation != self.generation:
+            return
+        self.loading = False
+        self.exhausted = len(rows) < PAGE_SIZE
+        if rows:
+            self.after = self.page_key(rows[-1])
+        if first:
+            self.show_first(rows, self.empty_text)
+        else:
+            self.pending.extend(rows)
+            self.resume_fill()
+    
+    def show_rows(self, rows, empty_text):
+        # Fixed result set (e.g. search hits): no further pages to fetch
+        self.drop_pending()
+        self.generation += 1
+        self.exhausted = True
+        self.loading = False
+        self.scroll_y = 1
+        self.show_first(rows, empty_text)
+    
+    def show_first(self, rows, empty_text):
+        shown = screenful(self.row_pitch)
+        self.rows = list(rows[:shown])
+        self.data = [self.to_item(row) for row in self.rows] or [self.empty_item(empty_text)]
+        self.pending = list(rows[shown:])
+        self.resume_fill()
+    
+    def fill(self):
+        # A few rows per step, as every change to data re-lays out the view
+        while self.pending:
+            rows, self.pending[:FILL_ROWS] = self.pending[:FILL_ROWS], []
+            items = [self.to_item(row) for row in rows]
+            if self.rows:
+                self.data.extend(items)
+            else:
+                self.data = items
+            self.rows.extend(rows)
+            yield
+        if self.scroll_y <= 0:
+            # Scrolled to the bottom while the rows were being added
+            self.load_more()
+    
+    def resume_fill(self):
+        # Off screen the rows wait for the screen's on_enter
+        if self.pending and self.get_root_window() is not None and not frame_budget.pending(self):
+            frame_budget.schedule(self, self.fill())
+    
+    def pause_fill(self):
+        frame_budget.cancel(self)
+    
+    def drop_pending(self):
+        frame_budget.cancel(self)
+        self.pending = []
+    
+    def insert_row(self, row, descending=False):
+        """Puts a newly written row at its sort position among the loaded
+        rows. A row that sorts after the last loaded page is left for
+        load_more to fetch."""
+        if self.rows is None:
+            # The first page is still on its way and will already include it
+            return
+        key = self.page_key(row)
+        
+        def position(rows):
+            return next((i for i, other in enumerate(rows)
+                         if (self.page_key(other) < key if descending else self.page_key(other) > key)),
+                        len(rows))
+        
+        index = position(self.rows)
+        if index == len(self.rows) and self.pending:
+            # Sorts among the rows still waiting to be added
+            index = position(self.pending)
+            if index < len(self.pending) or self.exhausted:
+                self.pending.insert(index, row)
+            return
+        if index == len(self.rows) and not self.exhausted:
+            return
+        if self.rows:
+            self.data.insert(index, self.to_item(row))
+        else:
+            self.data = [self.to_item(row)]
+        self.rows.insert(index, row)
+    
+    def update_row(self, row):
+        # Re-renders the loaded row with the same id, if there is one
+        for index, other in enumerate(self.rows or ()):
+            if other['id'] == row['id']:
+                self.rows[index] = row
+                self.data[index] = self.to_item(row)
+                return
+        for index, other in enumerate(self.pending):
+            if other['id'] == row['id']:
+                self.pending[index] = row
+                return
+    
+    def on_scroll(self, instance, value):
+        if value <= 0 and not self.exhausted:
+            self.load_more()
 
 
 class DashboardScreen(Screen):
     def __init__(self, db, **kwargs):
         super().__init__(**kwargs)
         self.db = db
+        self.summary = None
         self.build_ui()
+        self.db.subscribe(self.on_change, tables=('sales', 'expenses', 'stock'))
     
+    @instrumented
     def build_ui(self):
         layout = BoxLayout(orientation='vertical', padding=15, spacing=15)
         
@@ -129,6 +622,7 @@ class DashboardScreen(Screen):
         header = BoxLayout(size_hint_y=0.12, spacing=10)
         title = Label(text='[b]JETSTAR POS[/b]', font_size='28sp', markup=True,
                      color=(0.18, 0.31, 0.09, 1))
+        title.bind(on_touch_down=self.on_title_touch)
         new_sale_btn = Button(text='+ New Sale', size_hint_x=0.35, 
                              background_color=(0.18, 0.31, 0.09, 1), 
                              color=(1, 1, 1, 1), bold=True, font_size='16sp')
@@ -140,24 +634,18 @@ class DashboardScreen(Screen):
         # Stats
         stats_grid = GridLayout(cols=2, spacing=15, size_hint_y=0.28)
         
-        sales = self.db.get_sales()
-        expenses = self.db.get_expenses()
-        stock = self.db.get_stock()
-        
-        total_sales = sum(float(s.get('amount', 0)) for s in sales)
-        total_expenses = sum(float(e.get('amount', 0)) for e in expenses)
-        
         # Sales card
-        sales_card = self.create_stat_card('Sales', f'${total_sales:.2f}', 
-                                           (0.3, 0.69, 0.31, 1))
-        stats_grid.add_widget(sales_card)
+        self.sales_card = self.create_stat_card('Sales', PLACEHOLDER, 
+                                                (0.3, 0.69, 0.31, 1))
+        stats_grid.add_widget(self.sales_card)
         
         # Stock card
-        stock_card = self.create_stat_card('Stock Items', str(len(stock)), 
-                                           (0.13, 0.59, 0.95, 1))
-        stats_grid.add_widget(stock_card)
+        self.stock_card = self.create_stat_card('Stock Items', PLACEHOLDER, 
+                                                (0.13, 0.59, 0.95, 1))
+        stats_grid.add_widget(self.stock_card)
         
         layout.add_widget(stats_grid)
+        self.db.get_summary(callback=self.show_summary)
         
         # Quick Actions
         actions_label = Label(text='[b]Quick Actions[/b]', font_size='22sp', 
@@ -184,30 +672,100 @@ class DashboardScreen(Screen):
         layout.add_widget(actions_grid)
         self.add_widget(layout)
     
+    @instrumented
+    def show_summary(self, summary):
+        self.summary = summary
+        self.sales_card.value = f"${summary['total_sales']:.2f}"
+        self.stock_card.value = str(summary['stock_count'])
+    
+    def on_change(self, event):
+        # Changes made before the summary was loaded are already in it
+        if self.summary is None:
+            return
+        if apply_to_summary(self.summary, event):
+            self.show_summary(self.summary)
+        else:
+            self.db.get_summary(callback=self.show_summary)
+    
+    def on_title_touch(self, title, touch):
+        if title.collide_point(*touch.pos) and touch.is_triple_tap:
+            App.get_running_app().toggle_debug_overlay()
+    
     def create_stat_card(self, title, value, color):
-        card = BoxLayout(orientation='vertical', padding=20, spacing=8)
-        
-        # Add rounded background
-        with card.canvas.before:
-            Color(1, 1, 1, 1)
-            card.rect = RoundedRectangle(pos=card.pos, size=card.size, radius=[12])
-        card.bind(pos=lambda *args: setattr(card.rect, 'pos', card.pos))
-        card.bind(size=lambda *args: setattr(card.rect, 'size', card.size))
-        
-        card.add_widget(Label(text=title, color=(0.5, 0.5, 0.5, 1), 
-                             font_size='16sp', size_hint_y=0.3))
-        card.add_widget(Label(text=value, font_size='38sp', bold=True, 
-                             color=color, size_hint_y=0.7))
-        return card
+        return StatCard(title=title, value=value, value_color=color, padding=20, spacing=8,
+                        title_font_size='16sp', value_font_size='38sp', title_size_hint=0.3)
+
+
+class Cart:
+    """Cart lines keyed by product id, in the order they were added, with a
+    running total and each line's position so adding to a line never
+    rescans the cart."""
+    
+    def __init__(self):
+        self.lines = {}
+        self.order = []
+        self.positions = {}
+        self.total = 0.0
+    
+    def __len__(self):
+        return len(self.order)
+    
+    def __iter__(self):
+        return (self.lines[product_id] for product_id in self.order)
+    
+    def add(self, product, qty=1):
+        """Returns (index, line, created) for the line that changed."""
+        product_id = int(product.get('id', 0))
+        line = self.lines.get(product_id)
+        created = line is None
+        if created:
+            line = {
+                'id': product_id,
+                'name': str(product.get('name', 'Unknown')),
+                'price': float(product.get('selling_price') or 0),
+                'qty': 0
+            }
+            self.lines[product_id] = line
+            self.positions[product_id] = len(self.order)
+            self.order.append(product_id)
+        index = self.positions[product_id]
+        line['qty'] += qty
+        self.total += line['price'] * qty
+        return index, line, created
+    
+    def remove(self, product_id):
+        """Drops a line and returns its former index, or None if absent."""
+        line = self.lines.pop(product_id, None)
+        if line is None:
+            return None
+        index = self.positions.pop(product_id)
+        del self.order[index]
+        # Only the lines after it move up
+        for later in self.order[index:]:
+            self.positions[later] -= 1
+        # Reset instead of subtracting so float error can't leave -0.00 behind
+        self.total = self.total - line['price'] * line['qty'] if self.order else 0.0
+        return index
+    
+    def clear(self):
+        self.lines.clear()
+        self.order.clear()
+        self.positions.clear()
+        self.total = 0.0
 
 
 class SellScreen(Screen):
     def __init__(self, db, **kwargs):
         super().__init__(**kwargs)
         self.db = db
-        self.cart = []
+        self.cart = Cart()
+        self.checkout_pending = False
+        self.scan_mode = False
+        self.scan_latencies = deque(maxlen=SCAN_HISTORY)
         self.build_ui()
+        self.db.subscribe(self.on_stock_change, tables=('stock',))
     
+    @instrumented
     def build_ui(self):
         main_layout = BoxLayout(orientation='horizontal', padding=15, spacing=15)
         
@@ -218,18 +776,29 @@ class SellScreen(Screen):
                                    font_size='24sp', size_hint_y=0.08, 
                                    color=(0.2, 0.2, 0.2, 1)))
         
-        # Search
+        # Search; Enter looks the text up as a SKU first, which is how
+        # keyboard-wedge barcode scanners finish each scan
+        search_row = BoxLayout(size_hint_y=0.08, spacing=8)
         self.search_input = TextInput(hint_text='Search products...', multiline=False, 
-                                     size_hint_y=0.08, font_size='16sp')
+                                     font_size='16sp', text_validate_unfocus=False)
         self.search_input.bind(text=self.filter_products)
-        left_panel.add_widget(self.search_input)
+        self.search_input.bind(on_text_validate=self.on_search_enter)
+        self.search_trigger = Clock.create_trigger(self.run_search, SEARCH_DELAY)
+        search_row.add_widget(self.search_input)
+        scan_btn = ToggleButton(text='Scan', size_hint_x=0.22, font_size='16sp')
+        scan_btn.bind(state=self.on_scan_mode)
+        search_row.add_widget(scan_btn)
+        left_panel.add_widget(search_row)
         
         # Products list
-        self.products_scroll = ScrollView(size_hint_y=0.84)
-        self.products_layout = GridLayout(cols=1, spacing=8, size_hint_y=None, padding=5)
-        self.products_layout.bind(minimum_height=self.products_layout.setter('height'))
-        self.products_scroll.add_widget(self.products_layout)
-        left_panel.add_widget(self.products_scroll)
+        self.products_view = PagedListView(
+            viewclass='ProductRow', row_height=70, spacing=8, size_hint_y=0.84,
+            fetch_page=lambda after, callback: self.db.get_stock(
+                limit=PAGE_SIZE, after=after, callback=callback),
+            page_key=lambda row: self.db.page_key('stock', row),
+            to_item=self.product_item,
+            empty_text='No products found. Add some products first!')
+        left_panel.add_widget(self.products_view)
         
         self.load_products()
         
@@ -240,11 +809,9 @@ class SellScreen(Screen):
                                     font_size='24sp', size_hint_y=0.06, 
                                     color=(0.2, 0.2, 0.2, 1)))
         
-        self.cart_scroll = ScrollView(size_hint_y=0.52)
-        self.cart_layout = GridLayout(cols=1, spacing=5, size_hint_y=None, padding=5)
-        self.cart_layout.bind(minimum_height=self.cart_layout.setter('height'))
-        self.cart_scroll.add_widget(self.cart_layout)
-        right_panel.add_widget(self.cart_scroll)
+        self.cart_view = ListView(viewclass='CartRow', row_height=65, spacing=5,
+                                  size_hint_y=0.52)
+        right_panel.add_widget(self.cart_view)
         
         # Total
         self.total_label = Label(text='[b]Total: $0.00[/b]', markup=True,
@@ -274,139 +841,183 @@ class SellScreen(Screen):
         main_layout.add_widget(left_panel)
         main_layout.add_widget(right_panel)
         self.add_widget(main_layout)
+        self.update_cart()
     
     def load_products(self):
-        self.products_layout.clear_widgets()
-        products = self.db.get_stock()
-        
-        if not products:
-            self.products_layout.add_widget(
-                Label(text='No products found. Add some products first!', 
-                      color=(0.6, 0.6, 0.6, 1), font_size='16sp', size_hint_y=None, height=100))
-            return
-        
-        for product in products:
-            product_box = BoxLayout(orientation='horizontal', size_hint_y=None, 
-                                   height=70, padding=12, spacing=10)
-            
-            with product_box.canvas.before:
-                Color(1, 1, 1, 1)
-                product_box.rect = RoundedRectangle(pos=product_box.pos, 
-                                                    size=product_box.size, radius=[8])
-            product_box.bind(pos=lambda *args, pb=product_box: setattr(pb.rect, 'pos', pb.pos))
-            product_box.bind(size=lambda *args, pb=product_box: setattr(pb.rect, 'size', pb.size))
-            
-            info_layout = BoxLayout(orientation='vertical')
-            name = str(product.get('name', 'Unknown'))
-            price = float(product.get('selling_price', 0))
-            qty = int(product.get('quantity', 0))
-            
-            info_layout.add_widget(Label(text=f'[b]{name}[/b]', markup=True,
-                                        color=(0.2, 0.2, 0.2, 1), font_size='17sp',
-                                        halign='left', valign='middle'))
-            info_layout.add_widget(Label(text=f'${price:.2f} • Stock: {qty}', 
-                                        color=(0.5, 0.5, 0.5, 1), font_size='14sp',
-                                        halign='left', valign='middle'))
-            
-            for widget in info_layout.children:
-                widget.bind(size=widget.setter('text_size'))
-            
-            add_btn = Button(text='+', size_hint_x=0.18, 
-                           background_color=(0.3, 0.69, 0.31, 1),
-                           font_size='24sp', bold=True)
-            add_btn.bind(on_press=lambda x, p=product: self.add_to_cart(p))
-            
-            product_box.add_widget(info_layout)
-            product_box.add_widget(add_btn)
-            self.products_layout.add_widget(product_box)
+        self.products_view.reset()
+    
+    def product_item(self, product):
+        name = str(product.get('name', 'Unknown'))
+        price = float(product.get('selling_price') or 0)
+        qty = int(product.get('quantity') or 0)
+        return {'title': f'[b]{name}[/b]', 'detail': f'${price:.2f} • Stock: {qty}',
+                'item': product, 'action': self.add_to_cart}
     
     def filter_products(self, instance, value):
-        self.load_products()
+        # Scanned characters arrive one by one; don't search on each of them
+        if self.scan_mode:
+            return
+        # Debounce: restart the timer on every keystroke so only the last
+        # text typed is searched
+        self.search_trigger.cancel()
+        self.search_trigger()
+    
+    def on_scan_mode(self, button, state):
+        self.scan_mode = state == 'down'
+        self.search_input.hint_text = 'Scan a barcode...' if self.scan_mode else 'Search products...'
+        self.search_input.text = ''
+        self.search_input.focus = True
+    
+    def on_search_enter(self, instance):
+        code = instance.text.strip()
+        if not code:
+            return
+        started = time.perf_counter()
+        if self.scan_mode:
+            # Ready for the next scan even if this one has to wait for the worker
+            instance.text = ''
+        # O(1) read of the SKU map the worker last loaded; by_sku is only ever
+        # replaced whole, so this is safe without touching the database here
+        product = self.db.catalog.by_sku.get(code)
+        if product is not None:
+            self.finish_scan(code, started, product)
+        else:
+            # Not loaded yet or added since: let the worker refresh the catalog
+            self.db.get_product_by_sku(code, callback=partial(self.finish_scan, code, started))
+    
+    def finish_scan(self, code, started, product):
+        if product is None:
+            # In search mode the debounced text search shows what matched instead
+            if self.scan_mode:
+                Logger.warning('Scan: unknown barcode %r', code)
+            return
+        self.add_to_cart(product)
+        latency = time.perf_counter() - started
+        self.scan_latencies.append(latency)
+        if latency > FRAME_TIME:
+            Logger.warning('Scan: %s took %.1f ms to reach the cart', code, latency * 1000)
+        if not self.scan_mode and self.search_input.text.strip() == code:
+            self.search_input.text = ''
+    
+    def scan_stats(self):
+        if not self.scan_latencies:
+            return {'scans': 0}
+        ordered = sorted(self.scan_latencies)
+        return {'scans': len(ordered),
+                'p50_ms': round(statistics.median(ordered) * 1000, 3),
+                'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+                'max_ms': round(ordered[-1] * 1000, 3),
+                'over_frame': sum(1 for latency in ordered if latency > FRAME_TIME)}
+    
+    def run_search(self, dt):
+        query = self.search_input.text.strip()
+        if not query:
+            self.load_products()
+            return
+        self.db.search_stock(query, limit=PAGE_SIZE,
+                             callback=partial(self.show_search_results, query))
+    
+    @instrumented
+    def show_search_results(self, query, results):
+        # Drop results for text the user has already typed past
+        if self.search_input.text.strip() != query:
+            return
+        self.products_view.show_rows(results, f'No products match "{query}"')
+    
+    def on_enter(self, *args):
+        self.products_view.resume_fill()
+    
+    def on_leave(self, *args):
+        self.products_view.pause_fill()
+    
+    def on_stock_change(self, event):
+        if event.kind == 'update':
+            self.products_view.update_row(event.row)
+        elif event.kind == 'reload':
+            self.run_search(0)
+        elif event.kind == 'insert' and not self.search_input.text.strip():
+            self.products_view.insert_row(event.row)
     
     def add_to_cart(self, product):
-        product_id = int(product.get('id', 0))
-        existing = next((item for item in self.cart if item['id'] == product_id), None)
-        
-        if existing:
-            existing['qty'] += 1
+        if self.checkout_pending:
+            return
+        was_empty = not self.cart
+        index, line, created = self.cart.add(product)
+        item = self.cart_item(line)
+        # Touch only the affected row; RecycleView refreshes just that slot
+        if was_empty:
+            self.cart_view.data = [item]
+        elif created:
+            self.cart_view.data.append(item)
         else:
-            self.cart.append({
-                'id': product_id,
-                'name': str(product.get('name', 'Unknown')),
-                'price': float(product.get('selling_price', 0)),
-                'qty': 1
-            })
-        self.update_cart()
+            self.cart_view.data[index] = item
+        self.update_total()
+    
+    def cart_item(self, line):
+        qty = int(line['qty'])
+        price = float(line['price'])
+        name = str(line['name'])[:20]
+        return {'title': f'[b]{name}[/b]\n${price:.2f} × {qty}',
+                'detail': f'[b]${price * qty:.2f}[/b]',
+                'item': line, 'action': self.remove_from_cart}
     
+    @instrumented
     def update_cart(self):
-        self.cart_layout.clear_widgets()
-        total = 0
-        
-        if not self.cart:
-            self.cart_layout.add_widget(
-                Label(text='Cart is empty', color=(0.6, 0.6, 0.6, 1), 
-                      font_size='16sp', size_hint_y=None, height=60))
-            self.total_label.text = '[b]Total: $0.00[/b]'
-            return
-        
-        for item in self.cart:
-            qty = int(item['qty'])
-            price = float(item['price'])
-            subtotal = price * qty
-            total += subtotal
-            
-            cart_item = BoxLayout(size_hint_y=None, height=65, padding=8, spacing=8)
-            
-            with cart_item.canvas.before:
-                Color(0.95, 0.95, 0.95, 1)
-                cart_item.rect = RoundedRectangle(pos=cart_item.pos, 
-                                                  size=cart_item.size, radius=[6])
-            cart_item.bind(pos=lambda *args, ci=cart_item: setattr(ci.rect, 'pos', ci.pos))
-            cart_item.bind(size=lambda *args, ci=cart_item: setattr(ci.rect, 'size', ci.size))
-            
-            name = str(item['name'])[:20]
-            info_label = Label(text=f'[b]{name}[/b]\n${price:.2f} × {qty}', 
-                              markup=True, color=(0.2, 0.2, 0.2, 1), 
-                              font_size='14sp', halign='left', valign='middle')
-            info_label.bind(size=info_label.setter('text_size'))
-            
-            subtotal_label = Label(text=f'[b]${subtotal:.2f}[/b]', markup=True,
-                                  bold=True, color=(0.3, 0.69, 0.31, 1), 
-                                  size_hint_x=0.25, font_size='16sp')
-            
-            remove_btn = Button(text='×', size_hint_x=0.12, 
-                              background_color=(0.96, 0.26, 0.21, 1),
-                              font_size='22sp', bold=True)
-            remove_btn.bind(on_press=lambda x, i=item: self.remove_from_cart(i))
-            
-            cart_item.add_widget(info_label)
-            cart_item.add_widget(subtotal_label)
-            cart_item.add_widget(remove_btn)
-            self.cart_layout.add_widget(cart_item)
-        
-        self.total_label.text = f'[b]Total: ${total:.2f}[/b]'
+        # Full redraw; only used when the whole cart is replaced
+        if self.cart:
+            self.cart_view.data = [self.cart_item(line) for line in self.cart]
+        else:
+            self.cart_view.data = [self.cart_view.empty_item('Cart is empty')]
+        self.update_total()
+    
+    def update_total(self):
+        self.total_label.text = f'[b]Total: ${self.cart.total:.2f}[/b]'
     
     def remove_from_cart(self, item):
-        self.cart = [i for i in self.cart if i['id'] != item['id']]
-        self.update_cart()
+        if self.checkout_pending:
+            return
+        index = self.cart.remove(item['id'])
+        if index is None:
+            return
+        if self.cart:
+            self.cart_view.data.pop(index)
+        else:
+            self.cart_view.data = [self.cart_view.empty_item('Cart is empty')]
+        self.update_total()
     
     def clear_cart(self):
+        if self.checkout_pending:
+            return
         self.cart.clear()
         self.update_cart()
     
     def checkout(self, instance):
-        if not self.cart:
+        if not self.cart or self.checkout_pending:
             return
         
-        total = sum(float(item['price']) * int(item['qty']) for item in self.cart)
-        reference = f"SALE-{datetime.now().strftime('%Y%m%d%H%M%S')}"
         date = datetime.now().strftime('%Y-%m-%d')
         
-        self.db.add_sale(reference, date, None, total, 'Cash', '')
-        
+        # The cart is frozen until the background write finishes. The
+        # database assigns the reference, so checkouts never collide
+        self.checkout_pending = True
+        self.db.checkout(None, date, [dict(line) for line in self.cart],
+                         payment_method='Cash', callback=self.on_checkout_done,
+                         errback=self.on_checkout_failed)
+    
+    def on_checkout_done(self, sale_id):
+        self.checkout_pending = False
         self.cart.clear()
         self.update_cart()
         self.manager.current = 'dashboard'
+    
+    def on_checkout_failed(self, error):
+        # The transaction was rolled back; keep the cart so the sale can be retried
+        self.checkout_pending = False
+        Logger.error('Checkout: sale of %d lines failed: %r', len(self.cart), error)
+        text = Label(text=f'The sale was not saved:\n{error}\n\nThe cart has been kept; '
+                          'check it and try again.', halign='center', valign='middle')
+        text.bind(size=text.setter('text_size'))
+        Popup(title='Checkout failed', content=text, size_hint=(0.8, 0.5)).open()
 
 
 class StockScreen(Screen):
@@ -414,7 +1025,9 @@ class StockScreen(Screen):
         super().__init__(**kwargs)
         self.db = db
         self.build_ui()
+        self.db.subscribe(self.on_stock_change, tables=('stock',))
     
+    @instrumented
     def build_ui(self):
         layout = BoxLayout(orientation='vertical', padding=15, spacing=10)
         
@@ -430,56 +1043,48 @@ class StockScreen(Screen):
         layout.add_widget(header)
         
         # Stock list
-        scroll = ScrollView()
-        content = GridLayout(cols=1, spacing=10, size_hint_y=None, padding=5)
-        content.bind(minimum_height=content.setter('height'))
-        
-        products = self.db.get_stock()
-        
-        if not products:
-            content.add_widget(Label(text='No stock items found', 
-                                    color=(0.6, 0.6, 0.6, 1), font_size='18sp',
-                                    size_hint_y=None, height=100))
-        else:
-            for product in products:
-                item_box = BoxLayout(size_hint_y=None, height=75, padding=15, spacing=10)
-                
-                with item_box.canvas.before:
-                    Color(1, 1, 1, 1)
-                    item_box.rect = RoundedRectangle(pos=item_box.pos, 
-                                                     size=item_box.size, radius=[10])
-                item_box.bind(pos=lambda *args, ib=item_box: setattr(ib.rect, 'pos', ib.pos))
-                item_box.bind(size=lambda *args, ib=item_box: setattr(ib.rect, 'size', ib.size))
-                
-                name = str(product.get('name', 'Unknown'))
-                sku = str(product.get('sku', 'N/A'))
-                price = float(product.get('selling_price', 0))
-                qty = int(product.get('quantity', 0))
-                
-                info_label = Label(text=f'[b]{name}[/b]\nSKU: {sku}', 
-                                  markup=True, color=(0.2, 0.2, 0.2, 1), 
-                                  font_size='16sp', halign='left', valign='middle')
-                info_label.bind(size=info_label.setter('text_size'))
-                
-                stats_label = Label(text=f'[b]${price:.2f}[/b]\nQty: {qty}', 
-                                   markup=True, color=(0.3, 0.69, 0.31, 1), 
-                                   size_hint_x=0.3, font_size='15sp')
-                
-                item_box.add_widget(info_label)
-                item_box.add_widget(stats_label)
-                content.add_widget(item_box)
-        
-        scroll.add_widget(content)
-        layout.add_widget(scroll)
+        self.list_view = PagedListView(
+            viewclass='InfoRow', row_height=75, spacing=10,
+            fetch_page=lambda after, callback: self.db.get_stock(
+                limit=PAGE_SIZE, after=after, callback=callback),
+            page_key=lambda row: self.db.page_key('stock', row),
+            to_item=self.stock_item, empty_text='No stock items found')
+        self.list_view.reset()
+        layout.add_widget(self.list_view)
         self.add_widget(layout)
+    
+    def stock_item(self, product):
+        name = str(product.get('name', 'Unknown'))
+        sku = str(product.get('sku', 'N/A'))
+        price = float(product.get('selling_price') or 0)
+        qty = int(product.get('quantity') or 0)
+        return {'title': f'[b]{name}[/b]\nSKU: {sku}',
+                'detail': f'[b]${price:.2f}[/b]\nQty: {qty}'}
+    
+    def on_enter(self, *args):
+        self.list_view.resume_fill()
+    
+    def on_leave(self, *args):
+        self.list_view.pause_fill()
+    
+    def on_stock_change(self, event):
+        if event.kind == 'update':
+            self.list_view.update_row(event.row)
+        elif event.kind == 'insert':
+            self.list_view.insert_row(event.row)
+        else:
+            self.list_view.reset()
 
 
 class ExpensesScreen(Screen):
     def __init__(self, db, **kwargs):
         super().__init__(**kwargs)
         self.db = db
+        self.summary = None
         self.build_ui()
+        self.db.subscribe(self.on_expense_change, tables=('expenses',))
     
+    @instrumented
     def build_ui(self):
         layout = BoxLayout(orientation='vertical', padding=15, spacing=10)
         
@@ -493,65 +1098,83 @@ class ExpensesScreen(Screen):
         header.add_widget(back_btn)
         layout.add_widget(header)
         
-        expenses = self.db.get_expenses()
-        total = sum(float(e.get('amount', 0)) for e in expenses)
-        
-        layout.add_widget(Label(text=f'[b]Total: ${total:.2f}[/b]', markup=True,
-                               font_size='24sp', size_hint_y=0.08, 
-                               color=(0.96, 0.26, 0.21, 1)))
-        
-        scroll = ScrollView()
-        content = GridLayout(cols=1, spacing=10, size_hint_y=None, padding=5)
-        content.bind(minimum_height=content.setter('height'))
+        self.total_label = Label(text=f'[b]Total: {PLACEHOLDER}[/b]', markup=True,
+                                 font_size='24sp', size_hint_y=0.08, 
+                                 color=(0.96, 0.26, 0.21, 1))
+        layout.add_widget(self.total_label)
+        self.db.get_expenses_summary(callback=self.show_total)
         
-        if not expenses:
-            content.add_widget(Label(text='No expenses recorded', 
-                                    color=(0.6, 0.6, 0.6, 1), font_size='18sp',
-                                    size_hint_y=None, height=100))
-        else:
-            for expense in expenses:
-                item = BoxLayout(size_hint_y=None, height=70, padding=15, spacing=10)
-                
-                with item.canvas.before:
-                    Color(1, 1, 1, 1)
-                    item.rect = RoundedRectangle(pos=item.pos, size=item.size, radius=[10])
-                item.bind(pos=lambda *args, i=item: setattr(i.rect, 'pos', i.pos))
-                item.bind(size=lambda *args, i=item: setattr(i.rect, 'size', i.size))
-                
-                desc = str(expense.get('description', 'N/A'))
-                date_str = str(expense.get('date', ''))
-                amt = float(expense.get('amount', 0))
-                
-                info_label = Label(text=f'[b]{desc}[/b]\n{date_str}', markup=True,
-                                  color=(0.2, 0.2, 0.2, 1), font_size='15sp',
-                                  halign='left', valign='middle')
-                info_label.bind(size=info_label.setter('text_size'))
-                
-                amt_label = Label(text=f'[b]${amt:.2f}[/b]', markup=True,
-                                 color=(0.96, 0.26, 0.21, 1), size_hint_x=0.3,
-                                 font_size='18sp')
-                
-                item.add_widget(info_label)
-                item.add_widget(amt_label)
-                content.add_widget(item)
-        
-        scroll.add_widget(content)
-        layout.add_widget(scroll)
+        self.list_view = PagedListView(
+            viewclass='InfoRow', row_height=70, spacing=10,
+            fetch_page=lambda after, callback: self.db.get_expenses(
+                limit=PAGE_SIZE, after=after, callback=callback),
+            page_key=lambda row: self.db.page_key('expenses', row),
+            to_item=self.expense_item, empty_text='No expenses recorded')
+        self.list_view.reset()
+        layout.add_widget(self.list_view)
         self.add_widget(layout)
+    
+    @instrumented
+    def show_total(self, summary):
+        self.summary = summary
+        self.total_label.text = f"[b]Total: ${summary['total']:.2f}[/b]"
+    
+    def on_enter(self, *args):
+        self.list_view.resume_fill()
+    
+    def on_leave(self, *args):
+        self.list_view.pause_fill()
+    
+    def on_expense_change(self, event):
+        if event.kind == 'reload':
+            self.list_view.reset()
+            self.db.get_expenses_summary(callback=self.show_total)
+            return
+        if event.kind != 'insert':
+            return
+        self.list_view.insert_row(event.row, descending=True)
+        if self.summary is not None:
+            self.summary['total'] += float(event.row.get('amount') or 0)
+            self.summary['count'] += 1
+            self.show_total(self.summary)
+    
+    def expense_item(self, expense):
+        amt = expense['amount'] or 0
+        return {'title': f"[b]{expense['description'] or 'N/A'}[/b]\n{expense['date']}",
+                'detail': f'[b]${amt:.2f}[/b]',
+                'detail_color': (0.96, 0.26, 0.21, 1), 'detail_font_size': '18sp'}
 
 
 class ReportsScreen(Screen):
+    RECENT_SALES = 10
+    # SaleRow height plus the recent list's spacing
+    RECENT_ROW_PITCH = 68
+    
     def __init__(self, db, **kwargs):
         super().__init__(**kwargs)
         self.db = db
+        self.summary = None
+        self.recent_sales = None
+        # Tail of recent_sales whose rows frame_budget has yet to add
+        self.recent_pending = []
+        self.row_pool = WidgetPool(SaleRow, limit=self.RECENT_SALES + 1)
         self.build_ui()
+        self.db.subscribe(self.on_change, tables=('sales', 'expenses', 'stock'))
     
+    @instrumented
     def build_ui(self):
         layout = BoxLayout(orientation='vertical', padding=15, spacing=10)
         
-        header = BoxLayout(size_hint_y=0.1)
+        header = BoxLayout(size_hint_y=0.1, spacing=10)
         header.add_widget(Label(text='[b]Sales Report[/b]', markup=True,
                                font_size='26sp', color=(0.2, 0.2, 0.2, 1)))
+        self.export_btn = Button(text='Export CSV', size_hint_x=0.25, 
+                                 background_color=(0.15, 0.39, 0.58, 1), 
+                                 color=(1, 1, 1, 1), font_size='16sp')
+        self.export_btn.bind(on_press=self.export_data)
+        # Exports read the database file, which only the store server has
+        self.export_btn.disabled = self.db.mode == 'shared'
+        header.add_widget(self.export_btn)
         back_btn = Button(text='← Back', size_hint_x=0.25, 
                          background_color=(0.5, 0.5, 0.5, 1), 
                          color=(1, 1, 1, 1), font_size='16sp')
@@ -559,36 +1182,20 @@ class ReportsScreen(Screen):
         header.add_widget(back_btn)
         layout.add_widget(header)
         
-        sales = self.db.get_sales()
-        expenses = self.db.get_expenses()
-        
-        total_sales = sum(float(s.get('amount', 0)) for s in sales)
-        total_expenses = sum(float(e.get('amount', 0)) for e in expenses)
-        net_profit = total_sales - total_expenses
-        avg_sale = total_sales / len(sales) if sales else 0
-        
         stats_grid = GridLayout(cols=2, spacing=15, size_hint_y=0.4, padding=5)
         
         stats = [
-            ('Gross Sales', f'${total_sales:.2f}', (0.3, 0.69, 0.31, 1)),
-            ('Total Orders', str(len(sales)), (0.13, 0.59, 0.95, 1)),
-            ('Net Profit', f'${net_profit:.2f}', (1, 0.6, 0, 1)),
-            ('Avg Order', f'${avg_sale:.2f}', (0.61, 0.15, 0.69, 1))
+            ('total_sales', 'Gross Sales', (0.3, 0.69, 0.31, 1)),
+            ('sale_count', 'Total Orders', (0.13, 0.59, 0.95, 1)),
+            ('net_profit', 'Net Profit', (1, 0.6, 0, 1)),
+            ('avg_sale', 'Avg Order', (0.61, 0.15, 0.69, 1))
         ]
         
-        for title, value, color in stats:
-            card = BoxLayout(orientation='vertical', padding=15, spacing=5)
-            
-            with card.canvas.before:
-                Color(1, 1, 1, 1)
-                card.rect = RoundedRectangle(pos=card.pos, size=card.size, radius=[12])
-            card.bind(pos=lambda *args, c=card: setattr(c.rect, 'pos', c.pos))
-            card.bind(size=lambda *args, c=card: setattr(c.rect, 'size', c.size))
-            
-            card.add_widget(Label(text=title, color=(0.5, 0.5, 0.5, 1), font_size='14sp'))
-            card.add_widget(Label(text=f'[b]{value}[/b]', markup=True,
-                                 font_size='26sp', color=color))
-            stats_grid.add_widget(card)
+        self.stat_cards = {}
+        for key, title, color in stats:
+            self.stat_cards[key] = StatCard(title=title, value=f'[b]{PLACEHOLDER}[/b]',
+                                            value_color=color, padding=15, spacing=5)
+            stats_grid.add_widget(self.stat_cards[key])
         
         layout.add_widget(stats_grid)
         
@@ -598,59 +1205,285 @@ class ReportsScreen(Screen):
                                color=(0.2, 0.2, 0.2, 1)))
         
         scroll = ScrollView(size_hint_y=0.42)
-        content = GridLayout(cols=1, spacing=8, size_hint_y=None, padding=5)
-        content.bind(minimum_height=content.setter('height'))
+        self.recent_layout = GridLayout(cols=1, spacing=8, size_hint_y=None, padding=5)
+        self.recent_layout.bind(minimum_height=self.recent_layout.setter('height'))
+        self.recent_layout.add_widget(Label(text='Loading…', color=(0.6, 0.6, 0.6, 1),
+                                            font_size='16sp', size_hint_y=None, height=80))
+        
+        scroll.add_widget(self.recent_layout)
+        layout.add_widget(scroll)
+        self.add_widget(layout)
+        
+        self.db.get_summary(callback=self.show_summary)
+        self.db.get_sales(limit=self.RECENT_SALES, callback=self.show_recent_sales)
+    
+    @instrumented
+    def show_summary(self, summary):
+        self.summary = summary
+        for key, card in self.stat_cards.items():
+            value = summary[key]
+            text = str(value) if key == 'sale_count' else f'${value:.2f}'
+            card.value = f'[b]{text}[/b]'
+    
+    def on_change(self, event):
+        # Changes made before a query was answered are already in its result
+        if self.summary is not None:
+            if apply_to_summary(self.summary, event):
+                self.show_summary(self.summary)
+            else:
+                self.db.get_summary(callback=self.show_summary)
+        if event.table != 'sales' or self.recent_sales is None:
+            return
+        if event.kind == 'insert':
+            self.add_recent_sale(event.row)
+        elif event.kind == 'reload':
+            self.db.get_sales(limit=self.RECENT_SALES, callback=self.show_recent_sales)
+    
+    def clear_recent(self):
+        # Rows go back to the pool; the loading/empty message is just dropped
+        for child in list(self.recent_layout.children):
+            if isinstance(child, SaleRow):
+                self.row_pool.release(child)
+        self.recent_layout.clear_widgets()
+    
+    @instrumented
+    def show_recent_sales(self, sales):
+        content = self.recent_layout
+        frame_budget.cancel(self)
+        self.clear_recent()
+        self.recent_sales = list(sales)
         
         if not sales:
+            self.recent_pending = []
             content.add_widget(Label(text='No sales yet', color=(0.6, 0.6, 0.6, 1),
                                     font_size='16sp', size_hint_y=None, height=80))
+            return
+        
+        # The rows in view now, the rest through frame_budget
+        shown = screenful(self.RECENT_ROW_PITCH)
+        for sale in sales[:shown]:
+            content.add_widget(self.sale_row(sale))
+        self.recent_pending = list(sales[shown:])
+        self.resume_recent()
+    
+    def fill_recent(self):
+        while self.recent_pending:
+            self.recent_layout.add_widget(self.sale_row(self.recent_pending.pop(0)))
+            yield
+    
+    def resume_recent(self):
+        if (self.recent_pending and self.get_root_window() is not None
+                and not frame_budget.pending(self)):
+            frame_budget.schedule(self, self.fill_recent())
+    
+    def on_enter(self, *args):
+        self.resume_recent()
+    
+    def on_leave(self, *args):
+        frame_budget.cancel(self)
+    
+    def add_recent_sale(self, sale):
+        # New sales go on top; the oldest row drops off the bottom
+        content = self.recent_layout
+        if not self.recent_sales:
+            self.clear_recent()
+        self.recent_sales.insert(0, sale)
+        content.add_widget(self.sale_row(sale), index=len(content.children))
+        if len(self.recent_sales) > self.RECENT_SALES:
+            self.recent_sales.pop()
+            if self.recent_pending:
+                # The oldest sale hadn't been added yet
+                self.recent_pending.pop()
+            else:
+                self.row_pool.release(content.children[0])
+    
+    def export_data(self, instance):
+        if self.export_btn.disabled:
+            return
+        self.export_btn.disabled = True
+        self.export_btn.text = 'Exporting…'
+        export_dir = Path(self.db.sync.db_path).parent / 'exports'
+        # Own thread and reader connection rather than the db worker, so a
+        # long export doesn't hold up the queries behind it
+        threading.Thread(target=self.run_export, args=(export_dir,), name='export',
+                         daemon=True).start()
+    
+    def run_export(self, export_dir):
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        written = {}
+        try:
+            # Inside the try, so a broken install still re-enables the button
+            from jetstar_pos_io import export_table
+            export_dir.mkdir(parents=True, exist_ok=True)
+            for table in ('sales', 'sale_items', 'expenses', 'stock'):
+                written[table] = export_table(self.db.sync, table,
+                                              export_dir / f'{table}-{stamp}.csv')
+        except Exception as e:
+            Logger.error('Export: failed: %r', e)
+            on_ui_thread(partial(self.on_export_done, export_dir, None))
         else:
-            for sale in sales[:10]:
-                item = BoxLayout(size_hint_y=None, height=60, padding=12, spacing=10)
-                
-                with item.canvas.before:
-                    Color(0.97, 0.97, 0.97, 1)
-                    item.rect = RoundedRectangle(pos=item.pos, size=item.size, radius=[8])
-                item.bind(pos=lambda *args, i=item: setattr(i.rect, 'pos', i.pos))
-                item.bind(size=lambda *args, i=item: setattr(i.rect, 'size', i.size))
-                
-                ref = str(sale.get('reference', 'N/A'))
-                date = str(sale.get('date', ''))
-                amt = float(sale.get('amount', 0))
-                
-                info = Label(text=f'[b]{ref}[/b]\n{date}', markup=True,
-                            color=(0.2, 0.2, 0.2, 1), font_size='13sp',
-                            halign='left', valign='middle')
-                info.bind(size=info.setter('text_size'))
-                
-                amt_label = Label(text=f'[b]${amt:.2f}[/b]', markup=True,
-                                 color=(0.3, 0.69, 0.31, 1), size_hint_x=0.3,
-                                 font_size='16sp')
-                
-                item.add_widget(info)
-                item.add_widget(amt_label)
-                content.add_widget(item)
-        
-        scroll.add_widget(content)
-        layout.add_widget(scroll)
-        self.add_widget(layout)
+            on_ui_thread(partial(self.on_export_done, export_dir, written))
+        finally:
+            self.db.sync.release_reader()
+    
+    def on_export_done(self, export_dir, written):
+        self.export_btn.disabled = False
+        self.export_btn.text = 'Export CSV'
+        if written is None:
+            message = 'Export failed. See the log for details.'
+        else:
+            counts = '\n'.join(f'{table}: {rows} rows' for table, rows in written.items())
+            message = f'{counts}\n\nSaved to {export_dir}'
+        text = Label(text=message, halign='center', valign='middle')
+        text.bind(size=text.setter('text_size'))
+        Popup(title='Export', content=text, size_hint=(0.8, 0.5)).open()
+    
+    def sale_row(self, sale):
+        amt = sale['amount'] or 0
+        return self.row_pool.acquire(title=f"[b]{sale['reference'] or 'N/A'}[/b]\n{sale['date']}",
+                                     detail=f'[b]${amt:.2f}[/b]')
+
+
+class LazyScreenManager(ScreenManager):
+    """ScreenManager that builds each screen the first time it is needed.
+    
+    ``factories`` maps screen names to callables taking ``name=``; setting
+    ``current`` to a name that has not been built yet constructs it.
+    """
+    
+    def __init__(self, factories, **kwargs):
+        self.factories = dict(factories)
+        super().__init__(**kwargs)
+    
+    def get_screen(self, name):
+        if name in self.factories and not self.has_screen(name):
+            self.add_widget(self.factories[name](name=name))
+        return super().get_screen(name)
+    
+    def prewarm(self, names=None):
+        # Build the remaining screens in frame_budget steps, one screen per
+        # step, skipping any the user has opened meanwhile
+        frame_budget.schedule(self, (self.get_screen(name) for name in list(names or self.factories)
+                                     if not self.has_screen(name)))
 
 
 class JetstarPOSApp(App):
+    def build_config(self, config):
+        # 'wal' (default) or 'legacy' single-connection rollback journal.
+        # backend 'shared' uses the store database served by
+        # jetstar_pos_server.py at server (host or host:port) instead
+        config.setdefaults('storage', {'mode': 'wal', 'backend': 'local', 'server': ''})
+        # 1 = build the other screens in the idle frames after the dashboard shows
+        config.setdefaults('performance', {'prewarm_screens': 0})
+        # Head-office URL; sync stays off while it is empty
+        config.setdefaults('sync', {'server_url': '', 'interval': 300})
+        # 1 = time queries, screen builds and frames; snapshot to perf.log
+        # every log_interval seconds and show the overlay on F12/triple-tap
+        config.setdefaults('debug', {'instrumentation': 0, 'log_interval': 60})
+    
     def build(self):
         self.title = 'JETSTAR POS - Mobile'
         Window.size = (800, 600)  # Good for desktop testing
+        self.startup = {'import_ms': (IMPORT_DONE - STARTUP_T0) * 1000}
         
-        self.db = Database()
+        start = time.perf_counter()
+        if self.config.get('storage', 'backend') == 'shared':
+            # Imported only when configured, to keep it out of cold start
+            from jetstar_pos_server import RemoteDatabase
+            self.db = RemoteDatabase.from_address(self.config.get('storage', 'server'))
+        else:
+            self.db = Database(mode=self.config.get('storage', 'mode'))
+        self.startup['db_open_ms'] = (time.perf_counter() - start) * 1000
+        self.debug = None
+        self.debug_overlay = None
+        screen_db = self.db
+        if self.config.getboolean('debug', 'instrumentation'):
+            self.debug = DebugStats(Path(self.db.db_path).parent / 'perf.log').start(
+                self.config.getint('debug', 'log_interval'))
+            screen_db = TracingDatabase(self.db, self.debug.queries)
+            Window.bind(on_keyboard=self.on_keyboard)
+        # Screens only talk to the database through the background worker
+        self.async_db = AsyncDatabase(screen_db, dispatch=on_ui_thread)
+        self.sync_worker = None
+        server_url = self.config.get('sync', 'server_url').strip()
+        # A shared store database is synced by its server, not by each register
+        if server_url and self.db.mode != 'shared':
+            # Imported only when configured, to keep it out of cold start
+            from jetstar_pos_sync import SyncClient, SyncWorker
+            self.sync_worker = SyncWorker(self.db, SyncClient(self.db, server_url),
+                                          interval=self.config.getint('sync', 'interval')).start()
         
-        sm = ScreenManager()
-        sm.add_widget(DashboardScreen(self.db, name='dashboard'))
-        sm.add_widget(SellScreen(self.db, name='sell'))
-        sm.add_widget(StockScreen(self.db, name='stock'))
-        sm.add_widget(ExpensesScreen(self.db, name='expenses'))
-        sm.add_widget(ReportsScreen(self.db, name='reports'))
+        screens = {
+            'dashboard': DashboardScreen,
+            'sell': SellScreen,
+            'stock': StockScreen,
+            'expenses': ExpensesScreen,
+            'reports': ReportsScreen
+        }
+        sm = LazyScreenManager({name: partial(cls, self.async_db)
+                                for name, cls in screens.items()})
+        sm.current = 'dashboard'
+        self.startup['build_ms'] = (time.perf_counter() - STARTUP_T0) * 1000
         
         return sm
+    
+    def on_start(self):
+        # A 0 timeout fires after the next frame has been drawn
+        Clock.schedule_once(self.on_first_frame, 0)
+    
+    def on_first_frame(self, dt):
+        self.startup['first_frame_ms'] = (time.perf_counter() - STARTUP_T0) * 1000
+        self.write_startup_report()
+        if self.config.getboolean('performance', 'prewarm_screens'):
+            self.root.prewarm()
+    
+    def write_startup_report(self):
+        report = dict(self.startup, date=datetime.now().isoformat(timespec='seconds'),
+                      storage_mode=self.db.mode)
+        Logger.info('Startup: import %.0f ms, db open %.0f ms, build %.0f ms, first frame %.0f ms',
+                    report['import_ms'], report['db_open_ms'], report['build_ms'],
+                    report['first_frame_ms'])
+        # Keep the last STARTUP_HISTORY runs so regressions show up across releases
+        path = Path(self.db.db_path).parent / 'startup.jsonl'
+        try:
+            lines = path.read_text().splitlines()[-(STARTUP_HISTORY - 1):] if path.exists() else []
+            lines.append(json.dumps(report, sort_keys=True))
+            path.write_text('\n'.join(lines) + '\n')
+        except OSError as e:
+            Logger.warning('Startup: could not write %s: %s', path, e)
+    
+    def on_keyboard(self, window, key, *args):
+        if key == OVERLAY_KEY:
+            self.toggle_debug_overlay()
+            return True
+        return False
+    
+    def toggle_debug_overlay(self):
+        if self.debug is None:
+            return
+        if self.debug_overlay is None:
+            self.debug_overlay = DebugOverlay()
+            self.refresh_overlay()
+            self.overlay_refresh = Clock.schedule_interval(self.refresh_overlay, 1)
+            Window.add_widget(self.debug_overlay)
+        else:
+            self.overlay_refresh.cancel()
+            Window.remove_widget(self.debug_overlay)
+            self.debug_overlay = None
+    
+    def refresh_overlay(self, *args):
+        self.debug_overlay.text = self.debug.overlay_text()
+    
+    def on_stop(self):
+        Logger.info('Catalog: cache %s', self.db.catalog.stats())
+        if self.debug is not None:
+            self.debug.write_log()
+        if self.root.has_screen('sell'):
+            Logger.info('Scan: latency %s', self.root.get_screen('sell').scan_stats())
+        if self.sync_worker is not None:
+            self.sync_worker.stop(timeout=5)
+        self.async_db.stop()
+        self.db.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+JETSTAR POS - shared store database
+Lets several registers in one shop use the same database. A small asyncio
+server owns the SQLite file: writes go through one writer thread that
+commits them in batches, reads run on a pool of reader threads, and every
+committed change is pushed to all connected registers. RemoteDatabase is
+the register side and stands in for Database.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import socket
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+
+from jetstar_pos_db import CatalogCache, ChangeEvent, Database, Record
+
+logger = logging.getLogger('jetstar_pos.server')
+
+DEFAULT_PORT = 8766
+
+# Most writes committed in one transaction
+WRITE_BATCH = 64
+
+READ_THREADS = 4
+
+# Longest request or response line; a catalog load is the biggest
+MAX_LINE = 64 * 1024 * 1024
+
+# Database methods registers may call; anything else is refused. There is
+# no authentication, so meta (reference numbering, device id, sync state)
+# is not writable from the network
+READ_METHODS = frozenset({
+    'get_sales', 'get_expenses', 'get_customers', 'get_sale_items', 'search_stock',
+    'get_summary', 'get_sales_summary', 'get_expenses_summary', 'get_sales_breakdown',
+    'get_meta', 'outbox_size', 'catalog_rows',
+})
+WRITE_METHODS = frozenset({
+    'add_sale', 'add_expense', 'checkout', 'upsert_stock', 'stock_changed',
+})
+
+
+class RemoteError(Exception):
+    """The server ran the call and it raised; ``kind`` is the exception's
+    class name on the server."""
+
+    def __init__(self, kind, message):
+        super().__init__(f'{kind}: {message}')
+        self.kind = kind
+
+
+def plain(value):
+    # Rows are sent as JSON objects; registers get them back as dicts
+    if isinstance(value, Record):
+        return value._asdict()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def encode(message):
+    return json.dumps(message, separators=(',', ':'), default=plain).encode() + b'\n'
+
+
+class DatabaseServer:
+    """Serves one Database to registers over newline-delimited JSON.
+
+    A request is ``{"id", "method", "args", "kwargs"}`` and gets back
+    ``{"id", "result"}`` or ``{"id", "error": [kind, message]}``. Committed
+    changes are sent to every register as ``{"event": [kind, table, row]}``,
+    ahead of the replies to the writes that made them.
+    """
+
+    def __init__(self, db, read_threads=READ_THREADS, write_batch=WRITE_BATCH):
+        self.db = db
+        self.write_batch = write_batch
+        self.readers = ThreadPoolExecutor(read_threads, thread_name_prefix='reader')
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix='writer')
+        self.clients = set()
+        self.stats = {'reads': 0, 'writes': 0, 'batches': 0}
+        self.loop = None
+        self.writes = None
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self.loop = asyncio.get_running_loop()
+        self.writes = asyncio.Queue()
+        self.db.subscribe(self.on_change)
+        self.write_task = asyncio.create_task(self.write_loop())
+        self.server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+        return self.server
+
+    def close(self):
+        self.server.close()
+        self.write_task.cancel()
+        for writer in list(self.clients):
+            writer.close()
+        self.readers.shutdown()
+        self.writer.shutdown()
+
+    def on_change(self, event):
+        # Raised on the writer thread once a batch has committed
+        self.loop.call_soon_threadsafe(self.broadcast, encode({'event': list(event)}))
+
+    def broadcast(self, line):
+        for writer in list(self.clients):
+            if not writer.is_closing():
+                writer.write(line)
+
+    async def handle(self, reader, writer):
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.clients.add(writer)
+        # Requests are answered as they finish, so a slow report doesn't hold
+        # up a checkout sent after it on the same connection
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self.answer(writer, line))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except (ConnectionError, ValueError) as e:
+            logger.warning('Register %s dropped: %s', writer.get_extra_info('peername'), e)
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def answer(self, writer, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request['id']
+            method = request['method']
+            args, kwargs = request.get('args', []), request.get('kwargs', {})
+            if method in WRITE_METHODS:
+                future = self.loop.create_future()
+                await self.writes.put((future, method, args, kwargs))
+                result = await future
+            elif method in READ_METHODS:
+                result = await self.loop.run_in_executor(
+                    self.readers, partial(self.read, method, args, kwargs))
+            else:
+                raise AttributeError(f'no such method {method!r}')
+            reply = {'id': request_id, 'result': result}
+        except Exception as e:
+            reply = {'id': request_id, 'error': [type(e).__name__, str(e)]}
+        if not writer.is_closing():
+            writer.write(encode(reply))
+
+    def read(self, method, args, kwargs):
+        self.stats['reads'] += 1
+        if method == 'catalog_rows':
+            # Every stock row, for the register's own catalog cache
+            self.db.catalog.products()
+            return [dict(row) for row in self.db.catalog.by_id.values()]
+        return getattr(self.db, method)(*args, **kwargs)
+
+    async def write_loop(self):
+        # Whatever queued up while the last batch was committing goes into
+        # the next one, so batches grow with the load
+        while True:
+            jobs = [await self.writes.get()]
+            while len(jobs) < self.write_batch and not self.writes.empty():
+                jobs.append(self.writes.get_nowait())
+            try:
+                results = await self.loop.run_in_executor(self.writer, self.write, jobs)
+            except Exception as e:
+                logger.exception('Write batch of %d failed', len(jobs))
+                results = [(False, e)] * len(jobs)
+            for (future, *_), (ok, value) in zip(jobs, results):
+                if not future.done():
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+
+    def write(self, jobs):
+        results = []
+        with self.db.batch():
+            for _, method, args, kwargs in jobs:
+                try:
+                    results.append((True, getattr(self.db, method)(*args, **kwargs)))
+                except Exception as e:
+                    results.append((False, e))
+        self.stats['writes'] += len(jobs)
+        self.stats['batches'] += 1
+        return results
+
+
+class RemoteDatabase:
+    """Database stand-in for a register in shared mode.
+
+    Calls are sent to a DatabaseServer and block until answered; any number
+    of threads may call at once. Stock is served from a local CatalogCache
+    that the server's change events keep current, so browsing and scanning
+    never wait on the network. Connects on first use and reconnects after
+    the link drops, then reloads, since events may have been missed.
+    """
+
+    mode = 'shared'
+    page_key = staticmethod(Database.page_key)
+    subscribe = Database.subscribe
+    _unsubscribe = Database._unsubscribe
+    _publish = Database._publish
+    get_stock = Database.get_stock
+    get_product_by_sku = Database.get_product_by_sku
+    count_stock = Database.count_stock
+
+    def __init__(self, host, port=DEFAULT_PORT, timeout=10, data_dir=None):
+        self.address = (host, int(port))
+        self.timeout = timeout
+        # Nothing is stored here; the app keeps its logs and exports beside it
+        self.db_path = Path(data_dir or Path.home() / '.jetstarpos') / 'shared.db'
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sock = None
+        self._connections = 0
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._subscribers = []
+        # Checked by _publish for a batch in progress; a register never has one
+        self._local = threading.local()
+        self._stock_gen = 0
+        self._stock_events = 0
+        self.catalog = CatalogCache(self._load_stock, lambda: self._stock_gen)
+
+    @classmethod
+    def from_address(cls, address, **kwargs):
+        """From 'host' or 'host:port'."""
+        host, _, port = address.strip().partition(':')
+        return cls(host, int(port) if port else DEFAULT_PORT, **kwargs)
+
+    def __getattr__(self, name):
+        if name in READ_METHODS or name in WRITE_METHODS:
+            return partial(self._call, name)
+        raise AttributeError(f'{type(self).__name__} has no attribute {name!r}')
+
+    def _call(self, method, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            try:
+                self._sock.sendall(encode({'id': request_id, 'method': method,
+                                           'args': args, 'kwargs': kwargs}))
+            except OSError as e:
+                self._pending.pop(request_id, None)
+                self._sock.close()
+                raise ConnectionError(f'lost connection to {self.address}: {e}') from e
+        try:
+            return future.result(self.timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._connections += 1
+        threading.Thread(target=self._receive, args=(sock,), name='remote-db', daemon=True).start()
+        if self._connections > 1:
+            # Reconnected: whatever changed meanwhile was never announced
+            self._stock_gen += 1
+            for table in ('sales', 'expenses', 'stock'):
+                self._publish('reload', table)
+
+    def _receive(self, sock):
+        error = 'closed by server'
+        try:
+            with sock.makefile('rb') as stream:
+                for line in stream:
+                    message = json.loads(line)
+                    if 'event' in message:
+                        self._on_event(ChangeEvent(*message['event']))
+                        continue
+                    future = self._pending.get(message['id'])
+                    if future is None:
+                        continue
+                    if 'error' in message:
+                        future.set_exception(RemoteError(*message['error']))
+                    else:
+                        future.set_result(message['result'])
+        except Exception as e:
+            error = e
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f'lost connection to {self.address}: {error}'))
+
+    def _on_event(self, event):
+        if event.table == 'stock':
+            self._stock_events += 1
+            cached = self.catalog.by_id.get(event.row['id']) if event.kind == 'update' else None
+            if cached is not None:
+                cached.update(event.row)
+            else:
+                self._stock_gen += 1
+        self._publish(*event)
+
+    def _load_stock(self):
+        before = self._stock_events
+        rows = self._call('catalog_rows')
+        if self._stock_events != before:
+            # Stock changed while loading and the rows may predate it
+            self._stock_gen += 1
+        return rows
+
+    def release_reader(self):
+        pass
+
+    def close(self):
+        with self._lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
+
+
+async def serve(db, host, port, read_threads, write_batch):
+    server = DatabaseServer(db, read_threads, write_batch)
+    listener = await server.start(host, port)
+    logger.info('Serving %s on %s', db.db_path,
+                ', '.join(str(sock.getsockname()) for sock in listener.sockets))
+    try:
+        await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Shared JETSTAR POS store database server')
+    parser.add_argument('--db', required=True, help='store database file')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="address to listen on, e.g. the shop network's interface")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--readers', type=int, default=READ_THREADS)
+    parser.add_argument('--write-batch', type=int, default=WRITE_BATCH)
+    parser.add_argument('--sync-url', help='head-office server to sync the store database with')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    db = Database(args.db)
+    worker = None
+    if args.sync_url:
+        # The store syncs once for all its registers
+        from jetstar_pos_sync import SyncClient, SyncWorker
+        worker = SyncWorker(db, SyncClient(db, args.sync_url)).start()
+    try:
+        asyncio.run(serve(db, args.host, args.port, args.readers, args.write_batch))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if worker is not None:
+            worker.stop(timeout=5)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
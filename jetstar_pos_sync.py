@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+JETSTAR POS - head-office sync
+Pushes the outbox of local sales and expenses in gzipped batches and pulls
+stock and price changes, within a byte budget per sync. Includes a small
+HTTP stand-in for the head-office server, for local testing.
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError, URLError
+from urllib.parse import parse_qs, urlparse
+from urllib.request import Request, urlopen
+
+logger = logging.getLogger('jetstar_pos.sync')
+
+# Uncompressed outbox payload per push request
+SYNC_BATCH_BYTES = 64 * 1024
+
+# Compressed bytes sent plus received per sync; the rest waits for the next one
+SYNC_MAX_BYTES = 512 * 1024
+
+# Products per pull request
+PULL_ROWS = 500
+
+# No change's payload is smaller (an empty expense is ~100 bytes), so
+# reading batch_bytes // PUSH_MIN_PAYLOAD outbox rows always fills a batch
+PUSH_MIN_PAYLOAD = 64
+
+# Seconds between background syncs
+SYNC_INTERVAL = 300
+
+
+class SyncError(Exception):
+    pass
+
+
+class SyncClient:
+    """Replicates one device's Database with the head-office server.
+
+    Pushes are idempotent: each change carries its kind and key (the sale
+    reference for sales) and the server ignores keys it has already stored
+    for this device, so a batch whose acknowledgement was lost is simply
+    sent again. Outbox rows are deleted only once acknowledged.
+    """
+
+    def __init__(self, db, server_url, batch_bytes=SYNC_BATCH_BYTES, max_bytes=SYNC_MAX_BYTES,
+                 retries=3, backoff=1.0, timeout=15):
+        self.db = db
+        self.server_url = server_url.rstrip('/')
+        self.batch_bytes = batch_bytes
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def sync(self):
+        """One push then pull; returns counters for the log."""
+        stats = {'pushed': 0, 'pulled': 0, 'requests': 0, 'retries': 0,
+                 'bytes_sent': 0, 'bytes_received': 0, 'complete': True}
+        device = self.db.device_id()
+        # History from before sync existed, queued in chunks on first syncs
+        while self.db.backfill_outbox():
+            pass
+        self.push(device, stats)
+        if stats['complete']:
+            self.pull(device, stats)
+        stats['outbox'] = self.db.outbox_size()
+        return stats
+
+    def _budget_left(self, stats, next_request=0):
+        used = stats['bytes_sent'] + stats['bytes_received']
+        # The first request always goes out, however big, so sync can't stall
+        return not stats['requests'] or used + next_request <= self.max_bytes
+
+    def push(self, device, stats):
+        after = 0
+        # Enough rows to fill a batch, so batch_bytes rather than a row
+        # count decides where each push ends
+        limit = self.batch_bytes // PUSH_MIN_PAYLOAD + 1
+        while True:
+            entries = self.db.outbox_batch(after, limit=limit)
+            if not entries:
+                return
+            batch, size = [], 0
+            for entry in entries:
+                if batch and size + len(entry['payload']) > self.batch_bytes:
+                    break
+                batch.append(entry)
+                size += len(entry['payload'])
+            # Payloads are already JSON; splice them in rather than re-encoding
+            changes = ','.join(
+                f'{{"id":{entry["id"]},"kind":{json.dumps(entry["kind"])},'
+                f'"key":{json.dumps(entry["key"])},"data":{entry["payload"]}}}' for entry in batch)
+            body = gzip.compress(
+                f'{{"device":{json.dumps(device)},"changes":[{changes}]}}'.encode(), 6)
+            if not self._budget_left(stats, len(body)):
+                stats['complete'] = False
+                return
+            response = self._request('POST', '/sync/push', stats, body)
+            acked = [int(i) for i in response.get('acked', ())]
+            self.db.ack_outbox(acked)
+            stats['pushed'] += len(acked)
+            after = batch[-1]['id']
+
+    def pull(self, device, stats):
+        pulled = 0
+        try:
+            while self._budget_left(stats):
+                since = int(self.db.get_meta('stock_version', 0))
+                response = self._request(
+                    'GET', f'/sync/stock?since={since}&limit={PULL_ROWS}&device={device}', stats)
+                products = response.get('products', [])
+                if products:
+                    self.db.upsert_stock(products)
+                    pulled += len(products)
+                self.db.set_meta('stock_version', response.get('version', since))
+                if not response.get('more'):
+                    return
+            stats['complete'] = False
+        finally:
+            stats['pulled'] += pulled
+            if pulled:
+                self.db.stock_changed()
+
+    def _request(self, method, path, stats, body=None):
+        headers = {'Accept-Encoding': 'gzip', 'Accept': 'application/json'}
+        if body is not None:
+            headers.update({'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        for attempt in range(self.retries + 1):
+            if attempt:
+                stats['retries'] += 1
+                # Exponential backoff with jitter so a fleet doesn't retry in step
+                time.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            stats['requests'] += 1
+            stats['bytes_sent'] += len(body or b'')
+            try:
+                request = Request(self.server_url + path, data=body, headers=headers, method=method)
+                with urlopen(request, timeout=self.timeout) as response:
+                    raw = response.read()
+                    encoding = response.headers.get('Content-Encoding')
+            except HTTPError as e:
+                if e.code < 500:
+                    raise SyncError(f'{method} {path} rejected: HTTP {e.code}') from e
+                error = e
+            except (URLError, OSError) as e:
+                error = e
+            else:
+                stats['bytes_received'] += len(raw)
+                if encoding == 'gzip':
+                    raw = gzip.decompress(raw)
+                return json.loads(raw)
+            logger.warning('Sync: %s %s failed (attempt %d): %s', method, path, attempt + 1, error)
+        raise SyncError(f'{method} {path} failed after {self.retries + 1} attempts: {error}')
+
+
+class SyncWorker:
+    """Runs SyncClient.sync on its own thread every ``interval`` seconds,
+    and straight away when sync_now() is called."""
+
+    def __init__(self, db, client, interval=SYNC_INTERVAL):
+        self.db = db
+        self.client = client
+        self.interval = interval
+        self.last_stats = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sync', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def sync_now(self):
+        self._wake.set()
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                try:
+                    self.last_stats = self.client.sync()
+                    logger.info('Sync: %s', self.last_stats)
+                except SyncError as e:
+                    logger.warning('Sync: %s', e)
+                except Exception:
+                    logger.exception('Sync: failed')
+                self._wake.wait(self.interval)
+                self._wake.clear()
+        finally:
+            self.db.release_reader()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+
+class SyncStore:
+    """In-memory head office for the stand-in server."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.changes = {}
+        self.duplicates = 0
+        self.version = 0
+        self.products = {}
+
+    def apply(self, device, changes):
+        acked = []
+        with self.lock:
+            for change in changes:
+                key = (device, change['kind'], change['key'])
+                if key in self.changes:
+                    self.duplicates += 1
+                else:
+                    self.changes[key] = change['data']
+                acked.append(change['id'])
+        return acked
+
+    def put_products(self, products):
+        with self.lock:
+            for product in products:
+                self.version += 1
+                self.products[product['sku']] = (self.version, dict(product))
+
+    def products_since(self, since, limit):
+        with self.lock:
+            newer = sorted((version, product) for version, product in self.products.values()
+                           if version > since)
+        page = newer[:limit]
+        version = page[-1][0] if page else max(since, 0)
+        return {'version': version, 'products': [product for _, product in page],
+                'more': len(newer) > limit}
+
+    def status(self):
+        with self.lock:
+            kinds = {}
+            for _, kind, _ in self.changes:
+                kinds[kind] = kinds.get(kind, 0) + 1
+            return {'changes': kinds, 'duplicates': self.duplicates,
+                    'products': len(self.products), 'version': self.version}
+
+
+class SyncRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug('Server: ' + format, *args)
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, separators=(',', ':')).encode()
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            body = gzip.compress(body, 6)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _flaky(self):
+        # Simulated outage for exercising the client's retries
+        if random.random() < self.server.fail_rate:
+            self._reply(503, {'error': 'simulated outage'})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/sync/status':
+            self._reply(200, self.server.store.status())
+        elif url.path == '/sync/stock':
+            if self._flaky():
+                return
+            since = int(query.get('since', ['0'])[0])
+            limit = min(int(query.get('limit', [str(PULL_ROWS)])[0]), 5000)
+            self._reply(200, self.server.store.products_since(since, limit))
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self._reply(400, {'error': 'invalid JSON'})
+            return
+        if self.path == '/sync/push':
+            if self._flaky():
+                return
+            acked = self.server.store.apply(payload['device'], payload['changes'])
+            self._reply(200, {'acked': acked})
+        elif self.path == '/sync/stock':
+            self.server.store.put_products(payload['products'])
+            self._reply(200, {'version': self.server.store.version})
+        else:
+            self._reply(404, {'error': 'not found'})
+
+
+def make_server(host='127.0.0.1', port=8765, store=None, fail_rate=0.0):
+    """Stand-in head office; call serve_forever() (e.g. on a thread)."""
+    server = ThreadingHTTPServer((host, port), SyncRequestHandler)
+    server.daemon_threads = True
+    server.store = store or SyncStore()
+    server.fail_rate = fail_rate
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stand-in JETSTAR POS head-office sync server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--stock', help='.csv/.jsonl/.json catalog to offer to devices')
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='fraction of sync requests answered with HTTP 503')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    server = make_server(args.host, args.port, fail_rate=args.fail_rate)
+    if args.stock:
+        from jetstar_pos_io import read_stock_file, validate_stock_row
+        products = []
+        for line, raw in read_stock_file(args.stock):
+            try:
+                products.append(validate_stock_row(raw))
+            except ValueError as e:
+                logger.warning('Stock line %s skipped: %s', line, e)
+        server.store.put_products(products)
+    logger.info('Serving on http://%s:%d (%d products)', args.host, args.port,
+                len(server.store.products))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
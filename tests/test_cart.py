@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+The sell screen's Cart: lines merged by product id, positions kept in step
+as lines are removed, and the running total.
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Keep Kivy from reading the test runner's arguments
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from jetstar_pos_mobile import Cart  # noqa: E402
+
+
+def product(product_id, price=1.0):
+    return {'id': product_id, 'name': f'Product {product_id}', 'selling_price': price}
+
+
+class CartTest(unittest.TestCase):
+    def setUp(self):
+        self.cart = Cart()
+        for product_id, price in ((10, 1.5), (20, 2.0), (30, 0.25), (40, 4.0)):
+            self.cart.add(product(product_id, price))
+
+    def assertPositions(self):
+        expected = {product_id: index for index, product_id in enumerate(self.cart.order)}
+        self.assertEqual(self.cart.positions, expected)
+
+    def test_adding_a_product_again_merges_its_line(self):
+        index, line, created = self.cart.add(product(30, 0.25), qty=3)
+        self.assertEqual((index, line['qty'], created), (2, 4, False))
+        self.assertEqual(len(self.cart), 4)
+        self.assertEqual([line['id'] for line in self.cart], [10, 20, 30, 40])
+        self.assertAlmostEqual(self.cart.total, 8.5)
+
+        index, line, created = self.cart.add(product(50, 1.0))
+        self.assertEqual((index, line['qty'], created), (4, 1, True))
+        self.assertPositions()
+
+    def test_removing_a_line_moves_later_lines_up(self):
+        self.assertEqual(self.cart.remove(20), 1)
+        self.assertEqual(self.cart.order, [10, 30, 40])
+        self.assertPositions()
+        self.assertAlmostEqual(self.cart.total, 5.75)
+        self.assertIsNone(self.cart.remove(20))
+
+        # A later add lands on the right line after the shift
+        index, line, created = self.cart.add(product(40, 4.0))
+        self.assertEqual((index, line['qty'], created), (2, 2, False))
+        self.assertEqual(self.cart.remove(10), 0)
+        self.assertEqual(self.cart.remove(40), 1)
+        self.assertPositions()
+
+    def test_emptied_cart_totals_exactly_zero(self):
+        for product_id in (30, 10, 40, 20):
+            self.cart.remove(product_id)
+        self.assertEqual((len(self.cart), self.cart.positions, self.cart.total), (0, {}, 0.0))
+        self.cart.add(product(20, 2.0))
+        self.cart.clear()
+        self.assertEqual((self.cart.lines, self.cart.order, self.cart.total), ({}, [], 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Database: atomic checkout, sale references, schema migrations, the rollup
+tables behind the reports, and archiving closed months.
+
+    python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from contextlib import closing
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from jetstar_pos_db import ROLLUPS, SCHEMA_VERSION, Database, ReferenceAllocator  # noqa: E402
+
+
+def rollup_rows(db):
+    # Rounded, as moving rows out and back in can leave float noise
+    return {rollup: [tuple(row[:-2]) + (round(row[-2], 6), row[-1])
+                     for row in db.conn.execute(f'SELECT * FROM {rollup} ORDER BY 1, 2')]
+            for rollup in ROLLUPS}
+
+
+class DatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = Path(self.tmp) / 'mobile.db'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def database(self, **kwargs):
+        db = Database(self.path, **kwargs)
+        self.addCleanup(db.close)
+        return db
+
+class CheckoutTest(DatabaseTest):
+    def setUp(self):
+        super().setUp()
+        self.db = self.database()
+        self.db.upsert_stock([
+            {'name': 'Bread', 'sku': 'B1', 'quantity': 10, 'selling_price': 1.5},
+            {'name': 'Milk', 'sku': 'M1', 'quantity': 3, 'selling_price': 0.8},
+            {'name': 'Delivery', 'sku': 'D1', 'type': 'service', 'quantity': 0, 'selling_price': 5},
+        ])
+        self.ids = {row['sku']: row['id'] for row in self.db.conn.execute('SELECT id, sku FROM stock')}
+
+    def line(self, sku, qty, price=1.0):
+        return {'id': self.ids[sku], 'name': sku, 'price': price, 'qty': qty}
+
+    def quantities(self):
+        return {row['sku']: row['quantity'] for row in self.db.conn.execute('SELECT sku, quantity FROM stock')}
+
+    def test_writes_items_and_decrements_stock(self):
+        sale_id = self.db.checkout('R-1', '2025-06-01', [
+            self.line('B1', 2, 1.5), self.line('M1', 3, 0.8), self.line('D1', 1, 5.0)])
+        sale = self.db.conn.execute('SELECT reference, amount FROM sales WHERE id = ?', (sale_id,)).fetchone()
+        self.assertEqual((sale[0], round(sale[1], 6)), ('R-1', 10.4))
+        items = self.db.conn.execute('SELECT stock_id, quantity, unit_price, line_total FROM sale_items '
+                                     'WHERE sale_id = ? ORDER BY stock_id', (sale_id,))
+        self.assertEqual([tuple(row) for row in items], [(self.ids['B1'], 2, 1.5, 3.0),
+                                                         (self.ids['M1'], 3, 0.8, 2.4),
+                                                         (self.ids['D1'], 1, 5.0, 5.0)])
+        # Services are sold without stock
+        self.assertEqual(self.quantities(), {'B1': 8, 'M1': 0, 'D1': -1})
+
+    def test_insufficient_stock_rolls_back(self):
+        self.db.checkout('R-1', '2025-06-01', [self.line('M1', 2)])
+        before = rollup_rows(self.db)
+        with self.assertRaisesRegex(ValueError, 'Milk'):
+            self.db.checkout('R-2', '2025-06-01', [self.line('B1', 4), self.line('M1', 2)])
+        self.assertEqual(self.db.conn.execute('SELECT COUNT(*) FROM sales').fetchone()[0], 1)
+        self.assertEqual(self.db.conn.execute('SELECT COUNT(*) FROM sale_items').fetchone()[0], 1)
+        self.assertEqual(self.quantities(), {'B1': 10, 'M1': 1, 'D1': 0})
+        self.assertEqual(rollup_rows(self.db), before)
+        self.assertEqual(self.db.outbox_size(), 1)
+        # The rest of the cart still sells
+        self.db.checkout('R-2', '2025-06-01', [self.line('B1', 4), self.line('M1', 1)])
+        self.assertEqual(self.quantities(), {'B1': 6, 'M1': 0, 'D1': 0})
+
+
+class ReferenceTest(DatabaseTest):
+    def numbers(self, db, count):
+        return [int(db.references.next().rsplit('-', 1)[1]) for _ in range(count)]
+
+    def test_blocks_are_reserved_across_restarts(self):
+        db = self.database()
+        db.references = ReferenceAllocator(db, block=10)
+        self.assertEqual(self.numbers(db, 3), [1, 2, 3])
+        # The whole block is reserved by the first reference
+        self.assertEqual(int(db.get_meta('reference_next')), 11)
+        self.assertEqual(self.numbers(db, 8), [4, 5, 6, 7, 8, 9, 10, 11])
+        self.assertEqual(int(db.get_meta('reference_next')), 21)
+        prefix = db.references.prefix
+        db.close()
+
+        # The rest of the block is skipped, never handed out again
+        db = self.database()
+        db.references = ReferenceAllocator(db, block=10)
+        self.assertEqual(self.numbers(db, 2), [21, 22])
+        self.assertEqual(db.references.prefix, prefix)
+        self.assertEqual(int(db.get_meta('reference_next')), 31)
+
+    def test_starts_after_references_already_sold(self):
+        db = self.database()
+        reference = db.references.next()
+        db.add_sale(reference, '2025-06-01', None, 1.0, 'Cash')
+        db.add_sale(f'{db.references.prefix}-00005000', '2025-06-01', None, 1.0, 'Cash')
+        # As if the meta row came from an older backup than the sales
+        db.set_meta('reference_next', 1)
+        db.close()
+
+        db = self.database()
+        self.assertEqual(db.references.next(), f'{db.references.prefix}-00005001')
+
+
+
+class MigrationTest(DatabaseTest):
+    def setUp(self):
+        super().setUp()
+        # East of UTC, so a local hour never equals its UTC hour
+        self.tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'Africa/Nairobi'
+        time.tzset()
+
+    def tearDown(self):
+        if self.tz is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = self.tz
+        time.tzset()
+        super().tearDown()
+
+    def test_upgrade_from_baseline_matches_rebuild(self):
+        db = self.database(migrate=False)
+        self.assertEqual(db.schema_version, 0)
+        db.conn.executemany('INSERT INTO sales (reference, date, amount, payment_method, created_at) '
+                            'VALUES (?, ?, ?, ?, ?)', [
+                                ('A', '2025-06-01', 100.0, 'Cash', '2025-06-01 09:00:00'),
+                                ('B', '2025-06-01', -50.0, 'Cash', '2025-06-01 09:20:00'),
+                                ('C', '2025-06-01', 12.5, 'Card', '2025-06-01 18:45:00'),
+                                ('D', '2025-06-02', 7.0, 'Cash', '2025-06-01 22:30:00'),
+                            ])
+        db.conn.execute("INSERT INTO expenses (date, category, description, amount) "
+                        "VALUES ('2025-06-01', 'Rent', 'June', 300)")
+        db.conn.commit()
+
+        self.assertEqual(db.migrate(), SCHEMA_VERSION)
+        migrated = rollup_rows(db)
+        db.rebuild_rollups()
+        self.assertEqual(migrated, rollup_rows(db))
+        self.assertEqual(migrated['sales_hourly'], [('2025-06-01', 12, 50.0, 2),
+                                                    ('2025-06-01', 21, 12.5, 1),
+                                                    ('2025-06-02', 1, 7.0, 1)])
+
+    def test_triggers_use_the_local_hour(self):
+        db = self.database()
+        db.add_sale('A', '2025-06-01', None, 20.0, 'Cash')
+        db.conn.execute("UPDATE sales SET created_at = '2025-06-01 06:15:00'")
+        db.conn.commit()
+        hours = db.get_sales_breakdown('hour')
+        self.assertEqual([(row['hour'], row['total'], row['count']) for row in hours], [(9, 20.0, 1)])
+
+
+class ArchiveTest(DatabaseTest):
+    TODAY = date(2025, 6, 15)
+    # With 2 months kept, January to March are archived
+    ARCHIVED = ('2025-01', '2025-02', '2025-03')
+
+    def setUp(self):
+        super().setUp()
+        db = Database(self.path)
+        db.upsert_stock([{'name': 'Product', 'sku': 'P1', 'quantity': 10 ** 6, 'selling_price': 2.5}])
+        for month in range(1, 7):
+            for day in range(1, 6):
+                db.checkout(f'S-{month}-{day}', f'2025-{month:02d}-{day * 5:02d}',
+                            [{'id': 1, 'name': 'Product', 'price': 2.5, 'qty': day}])
+            db.add_expense(f'2025-{month:02d}-10', 'Rent', f'Month {month}', 100 + month)
+        db.close()
+
+    def live_count(self, db, table, before='2025-04-01'):
+        return db.conn.execute(f'SELECT COUNT(*) FROM {table} WHERE date < ?', (before,)).fetchone()[0]
+
+    def test_run_killed_after_copy_is_finished_by_next_run(self):
+        # Dies inside the delete transaction, after the copy has committed
+        script = '\n'.join([
+            'import os, sys',
+            f'sys.path.insert(0, {str(ROOT)!r})',
+            'from datetime import date',
+            'import jetstar_pos_db',
+            'jetstar_pos_db.add_to_rollups = lambda cursor, totals: os._exit(9)',
+            f'db = jetstar_pos_db.Database({str(self.path)!r})',
+            f'db.archive(2, today=date.fromisoformat({self.TODAY.isoformat()!r}))',
+        ])
+        killed = subprocess.run([sys.executable, '-c', script])
+        self.assertEqual(killed.returncode, 9)
+
+        db = self.database()
+        before = rollup_rows(db)
+        # First month copied, but still live as well
+        [first] = db.archive_files()
+        with closing(sqlite3.connect(first)) as archived:
+            self.assertEqual(archived.execute('SELECT COUNT(*) FROM sales').fetchone()[0], 5)
+        self.assertEqual(self.live_count(db, 'sales'), 15)
+
+        moved = db.archive(2, today=self.TODAY)
+        self.assertEqual(sorted(moved), list(self.ARCHIVED))
+        self.assertEqual(self.live_count(db, 'sales'), 0)
+        self.assertEqual(self.live_count(db, 'expenses'), 0)
+        self.assertEqual(sum(1 for _ in db.iter_records('sales')), 30)
+        self.assertEqual(sum(1 for _ in db.iter_records('sale_items')), 30)
+        self.assertEqual(rollup_rows(db), before)
+
+    def test_rollups_and_summaries_unchanged(self):
+        db = self.database()
+        rollups = rollup_rows(db)
+        summary = db.get_summary()
+        march = db.get_summary('2025-03-01', '2025-03-31')
+
+        moved = db.archive(2, today=self.TODAY)
+        self.assertEqual(moved, {month: (5, 1) for month in self.ARCHIVED})
+        self.assertEqual(rollup_rows(db), rollups)
+        self.assertEqual(db.get_summary(), summary)
+        self.assertEqual(db.get_summary('2025-03-01', '2025-03-31'), march)
+        # Rebuilding reads the archive files back in
+        db.rebuild_rollups()
+        self.assertEqual(rollup_rows(db), rollups)
+        # Nothing left to move
+        self.assertEqual(db.archive(2, today=self.TODAY), {})
+
+    def test_exports_see_archived_months(self):
+        db = self.database()
+        expected = {table: [tuple(row) for row in db.export_cursor(table)]
+                    for table in ('sales', 'sale_items', 'expenses')}
+        db.archive(2, today=self.TODAY)
+        self.assertEqual(len(db.archive_files()), 3)
+        for table, rows in expected.items():
+            exported = [tuple(row) for cursor in db.export_cursors(table) for row in cursor]
+            self.assertEqual(sorted(exported), sorted(rows), table)
+
+        february = [sale.reference for sale in db.iter_records('sales', '2025-02-01', '2025-02-28')]
+        self.assertEqual(sorted(february), [f'S-2-{day}' for day in range(1, 6)])
+        # Straddling the cutoff: March from its archive, April from main
+        spring = {sale.date[:7] for sale in db.iter_records('sales', '2025-03-20', '2025-04-10')}
+        self.assertEqual(spring, {'2025-03', '2025-04'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+RemoteDatabase registers against a DatabaseServer on a background event
+loop: calls and their errors, change events, refused methods, and
+reconnecting after the link drops.
+
+    python -m unittest discover tests
+"""
+
+import asyncio
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jetstar_pos_db import Database  # noqa: E402
+from jetstar_pos_server import DatabaseServer, RemoteDatabase, RemoteError  # noqa: E402
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out waiting')
+        time.sleep(0.01)
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = Database(Path(self.tmp) / 'store.db')
+        self.db.upsert_stock({'name': f'Product {i}', 'sku': f'P{i}', 'quantity': 100,
+                              'selling_price': 1.5} for i in range(20))
+        self.db.stock_changed()
+        self.server = DatabaseServer(self.db)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        listener = asyncio.run_coroutine_threadsafe(
+            self.server.start('127.0.0.1', 0), self.loop).result(5)
+        self.port = listener.sockets[0].getsockname()[1]
+        self.registers = []
+
+    def tearDown(self):
+        for register in self.registers:
+            register.close()
+        self.loop.call_soon_threadsafe(self.server.close)
+        # Lets the connection handlers see their registers go
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+        self.db.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def register(self):
+        register = RemoteDatabase('127.0.0.1', self.port, timeout=5, data_dir=self.tmp)
+        self.registers.append(register)
+        return register
+
+    def sell(self, register, sku='P3', qty=2, reference=None):
+        product = register.get_product_by_sku(sku)
+        return register.checkout(reference, '2025-06-01', [
+            {'id': product['id'], 'name': product['name'], 'price': 1.5, 'qty': qty}])
+
+    def test_calls_round_trip(self):
+        register = self.register()
+        self.assertEqual(register.count_stock(), 20)
+        sale_id = self.sell(register, reference='R-1')
+        [sale] = register.get_sales(limit=10)
+        self.assertEqual((sale['id'], sale['reference'], sale['amount']), (sale_id, 'R-1', 3.0))
+        [item] = register.get_sale_items(sale_id)
+        self.assertEqual((item['name'], item['quantity']), ('Product 3', 2))
+        self.assertEqual(register.get_summary()['sale_count'], 1)
+        self.assertEqual(self.db.get_product_by_sku('P3')['quantity'], 98)
+        # The server's exception comes back with its class name
+        with self.assertRaises(RemoteError) as raised:
+            self.sell(register, reference='R-1')
+        self.assertEqual(raised.exception.kind, 'IntegrityError')
+
+    def test_registers_receive_change_events(self):
+        seller, watcher = self.register(), self.register()
+        self.assertEqual(watcher.get_product_by_sku('P3')['quantity'], 100)
+        events = []
+        watcher.subscribe(lambda event: events.append((event.kind, event.table)))
+        # Connect the watcher before the change so it is sent the event
+        watcher.get_summary()
+        self.sell(seller, qty=5)
+        wait_for(lambda: ('insert', 'sales') in events)
+        self.assertIn(('update', 'stock'), events)
+        # The watcher's own catalog was updated from the event
+        self.assertEqual(watcher.get_product_by_sku('P3')['quantity'], 95)
+
+    def test_unlisted_methods_are_refused(self):
+        register = self.register()
+        with self.assertRaises(AttributeError):
+            register.set_meta('reference_prefix', 'EVIL')
+        for method, args in (('set_meta', ['reference_prefix', 'EVIL']),
+                             ('_transaction', []), ('close', [])):
+            with self.assertRaises(RemoteError) as raised:
+                register._call(method, *args)
+            self.assertEqual(raised.exception.kind, 'AttributeError')
+        self.assertIsNone(self.db.get_meta('reference_prefix'))
+        self.assertEqual(register.get_summary()['sale_count'], 0)
+
+    def test_reconnects_and_reloads_after_link_drops(self):
+        register = self.register()
+        events = []
+        register.subscribe(lambda event: events.append((event.kind, event.table)))
+        self.assertEqual(register.get_summary()['sale_count'], 0)
+
+        # The server drops every register, then a sale is made meanwhile
+        self.loop.call_soon_threadsafe(lambda: [writer.close() for writer in list(self.server.clients)])
+        wait_for(lambda: register._sock is None)
+        self.db.add_sale('OFFLINE', '2025-06-01', None, 4.0, 'Cash')
+
+        # The next call reconnects and tells subscribers to re-read
+        self.assertEqual(register.get_summary()['sale_count'], 1)
+        self.assertEqual(register._connections, 2)
+        for table in ('sales', 'expenses', 'stock'):
+            self.assertIn(('reload', table), events)
+        self.sell(register)
+        self.assertEqual(register.get_summary()['sale_count'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()